@@ -0,0 +1,95 @@
+# Imports
+import argparse
+import hashlib
+import io
+import os
+import shutil
+import zipfile
+from typing import Any, Optional
+import numpy
+from output_file import write_if_changed
+
+# Constants
+cache_folder = os.path.join('..', 'test-logs', 'cache')
+cache_extension = '.npz'
+
+# The least recently used entries are removed above this size
+default_cache_limit = 2**30
+
+
+def cache_key(*parts: Any) -> str:
+    # Entries are named after everything their content depends on (log hash, versions, parameters...)
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+def cache_path(key: str, cache: str = cache_folder) -> str:
+    return os.path.join(cache, key[:2], key + cache_extension)
+
+
+def load_cached(key: str, cache: str = cache_folder) -> Optional[dict[str, numpy.ndarray]]:
+    path = cache_path(key, cache)
+    try:
+        file = numpy.load(path)
+        arrays = {name: file[name] for name in file.files}
+        file.close()
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+    
+    # The modification time is the last use of the entry
+    os.utime(path)
+    return arrays
+
+
+def store_cached(key: str, arrays: dict[str, numpy.ndarray], cache: str = cache_folder):
+    content = io.BytesIO()
+    numpy.savez(content, **arrays)
+    write_if_changed(cache_path(key, cache), content.getvalue())
+
+
+def cache_entries(cache: str = cache_folder) -> list[tuple[int, int, str]]:
+    # Last use, size and path of every entry
+    entries = []
+    if not os.path.isdir(cache):
+        return entries
+    
+    for directory, _, file_names in os.walk(cache):
+        for file_name in file_names:
+            if file_name.endswith(cache_extension):
+                path = os.path.join(directory, file_name)
+                status = os.stat(path)
+                entries.append((status.st_mtime_ns, status.st_size, path))
+    return entries
+
+
+def evict_cache(limit: int = default_cache_limit, cache: str = cache_folder) -> tuple[int, int]:
+    # Least recently used entries are removed until the cache fits, returns the number of entries removed and the size left
+    entries = sorted(cache_entries(cache))
+    size = sum(entry_size for _, entry_size, _ in entries)
+    removed = 0
+    for _, entry_size, path in entries:
+        if size <= limit:
+            break
+        os.remove(path)
+        size -= entry_size
+        removed += 1
+    return removed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show, bound or clear the analysis cache')
+    parser.add_argument('--cache', default=cache_folder, help=f'cache folder (by default {cache_folder:s})')
+    parser.add_argument('--limit', type=int, help='remove the least recently used entries above this size in bytes')
+    parser.add_argument('--clear', action='store_true', help='remove all entries')
+    arguments = parser.parse_args()
+    
+    if arguments.clear:
+        shutil.rmtree(arguments.cache, ignore_errors=True)
+    if arguments.limit is not None:
+        removed, _ = evict_cache(arguments.limit, arguments.cache)
+        print(f'{removed:d} entries removed')
+    
+    entries = cache_entries(arguments.cache)
+    print(f'{len(entries):d} entries, {sum(entry_size for _, entry_size, _ in entries):d} bytes in {arguments.cache:s}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# Imports
+import json
+import os
+from functools import lru_cache
+from typing import Any
+from config_model import default_device_size
+
+# Constants
+board_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'boards')
+
+board_fields = ['name', 'arch', 'cpu_number', 'oses']
+os_fields = ['entry', 'ipc', 'uart']
+uart_fields = ['pa', 'va', 'interrupt_number']
+
+
+def parse_number(value: Any) -> int:
+    # Numbers can be written as integers or as strings (e.g. "0x8000000" or "0b0101")
+    if isinstance(value, str):
+        return int(value, 0)
+    return int(value)
+
+
+def missing_fields(description: dict[str, Any], fields: list[str], where: str) -> list[str]:
+    return [f'{where:s}: missing "{field:s}"' for field in fields if field not in description]
+
+
+def validate_board(board: dict[str, Any], board_path: str) -> list[str]:
+    errors = missing_fields(board, board_fields, board_path)
+    if errors:
+        return errors
+    
+    if board['name'] != os.path.splitext(os.path.basename(board_path))[0]:
+        errors.append(f'{board_path:s}: the name "{board["name"]:s}" is not the file name')
+    
+    for os_name, os_information in board['oses'].items():
+        where = f'{board_path:s} ({os_name:s})'
+        errors += missing_fields(os_information, os_fields, where)
+        errors += missing_fields(os_information.get('uart', {}), uart_fields, f'{where:s} uart')
+        
+        # Interrupt controller: GIC registers (two of them) or the RISC-V PLIC
+        if 'gic' in os_information:
+            if len(os_information['gic']) != 2:
+                errors.append(f'{where:s}: the GIC needs two registers (gicd and gicc or gicr)')
+        elif 'plic' not in os_information:
+            errors.append(f'{where:s}: missing "gic" or "plic"')
+    
+    return errors
+
+
+def board_from_description(board: dict[str, Any]) -> dict[str, Any]:
+    # Numbers are parsed once, the result holds everything the generator needs
+    oses = {}
+    for os_name, os_information in board['oses'].items():
+        entry = parse_number(os_information['entry'])
+        uart = os_information['uart']
+        if 'gic' in os_information:
+            gic = {name: parse_number(address) for name, address in os_information['gic'].items()}
+        else:
+            gic = {'plic': parse_number(os_information['plic'])}
+        
+        oses[os_name] = {
+            'entry': entry,
+            'region_base': parse_number(os_information.get('region_base', entry)),
+            'ipc': parse_number(os_information['ipc']),
+            'uart': {
+                'pa': parse_number(uart['pa']),
+                'va': parse_number(uart['va']),
+                'size': parse_number(uart.get('size', default_device_size)),
+                'interrupt_number': parse_number(uart['interrupt_number'])
+            },
+            'gic': gic
+        }
+    
+    return {
+        'name': board['name'],
+        'arch': board['arch'],
+        'cpu_number': parse_number(board['cpu_number']),
+        'memory_size': parse_number(board['memory_size']) if 'memory_size' in board else None,
+        'arch_timer': board.get('arch_timer', True),
+        'oses': oses
+    }
+
+
+def board_paths(folder: str = board_folder) -> list[str]:
+    return sorted(os.path.join(folder, file_name) for file_name in os.listdir(folder) if file_name.endswith('.json'))
+
+
+def read_boards(paths: list[str]) -> dict[str, dict[str, Any]]:
+    boards = {}
+    errors = []
+    for path in paths:
+        file = open(path, 'r')
+        try:
+            board = json.load(file)
+        except ValueError as error:
+            errors.append(f'{path:s}: {error}')
+            continue
+        finally:
+            file.close()
+        
+        board_errors = validate_board(board, path)
+        if board_errors:
+            errors += board_errors
+            continue
+        boards[board['name']] = board_from_description(board)
+    
+    if errors:
+        raise ValueError('Invalid board descriptions:\n' + '\n'.join(errors))
+    return boards
+
+
+# Board files are small, they are read the first time a board is needed and never written
+@lru_cache(maxsize=None)
+def load_boards(folder: str = board_folder) -> dict[str, dict[str, Any]]:
+    return read_boards(board_paths(folder))
+
+
+def board_information(platform_name: str) -> dict[str, Any]:
+    boards = load_boards()
+    if platform_name not in boards:
+        raise ValueError(f'Unknown platform {platform_name:s}, valid platforms are {", ".join(boards.keys()):s}')
+    return boards[platform_name]
+
+
+def os_information(platform_name: str, os_name: str) -> dict[str, Any]:
+    oses = board_information(platform_name)['oses']
+    if os_name not in oses:
+        raise ValueError(f'No information for {os_name:s} on {platform_name:s}, valid OSes are {", ".join(oses.keys()):s}')
+    return oses[os_name]
@@ -0,0 +1,419 @@
+# Imports
+import argparse
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+from generate_config import load_spec, config_folder
+from parse_config import image_regex, comment_regex
+from output_file import file_hash, open_output, write_if_changed
+from board_database import board_information
+from analysis_cache import cache_key
+
+# Constants
+root_folder = '..'
+toolchain_folder = os.path.join(root_folder, 'toolchains')
+build_cache_folder = os.path.join(root_folder, 'images', 'cache')
+work_folder = os.path.join('wrkdir', 'builds')
+matrix_folder = os.path.join('wrkdir', 'matrix')
+matrix_index_name = 'index.json'
+default_jobs = os.cpu_count() or 1
+
+# Same toolchains as build-images.sh and launch-bao.sh
+toolchain_prefixes = {
+    'aarch64': os.path.join('arm-gnu-toolchain-13.2.Rel1-x86_64-aarch64-none-elf', 'bin', 'aarch64-none-elf-'),
+    'aarch32': os.path.join('arm-gnu-toolchain-13.2.Rel1-x86_64-arm-none-eabi', 'bin', 'arm-none-eabi-'),
+    'riscv64': os.path.join('riscv64-unknown-elf-toolchain-10.2.0-2020.12.8-x86_64-linux-ubuntu14', 'bin', 'riscv64-unknown-elf-')
+}
+
+# Sources of the guests and of Bao, built in copies so that builds never share a build directory
+source_folders = {
+    'freertos': os.path.join(root_folder, 'freertos-bao-fpmc'),
+    'baremetal': os.path.join(root_folder, 'baremetal-bao-fpmc'),
+    'bao': os.path.join(root_folder, 'bao-hypervisor')
+}
+ignored_names = {'.git', 'build', 'bin'}
+
+# Guests are found from the images of the configuration (images/build/[guest]_hyp.bin)
+guest_images = {'freertos_hyp.bin': 'freertos', 'baremetal_hyp.bin': 'baremetal'}
+guest_binaries = {'freertos': 'freertos.bin', 'baremetal': 'baremetal.bin'}
+guest_make_arguments = {'freertos': ['STD_ADDR_SPACE=y'], 'baremetal': []}
+bao_binary = 'bao.bin'
+
+# Axes of a build and their default values (all configurations having a file for the platform by default)
+default_axes = {
+    'platform': None,
+    'config': None,
+    'main': [''],
+    'default_ipi': [False],
+    'memory_request_wait': [False]
+}
+
+# Increased when artifacts are built differently, all artifacts are built again
+builder_version = 1
+
+
+def as_list(value: Any) -> list[Any]:
+    return value if isinstance(value, list) else [value]
+
+
+def ignored_names_of(folder: str, directory: str, names: list[str]) -> list[str]:
+    # Build outputs are only ignored at the top of the sources, git folders everywhere
+    top = os.path.normpath(directory) == os.path.normpath(folder)
+    return [name for name in names if name == '.git' or (top and name in ignored_names)]
+
+
+def platform_configs(platform: str, input_folder: str = config_folder) -> list[str]:
+    return sorted(config_name for config_name in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, config_name, f'{platform:s}.c')))
+
+
+def matrix_builds(spec: dict[str, Any], input_folder: str = config_folder) -> list[dict[str, Any]]:
+    # Every combination of the axes of every entry, each build appears once
+    builds = []
+    seen = set()
+    for entry in spec['builds']:
+        unknown_axes = [axis for axis in entry if axis not in default_axes]
+        if unknown_axes:
+            raise ValueError(f'Unknown build axes {", ".join(unknown_axes):s}, valid axes are {", ".join(default_axes):s}')
+        if 'platform' not in entry:
+            raise ValueError('A build has no platform')
+        
+        for platform in as_list(entry['platform']):
+            board_information(platform)
+            config_names = as_list(entry['config']) if 'config' in entry else platform_configs(platform, input_folder)
+            axes = [as_list(entry.get(axis, default_values)) for axis, default_values in list(default_axes.items())[2:]]
+            for config_name, selected_main, default_ipi, memory_request_wait in itertools.product(config_names, *axes):
+                if not os.path.isfile(os.path.join(input_folder, config_name, f'{platform:s}.c')):
+                    raise ValueError(f'Configuration {config_name:s} has no file for {platform:s}')
+                build = {'platform': platform, 'config': config_name, 'main': selected_main, 'default_ipi': bool(default_ipi), 'memory_request_wait': bool(memory_request_wait)}
+                if tuple(build.values()) not in seen:
+                    seen.add(tuple(build.values()))
+                    builds.append(build)
+    return builds
+
+
+def read_text(path: str) -> str:
+    file = open(path, 'r')
+    text = file.read()
+    file.close()
+    return text
+
+
+def config_images(text: str) -> list[tuple[str, str]]:
+    return image_regex.findall(comment_regex.sub(' ', text))
+
+
+def inputs_key(inputs: dict[str, Any]) -> str:
+    return cache_key(*sorted(inputs.items()))
+
+
+def build_name(build: dict[str, Any]) -> str:
+    # Name of the output folder of a build: [config name]-[selected main] and the build options
+    name = f'{build["config"]:s}-{build["main"]:s}'
+    for option in ['default_ipi', 'memory_request_wait']:
+        if build[option]:
+            name += '-' + option
+    return name
+
+
+def tree_hash(folder: str, selected_main: str = '') -> str:
+    # Hash of all sources, main applications (folders with a source.mk) other than the selected one are left out
+    entries = []
+    for directory, directory_names, file_names in os.walk(folder):
+        ignored = ignored_names_of(folder, directory, directory_names)
+        directory_names[:] = sorted(name for name in directory_names if name not in ignored)
+        if directory != folder and 'source.mk' in file_names and selected_main and os.path.basename(directory) != selected_main:
+            directory_names[:] = []
+            continue
+        
+        for file_name in sorted(file_names):
+            path = os.path.join(directory, file_name)
+            relative_path = os.path.relpath(path, folder)
+            if os.path.islink(path) and not os.path.exists(path):
+                entries.append((relative_path, os.readlink(path)))
+            else:
+                entries.append((relative_path, file_hash(path).hex()))
+    return cache_key(entries)
+
+
+def copy_tree(source: str, destination: str):
+    # Copies and not links, a build rewriting a file in place never touches the sources
+    shutil.copytree(source, destination, symlinks=True, ignore=lambda directory, names: ignored_names_of(source, directory, names))
+
+
+def place_file(source: str, destination: str):
+    # Replaces the destination at once, a build being read is never half written
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temporary_path = destination + '.tmp'
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    try:
+        os.link(source, temporary_path)
+    except OSError:
+        shutil.copyfile(source, temporary_path)
+    os.replace(temporary_path, destination)
+
+
+# Builds of a matrix, artifacts are named after the hash of their inputs and shared by all builds with the same inputs
+class BuildMatrix:
+    def __init__(self, cache: str = build_cache_folder, work: str = work_folder, output: str = matrix_folder, sources: Optional[dict[str, str]] = None,
+                 toolchains: str = toolchain_folder, input_folder: str = config_folder, make_jobs: int = 1):
+        self.cache = cache
+        self.work = work
+        self.output = output
+        self.sources = dict(source_folders if sources is None else sources)
+        self.toolchains = toolchains
+        self.input_folder = input_folder
+        self.make_jobs = make_jobs
+        
+        # Hashes are computed once per run
+        self.tree_hashes = {}
+        self.toolchain_hashes = {}
+    
+    def toolchain(self, platform: str) -> tuple[str, str]:
+        # Prefix of the toolchain and hash of its compiler
+        arch = board_information(platform)['arch']
+        prefix = os.path.abspath(os.path.join(self.toolchains, toolchain_prefixes[arch]))
+        if prefix not in self.toolchain_hashes:
+            compiler_path = prefix + 'gcc'
+            if not os.path.isfile(compiler_path):
+                raise ValueError(f'No compiler {compiler_path:s} (toolchains are untarred in {self.toolchains:s})')
+            self.toolchain_hashes[prefix] = file_hash(compiler_path).hex()
+        return prefix, self.toolchain_hashes[prefix]
+    
+    def source_hash(self, name: str, selected_main: str = '') -> str:
+        if (name, selected_main) not in self.tree_hashes:
+            if not os.path.isdir(self.sources[name]):
+                raise ValueError(f'{self.sources[name]:s} does not exist (see init.sh)')
+            self.tree_hashes[name, selected_main] = tree_hash(self.sources[name], selected_main)
+        return self.tree_hashes[name, selected_main]
+    
+    def artifact_path(self, key: str, artifact_name: str) -> str:
+        return os.path.join(self.cache, key[:2], key, artifact_name)
+    
+    def config_path(self, build: dict[str, Any]) -> str:
+        return os.path.join(self.input_folder, build['config'], f'{build["platform"]:s}.c')
+    
+    def guest_inputs(self, guest: str, build: dict[str, Any]) -> dict[str, Any]:
+        # appdata.h is part of the guest sources
+        prefix, toolchain_hash = self.toolchain(build['platform'])
+        return {
+            'artifact': guest,
+            'version': builder_version,
+            'platform': build['platform'],
+            'main': build['main'],
+            'default_ipi': build['default_ipi'],
+            'memory_request_wait': build['memory_request_wait'],
+            'toolchain': toolchain_hash,
+            'sources': self.source_hash(guest, build['main'])
+        }
+    
+    def bao_inputs(self, build: dict[str, Any], guest_keys: dict[str, str]) -> dict[str, Any]:
+        # Images that are not guests built here (e.g. images/test) are part of the inputs too
+        text = read_text(self.config_path(build))
+        images = {}
+        for image_name, image_path in config_images(text):
+            guest = guest_images.get(os.path.basename(image_path))
+            if guest is not None:
+                images[image_name] = guest_keys[guest]
+            else:
+                images[image_name] = file_hash(os.path.join(self.sources['bao'], image_path)).hex()
+        
+        _, toolchain_hash = self.toolchain(build['platform'])
+        return {
+            'artifact': 'bao',
+            'version': builder_version,
+            'platform': build['platform'],
+            'config': build['config'],
+            'config_file': cache_key(text),
+            'images': images,
+            'toolchain': toolchain_hash,
+            'sources': self.source_hash('bao')
+        }
+    
+    def plan(self, builds: list[dict[str, Any]]) -> tuple[dict[str, tuple[str, dict[str, Any]]], dict[str, tuple[dict[str, Any], dict[str, Any]]], list[str]]:
+        # Guest and Bao artifacts to have (by key), and the Bao artifact of each build
+        guests = {}
+        baos = {}
+        build_keys = []
+        for build in builds:
+            image_names = [os.path.basename(image_path) for _, image_path in config_images(read_text(self.config_path(build)))]
+            guest_keys = {}
+            for guest in sorted({guest_images[image_name] for image_name in image_names if image_name in guest_images}):
+                inputs = self.guest_inputs(guest, build)
+                guest_keys[guest] = inputs_key(inputs)
+                guests[guest_keys[guest]] = (guest, inputs)
+            
+            inputs = self.bao_inputs(build, guest_keys)
+            key = inputs_key(inputs)
+            baos[key] = (build, inputs)
+            build_keys.append(key)
+        return guests, baos, build_keys
+    
+    def build_folder(self, key: str) -> str:
+        # Each artifact is built in its own folder, which stays with the build log if the build fails
+        build_folder = os.path.join(self.work, key)
+        shutil.rmtree(build_folder, ignore_errors=True)
+        os.makedirs(build_folder)
+        return build_folder
+    
+    def make(self, build_folder: str, source: str, arguments: list[str], platform: str, description: str) -> str:
+        # Sources are copied in the build folder, builds never share their build directories
+        source_copy = os.path.join(build_folder, os.path.basename(os.path.normpath(source)))
+        copy_tree(source, source_copy)
+        
+        prefix, _ = self.toolchain(platform)
+        environment = dict(os.environ, CROSS_COMPILE=prefix, PLATFORM=platform, ARCH=board_information(platform)['arch'])
+        log_path = os.path.join(build_folder, 'build.log')
+        log_file = open(log_path, 'w')
+        result = subprocess.run(['make', '-C', source_copy, f'-j{self.make_jobs:d}'] + arguments, env=environment, stdout=log_file, stderr=subprocess.STDOUT)
+        log_file.close()
+        if result.returncode != 0:
+            raise ValueError(f'Build of {description:s} failed, see {log_path:s}')
+        return source_copy
+    
+    def store(self, key: str, built_path: str, artifact_name: str, inputs: dict[str, Any]):
+        if not os.path.isfile(built_path):
+            raise ValueError(f'The build did not produce {built_path:s}')
+        
+        # The inputs are written before the artifact, an artifact in the cache is always complete
+        write_if_changed(os.path.join(self.cache, key[:2], key, 'inputs.json'), json.dumps(inputs, indent=4, sort_keys=True) + '\n')
+        file = open_output(self.artifact_path(key, artifact_name))
+        source_file = open(built_path, 'rb')
+        shutil.copyfileobj(source_file, file)
+        source_file.close()
+        file.close()
+    
+    def build_guest(self, key: str, guest: str, inputs: dict[str, Any]) -> str:
+        arguments = guest_make_arguments[guest] + ([f'SELECTED_MAIN={inputs["main"]:s}'] if inputs['main'] else [])
+        arguments += [f'{option.upper():s}=y' for option in ['default_ipi', 'memory_request_wait'] if inputs[option]]
+        build_folder = self.build_folder(key)
+        source_copy = self.make(build_folder, self.sources[guest], arguments, inputs['platform'], f'{guest:s} for {inputs["platform"]:s}')
+        self.store(key, os.path.join(source_copy, 'build', inputs['platform'], guest_binaries[guest]), guest_binaries[guest], inputs)
+        shutil.rmtree(build_folder)
+        return key
+    
+    def build_bao(self, key: str, build: dict[str, Any], inputs: dict[str, Any]) -> str:
+        # The configuration uses the guest images of the cache instead of images/build
+        text = read_text(self.config_path(build))
+        
+        def image_declaration(match: Any) -> str:
+            image_name, image_path = match.groups()
+            guest = guest_images.get(os.path.basename(image_path))
+            if guest is not None:
+                path = self.artifact_path(inputs['images'][image_name], guest_binaries[guest])
+            else:
+                path = os.path.join(self.sources['bao'], image_path)
+            return f'VM_IMAGE({image_name:s}, XSTR({os.path.abspath(path):s}))'
+        
+        build_folder = self.build_folder(key)
+        config_repository = os.path.abspath(os.path.join(build_folder, 'config'))
+        images_folder = os.path.abspath(os.path.join(build_folder, 'imgs'))
+        write_if_changed(os.path.join(config_repository, f'{build["config"]:s}.c'), image_regex.sub(image_declaration, text))
+        
+        arguments = [f'PLATFORM={build["platform"]:s}', f'CONFIG_REPO={config_repository:s}', f'CONFIG={build["config"]:s}', f'CPPFLAGS=-DBAO_DEMOS_WRKDIR_IMGS={images_folder:s}']
+        source_copy = self.make(build_folder, self.sources['bao'], arguments, build['platform'], f'{build["config"]:s} for {build["platform"]:s}')
+        self.store(key, os.path.join(source_copy, 'bin', build['platform'], build['config'], bao_binary), bao_binary, inputs)
+        shutil.rmtree(build_folder)
+        return key
+    
+    def run(self, builds: list[dict[str, Any]], jobs: int = default_jobs, dry_run: bool = False) -> tuple[list[dict[str, Any]], list[str]]:
+        # Returns the index entry of every build and the errors, artifacts already in the cache are not built
+        guests, baos, build_keys = self.plan(builds)
+        missing_guests = {key: value for key, value in guests.items() if not os.path.isfile(self.artifact_path(key, guest_binaries[value[0]]))}
+        missing_baos = {key: value for key, value in baos.items() if not os.path.isfile(self.artifact_path(key, bao_binary))}
+        
+        errors = []
+        if not dry_run:
+            # Guests first, then Bao (which includes the guest images), each step on all cores
+            executor = ThreadPoolExecutor(max_workers=max(jobs, 1))
+            for key, (guest, inputs) in missing_guests.items():
+                print(f'Building {guest:s} for {inputs["platform"]:s} ({inputs["main"] or "-":s}, {key[:12]:s})')
+            futures = {key: executor.submit(self.build_guest, key, guest, inputs) for key, (guest, inputs) in missing_guests.items()}
+            failed_guests = set()
+            for key, future in futures.items():
+                try:
+                    future.result()
+                except (OSError, ValueError) as error:
+                    errors.append(str(error))
+                    failed_guests.add(key)
+            
+            buildable = {key: value for key, value in missing_baos.items() if not failed_guests & set(value[1]['images'].values())}
+            for key, (build, _) in buildable.items():
+                print(f'Building Bao with {build["config"]:s} for {build["platform"]:s} ({key[:12]:s})')
+            futures = {key: executor.submit(self.build_bao, key, build, inputs) for key, (build, inputs) in buildable.items()}
+            for key, future in futures.items():
+                try:
+                    future.result()
+                except (OSError, ValueError) as error:
+                    errors.append(str(error))
+            executor.shutdown()
+        
+        # Every build gets its Bao image in its own folder of the output
+        entries = []
+        for build, key in zip(builds, build_keys):
+            artifact_path = self.artifact_path(key, bao_binary)
+            entry = {**build, 'name': build_name(build), 'key': key, 'state': 'cached', 'path': None}
+            if key in missing_baos:
+                entry['state'] = 'to build' if dry_run else ('built' if os.path.isfile(artifact_path) else 'failed')
+            output_path = os.path.join(build['platform'], build_name(build), bao_binary)
+            if os.path.isfile(artifact_path):
+                entry['path'] = output_path
+                place_file(artifact_path, os.path.join(self.output, output_path))
+            elif not dry_run and os.path.isfile(os.path.join(self.output, output_path)):
+                # The image of a failed build is not left from an older build
+                os.remove(os.path.join(self.output, output_path))
+            entries.append(entry)
+        if not dry_run:
+            write_if_changed(os.path.join(self.output, matrix_index_name), json.dumps({'builds': entries}, indent=4) + '\n')
+        return entries, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build Bao images for many platforms, configurations and main applications, reusing everything already built')
+    parser.add_argument('spec', nargs='?', help='build matrix specification (JSON, TOML or YAML), instead of the options below')
+    parser.add_argument('--platform', nargs='+', help='platforms to build for')
+    parser.add_argument('--config', nargs='+', help='configurations to build (by default all configurations of the platforms)')
+    parser.add_argument('--main', nargs='+', help='selected main applications')
+    parser.add_argument('--default-ipi', action='store_true', help='build the guests with DEFAULT_IPI=y')
+    parser.add_argument('--memory-request-wait', action='store_true', help='build the guests with MEMORY_REQUEST_WAIT=y')
+    parser.add_argument('--jobs', type=int, default=default_jobs, help=f'number of builds at the same time (by default {default_jobs:d})')
+    parser.add_argument('--make-jobs', type=int, default=1, help='number of jobs of each make (by default 1)')
+    parser.add_argument('--cache', default=build_cache_folder, help=f'folder of the built artifacts (by default {build_cache_folder:s})')
+    parser.add_argument('--output', default=matrix_folder, help=f'folder where the Bao image of each build is placed (by default {matrix_folder:s})')
+    parser.add_argument('--dry-run', action='store_true', help='only show what would be built')
+    arguments = parser.parse_args()
+    
+    start = time.perf_counter()
+    try:
+        if arguments.spec is not None:
+            spec = load_spec(arguments.spec)
+        elif arguments.platform is not None:
+            entry = {'platform': arguments.platform, 'main': arguments.main or [''], 'default_ipi': arguments.default_ipi, 'memory_request_wait': arguments.memory_request_wait}
+            spec = {'builds': [{**entry, 'config': arguments.config} if arguments.config else entry]}
+        else:
+            print('Give a build matrix specification or at least one platform')
+            exit(1)
+        
+        builds = matrix_builds(spec)
+        entries, errors = BuildMatrix(arguments.cache, output=arguments.output, make_jobs=arguments.make_jobs).run(builds, arguments.jobs, arguments.dry_run)
+    except (OSError, ValueError) as error:
+        print(error)
+        exit(1)
+    
+    elapsed = time.perf_counter() - start
+    for entry in entries:
+        print(f'{entry["platform"]:s}/{entry["name"]:s}: {entry["state"]:s}' + (f' ({entry["path"]:s})' if entry['path'] is not None else ''))
+    for error in errors:
+        print(error)
+    cached_number = sum(entry['state'] == 'cached' for entry in entries)
+    print(f'{len(entries):d} builds ({cached_number:d} cached) in {elapsed:.3f}s')
+    if errors:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+# Imports
+import argparse
+import asyncio
+import codecs
+import gzip
+import os
+import re
+import shutil
+import signal
+import termios
+import time
+import tty
+from typing import Any, Callable, Optional
+from parse_logs import LogParser, log_folder, store_folder, store_logs, describe_row
+from run_manifest import run_manifest, write_run_manifest, manifest_path
+
+# Constants
+default_baudrate = 115200
+read_chunk_size = 2**16
+
+# Logs are rotated (outside of arrays) above this size, the next parts keep the test number of the run and are stored with it as one log
+default_rotate_size = 2**26
+
+# Capture stops after this many seconds without anything received (0 to wait forever)
+default_idle_timeout = 600
+
+# Lines printed at the end of a benchmark
+default_end_markers = [r'^#\s*(end of (the )?benchmark|benchmark (done|ended|finished))']
+
+# Host time of every line, one per line of the log
+timestamp_extension = '.timestamps'
+
+# Stop reasons
+end_marker_str = 'end marker'
+idle_str = 'idle'
+disconnected_str = 'disconnected'
+interrupted_str = 'interrupted'
+duration_str = 'duration'
+
+baudrates = {rate: getattr(termios, f'B{rate:d}') for rate in [9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600, 1000000, 1500000] if hasattr(termios, f'B{rate:d}')}
+
+
+def next_log_path(folder: str, config_name: str, selected_main: str) -> str:
+    # Same format as launch-minicom.sh: [config name]-[selected main]-[date]-[test number].log, compressed logs count
+    log_date = time.strftime('%y-%m-%d')
+    version_number = 1
+    log_path = os.path.join(folder, f'{config_name:s}-{selected_main:s}-{log_date:s}-{version_number:d}.log')
+    while os.path.exists(log_path) or os.path.exists(log_path + '.gz'):
+        version_number += 1
+        log_path = os.path.join(folder, f'{config_name:s}-{selected_main:s}-{log_date:s}-{version_number:d}.log')
+    return log_path
+
+
+def part_log_path(log_path: str, part: int) -> str:
+    # [config name]-[selected main]-[date]-[test number].part[number].log, the first part has no suffix
+    return log_path if part == 1 else f'{log_path.removesuffix(".log"):s}.part{part:d}.log'
+
+
+def open_serial(device: str, baudrate: int = default_baudrate) -> int:
+    if baudrate not in baudrates:
+        raise ValueError(f'Unsupported baudrate {baudrate:d}, valid baudrates are {", ".join(str(rate) for rate in baudrates):s}')
+    
+    # Raw 8N1 without flow control, like minicom with the default settings of the boards
+    descriptor = os.open(device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    tty.setraw(descriptor)
+    attributes = termios.tcgetattr(descriptor)
+    attributes[2] = (attributes[2] & ~(termios.PARENB | termios.CSTOPB | termios.CSIZE)) | termios.CS8 | termios.CLOCAL | termios.CREAD
+    attributes[4] = baudrates[baudrate]
+    attributes[5] = baudrates[baudrate]
+    termios.tcsetattr(descriptor, termios.TCSANOW, attributes)
+    return descriptor
+
+
+def compress_file(path: str) -> str:
+    # Compressed next to the file, which is removed once the compressed file is complete
+    compressed_path = path + '.gz'
+    file = open(path, 'rb')
+    compressed_file = gzip.open(compressed_path + '.tmp', 'wb')
+    shutil.copyfileobj(file, compressed_file)
+    compressed_file.close()
+    file.close()
+    os.replace(compressed_path + '.tmp', compressed_path)
+    os.remove(path)
+    return compressed_path
+
+
+# Capture of the logs of one board, lines are written, timestamped and parsed as they come
+class SerialCapture:
+    def __init__(self, device: str, config_name: str, selected_main: str = '', output_folder: str = log_folder, baudrate: int = default_baudrate, rotate_size: int = default_rotate_size,
+                 end_markers: Optional[list[str]] = None, idle_timeout: float = default_idle_timeout, compress: bool = True, on_event: Optional[Callable[['SerialCapture', tuple], Any]] = None,
+                 manifest: Optional[dict[str, Any]] = None):
+        self.device = device
+        self.config_name = config_name
+        self.selected_main = selected_main
+        self.output_folder = output_folder
+        self.baudrate = baudrate
+        self.rotate_size = rotate_size
+        self.end_markers = [re.compile(marker, re.IGNORECASE) for marker in (default_end_markers if end_markers is None else end_markers)]
+        self.idle_timeout = idle_timeout
+        self.compress = compress
+        self.on_event = on_event
+        self.manifest = manifest
+        
+        self.parser = LogParser()
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.partial_line = b''
+        self.log_paths = []
+        self.log_file = None
+        self.timestamp_file = None
+        self.log_size = 0
+        self.line_number = 0
+        self.stop_reason = None
+        self.compressions = []
+        
+        # Values received for the arrays being printed
+        self.array_lengths = {}
+    
+    def open_log(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        log_path = part_log_path(self.log_paths[0], len(self.log_paths) + 1) if self.log_paths else next_log_path(self.output_folder, self.config_name, self.selected_main)
+        self.log_file = open(log_path, 'wb')
+        self.timestamp_file = open(log_path + timestamp_extension, 'w')
+        self.log_size = 0
+        self.log_paths.append(log_path)
+        
+        # Every part of a rotated log has the manifest of the run
+        if self.manifest is not None:
+            write_run_manifest(log_path, self.manifest)
+    
+    def close_log(self):
+        self.log_file.close()
+        self.timestamp_file.close()
+        self.log_file = None
+        
+        # A log started by a rotation right before the end of the capture is empty
+        if self.log_size == 0 and len(self.log_paths) > 1:
+            log_path = self.log_paths.pop()
+            os.remove(log_path)
+            os.remove(log_path + timestamp_extension)
+            if self.manifest is not None:
+                os.remove(manifest_path(log_path))
+            return
+        
+        # Compressed in a thread while the capture goes on
+        if self.compress:
+            log_path = self.log_paths[-1]
+            self.compressions.append(asyncio.ensure_future(asyncio.to_thread(compress_file, log_path)))
+            self.compressions.append(asyncio.ensure_future(asyncio.to_thread(compress_file, log_path + timestamp_extension)))
+    
+    def dispatch(self, events: list[tuple]):
+        for event in events:
+            if event[0] == 'values':
+                self.array_lengths[event[1]] = self.array_lengths.get(event[1], 0) + len(event[2])
+            if self.on_event is not None:
+                self.on_event(self, event)
+            if event[0] == 'end':
+                self.array_lengths.pop(event[1], None)
+    
+    def parse(self, piece: bytes):
+        self.dispatch(self.parser.feed(self.decoder.decode(piece)))
+    
+    def receive(self, data: bytes, host_time: float):
+        # Flushed right away for the tools following the log (live_statistics.py)
+        self.log_file.write(data)
+        self.log_file.flush()
+        self.log_size += len(data)
+        
+        lines = (self.partial_line + data).split(b'\n')
+        self.partial_line = lines.pop()
+        for line in lines:
+            self.timestamp_file.write(f'{host_time:.6f}\n')
+            self.line_number += 1
+            self.parse(line + b'\n')
+            
+            text = line.decode('utf-8', errors='replace').strip()
+            if any(marker.search(text) for marker in self.end_markers):
+                self.stop_reason = end_marker_str
+        
+        # A line without end (a long array) is parsed by pieces
+        if len(self.partial_line) >= read_chunk_size:
+            self.parse(self.partial_line)
+            self.partial_line = b''
+        
+        # Arrays are never split between two logs
+        if self.stop_reason is None and self.log_size >= self.rotate_size and self.parser.array_name is None and not self.partial_line:
+            self.log_file.flush()
+            self.close_log()
+            self.open_log()
+    
+    async def read(self, reader: asyncio.StreamReader):
+        while self.stop_reason is None:
+            try:
+                data = await asyncio.wait_for(reader.read(read_chunk_size), timeout=self.idle_timeout or None)
+            except asyncio.TimeoutError:
+                self.stop_reason = idle_str
+                break
+            except OSError:
+                # The other side of the line is gone (board unplugged, closed pty)
+                data = b''
+            if not data:
+                self.stop_reason = disconnected_str
+                break
+            self.receive(data, time.time())
+    
+    async def capture(self, reader: asyncio.StreamReader, duration: Optional[float] = None) -> list[str]:
+        # Returns the logs written (compressed if asked), the reader can be a serial line or the output of a process
+        self.open_log()
+        try:
+            await asyncio.wait_for(self.read(reader), timeout=duration)
+        except asyncio.TimeoutError:
+            self.stop_reason = duration_str
+        except asyncio.CancelledError:
+            self.stop_reason = interrupted_str
+        
+        # What remains of the last line is kept
+        if self.partial_line:
+            self.timestamp_file.write(f'{time.time():.6f}\n')
+            self.parse(self.partial_line)
+        self.dispatch(self.parser.finish())
+        self.close_log()
+        
+        compressed_paths = await asyncio.gather(*self.compressions)
+        return [path for path in compressed_paths if not path.endswith(timestamp_extension + '.gz')] if self.compress else self.log_paths
+    
+    async def run(self, duration: Optional[float] = None) -> list[str]:
+        loop = asyncio.get_running_loop()
+        descriptor = open_serial(self.device, self.baudrate)
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(descriptor, 'rb', buffering=0))
+        try:
+            return await self.capture(reader, duration)
+        finally:
+            transport.close()
+
+
+def board_from_argument(argument: str) -> tuple[str, str, str]:
+    # DEVICE:CONFIG[:MAIN]
+    parts = argument.split(':')
+    if len(parts) not in (2, 3) or not parts[0] or not parts[1]:
+        raise ValueError(f'{argument:s} is not DEVICE:CONFIG[:MAIN]')
+    return parts[0], parts[1], parts[2] if len(parts) == 3 else ''
+
+
+def print_event(capture: SerialCapture, event: tuple):
+    # Arrays and values are shown as soon as they are complete
+    kind = event[0]
+    if kind == 'end':
+        print(f'{capture.device:s}: {event[1]:s} ({capture.array_lengths.get(event[1], 0):d} values)')
+    elif kind == 'scalar':
+        print(f'{capture.device:s}: {event[1]:s} = {event[2]:d}')
+
+
+async def capture_boards(captures: list[SerialCapture], duration: Optional[float] = None) -> list[list[str]]:
+    # All boards are captured at the same time, Ctrl+C stops all captures and keeps their logs
+    loop = asyncio.get_running_loop()
+    tasks = [asyncio.ensure_future(capture.run(duration)) for capture in captures]
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, lambda: [task.cancel() for task in tasks if not task.done()])
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signal_number)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Capture the logs of boards through their serial lines')
+    parser.add_argument('boards', nargs='+', metavar='DEVICE:CONFIG[:MAIN]', help='serial device of a board, its configuration name and selected main (e.g. /dev/ttyUSB0:bench_solo_legacy:execution-fpsched)')
+    parser.add_argument('--output', default=log_folder, help=f'folder where logs are written (by default {log_folder:s})')
+    parser.add_argument('--platform', help='platform of the boards, recorded with the configuration file in the manifest of each log')
+    parser.add_argument('--baudrate', type=int, default=default_baudrate, help=f'baudrate of the serial lines (by default {default_baudrate:d})')
+    parser.add_argument('--rotate-size', type=int, default=default_rotate_size, help=f'size in bytes above which a new log is started (by default {default_rotate_size:d})')
+    parser.add_argument('--end-marker', action='append', help='regular expression of the line ending a benchmark (can be repeated, replaces the default ones)')
+    parser.add_argument('--idle-timeout', type=float, default=default_idle_timeout, help=f'stop after this many seconds without data, 0 to wait forever (by default {default_idle_timeout:d})')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds')
+    parser.add_argument('--no-compress', action='store_true', help='do not compress the logs')
+    parser.add_argument('--no-store', action='store_true', help=f'do not store the logs in {store_folder:s} once captured')
+    arguments = parser.parse_args()
+    
+    try:
+        boards = [board_from_argument(argument) for argument in arguments.boards]
+    except ValueError as error:
+        print(error)
+        exit(1)
+    
+    captures = [SerialCapture(device, config_name, selected_main, arguments.output, arguments.baudrate, arguments.rotate_size, arguments.end_marker, arguments.idle_timeout, not arguments.no_compress, print_event,
+                              run_manifest(config_name, arguments.platform or None)) for device, config_name, selected_main in boards]
+    try:
+        log_paths = asyncio.run(capture_boards(captures, arguments.duration))
+    except (OSError, ValueError) as error:
+        print(error)
+        exit(1)
+    
+    for capture, paths in zip(captures, log_paths):
+        print(f'{capture.device:s} ({capture.stop_reason:s}, {capture.line_number:d} lines): {", ".join(paths):s}')
+    
+    if not arguments.no_store:
+        for row, _ in store_logs([path for paths in log_paths for path in paths]):
+            print(describe_row(row))
+
+if __name__ == '__main__':
+    main()
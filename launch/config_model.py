@@ -0,0 +1,60 @@
+# Imports
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Constants
+ipc_interrupt_number = 52
+timer_interrupt_number = 27
+default_device_size = 0x10000
+
+# Colors available on a platform
+max_colors = 16
+
+
+# Structures of a Bao configuration, values are the ones written in the configuration file (a base of None is placed by layout_config)
+@dataclass
+class Region:
+    base: Optional[int]
+    size: int
+
+
+@dataclass
+class Ipc:
+    base: Optional[int]
+    size: int
+    shmem_id: int
+    interrupt: int = ipc_interrupt_number
+
+
+@dataclass
+class Device:
+    pa: int
+    va: int
+    size: int = default_device_size
+    interrupts: list[int] = field(default_factory=list)
+
+
+@dataclass
+class VmConfig:
+    image_name: str
+    image_path: str
+    configuration: str
+    cpu_number: int
+    entry: int
+    base_addr: int
+    gic: dict[str, int]
+    colors: Optional[int] = None
+    cpu_affinity: Optional[int] = None
+    regions: list[Region] = field(default_factory=list)
+    ipcs: list[Ipc] = field(default_factory=list)
+    devices: list[Device] = field(default_factory=list)
+    arch_timer: bool = True
+
+
+@dataclass
+class Configuration:
+    name: str
+    platform: str
+    cpu_number: int
+    shmem_sizes: list[int] = field(default_factory=list)
+    vms: list[VmConfig] = field(default_factory=list)
@@ -1,159 +1,17 @@
 # Imports
+import argparse
+import dataclasses
+import json
 import os
-from typing import Any
-
-# Dictionaries with constants
-image_information = {
-    'zcu': {
-        'baremetal': {
-            'entry': 0x20000000,
-            'ipc': 0x70000000,
-            'uart': {
-                'pa': 0xff000000,
-                'va': 0xff000000,
-                'interrupt_number': 53
-            },
-            'gic': {
-                'gicd': 0xf9010000,
-                'gicc': 0xf9020000
-            }
-        },
-        'freertos': {
-            'entry': 0x0,
-            'ipc': 0x70000000,
-            'uart': {
-                'pa': 0xff000000,
-                'va': 0xff000000,
-                'interrupt_number': 53
-            },
-            'gic': {
-                'gicd': 0xf9010000,
-                'gicc': 0xf9020000
-            }
-        },
-        'linux': {
-            'entry': 0x00200000,
-            'ipc': 0xf0000000,
-            'uart': {
-                'pa': 0xff000000,
-                'va': 0xff000000,
-                'interrupt_number': 53
-            },
-            'gic': {
-                'gicd': 0xf9010000,
-                'gicc': 0xf9020000
-            }
-        }
-    },
-    'rpi4': {
-        'baremetal': {
-            'entry': 0x200000,
-            'ipc': 0x70000000,
-            'uart': {
-                'pa': 0xfe215000,
-                'va': 0xfe215000,
-                'interrupt_number': 125
-            },
-            'gic': {
-                'gicd': 0xff841000,
-                'gicc': 0xff842000
-            }
-        },
-        'freertos': {
-            'entry': 0x0,
-            'ipc': 0x70000000,
-            'uart': {
-                'pa': 0xfe215000,
-                'va': 0xff000000,
-                'interrupt_number': 125
-            },
-            'gic': {
-                'gicd': 0xf9010000,
-                'gicc': 0xf9020000
-            }
-        },
-        'linux': {
-            'entry': 0x20000000,
-            'ipc': 0xf0000000,
-            'uart': {
-                'pa': 0xfe215000,
-                'va': 0xfe215000,
-                'interrupt_number': 125
-            },
-            'gic': {
-                'gicd': 0xff841000,
-                'gicc': 0xff842000,
-            }
-        },
-        'zephyr': {
-            'entry': 0x80000000,
-            'ipc': 0x70000000,
-            'uart': {
-                'pa': 0xfe215000,
-                'va': 0xfe215000,
-                'interrupt_number': 125
-            },
-            'gic': {
-                'gicd': 0xff841000,
-                'gicc': 0xff842000
-            }
-        }
-    },
-    'qemu-aarch64-virt': {
-        'baremetal': {
-            'entry': 0x50000000,
-            'ipc': 0x70000000,
-            'uart': {
-                'pa': 0x9000000,
-                'va': 0x9000000,
-                'interrupt_number': 33
-            },
-            'gic': {
-                'gicd': 0x08000000,
-                'gicr': 0x080A0000
-            }
-        },
-        'freertos': {
-            'entry': 0x0,
-            'ipc': 0x70000000,
-            'uart': {
-                'pa': 0x9000000,
-                'va': 0xff000000,
-                'interrupt_number': 33
-            },
-            'gic': {
-                'gicd': 0xf9010000,
-                'gicr': 0xf9020000
-            }
-        },
-        'linux': {
-            'entry': 0x60000000,
-            'ipc': 0xf0000000,
-            'uart': {
-                'pa': 0x9000000,
-                'va': 0x9000000,
-                'interrupt_number': 33
-            },
-            'gic': {
-                'gicd': 0x08000000,
-                'gicr': 0x080A0000
-            }
-        },
-        'zephyr': {
-            'entry': 0x80000000,
-            'ipc': 0x70000000,
-            'uart': {
-                'pa': 0x9000000,
-                'va': 0x9000000,
-                'interrupt_number': 33
-            },
-            'gic': {
-                'gicd': 0x08000000,
-                'gicr': 0x080A0000
-            }
-        }
-    }
-}
+import time
+from functools import lru_cache
+from typing import Any, Optional
+from config_model import Configuration, Device, Ipc, Region, VmConfig, default_device_size, ipc_interrupt_number, timer_interrupt_number, max_colors
+from validate_config import check_configuration
+from plan_config import VmRequirement, plan_configuration, color_layout_str
+from layout_config import place_configuration, first_fit_str
+from output_file import write_if_changed
+from board_database import load_boards, board_information, parse_number
 
 # Structure declarations 
 config_file_structure = '''#include <config.h>
@@ -264,6 +122,11 @@ timer_template = '''                    {{
                         .interrupts = (irqid_t[]) {{{timer_interrupt:d}}}
                     }}
 '''
+plic_architecture_template = '''                // Architecture description
+                .arch = {{
+                    .plic_base = 0x{plic_addr:08x}
+                }}
+'''
 architecture_template = '''                // Architecture description
                 .arch = {{
                     .gic = {{
@@ -272,9 +135,24 @@ architecture_template = '''                // Architecture description
                     }}
                 }}
 '''
+no_color_template = '            // No color used\n'
+no_cpu_affinity_template = '            // No CPU affinity\n'
+no_ipc_template = '                // No IPC\n'
+
+# Folders used by the generator
+image_folder = os.path.join('..', 'images')
+config_folder = os.path.join('..', 'config')
 
-ipc_interrupt_number = 52
-timer_interrupt_number = 27
+# Rendered fragments only depend on their values, the same platform and OS give the same ones in all configurations
+fragment_cache_size = 4096
+timer_fragment = timer_template.format(timer_interrupt=timer_interrupt_number)
+
+# Configurations rendered by the benchmark
+default_benchmark_number = 10000
+
+# Device shortcuts usable in a specification file
+uart_device_str = 'uart'
+uart_rx_device_str = 'uart_rx'
 
 
 def shememlist_definition() -> list[int]:
@@ -301,27 +179,39 @@ def shememlist_definition() -> list[int]:
     return shmem_sizes
 
 
-def generate_shared_memory(shmem_sizes: list[int]) -> str:
-    shared_memories = ''
-    
+@lru_cache(maxsize=fragment_cache_size)
+def render_shared_memory(shmem_sizes: tuple[int, ...]) -> str:
     if len(shmem_sizes) == 0:
-        completed_shared_memory = '    // No shared memory\n'
-    else:
-        for shmem_index in range(0, len(shmem_sizes)):
-            shared_memories = shared_memory_template.format(index=shmem_index, size=shmem_sizes[shmem_index]) + '\n'
-        
-        completed_shared_memory = shared_memory_structure.format(shmemlist_size=len(shmem_sizes), shmemlist_template=shared_memories)
-    return completed_shared_memory
+        return '    // No shared memory\n'
+    
+    shared_memories = ''.join([shared_memory_template.format(index=shmem_index, size=shmem_size) + '\n' for shmem_index, shmem_size in enumerate(shmem_sizes)])
+    return shared_memory_structure.format(shmemlist_size=len(shmem_sizes), shmemlist_template=shared_memories)
 
 
+def generate_shared_memory(shmem_sizes: list[int]) -> str:
+    return render_shared_memory(tuple(shmem_sizes))
+
+
+@lru_cache(maxsize=fragment_cache_size)
 def generate_image_config(base_address: int, image_name: str) -> str:
     completed_image = image_template.format(base_addr=base_address, image_name=image_name)
     return completed_image
 
 
-def declare_regions(entry_point: str, platform_name: str, region_number: int) -> str:
+def first_region_base(os_information: dict[str, Any]) -> int:
+    # The first region begins at the entry point (except for zcu's with Linux, the board says so)
+    return os_information['region_base']
+
+
+@lru_cache(maxsize=fragment_cache_size)
+def render_regions(regions: tuple[tuple[int, int], ...]) -> str:
+    completed_regions = ''.join([region_template.format(base=base, size=size) for base, size in regions])
+    return region_structure.format(region_num=len(regions), region_template=completed_regions)
+
+
+def declare_regions(first_base: int, region_number: int) -> list[Region]:
     region_index = 0
-    regions = ''
+    regions = []
     
     while region_index < region_number:
         region_base = 0
@@ -329,18 +219,15 @@ def declare_regions(entry_point: str, platform_name: str, region_number: int) ->
         
         # If first region, then address given by the entry point (except for zcu's with Linux)
         if region_index == 0:
-            if platform_name == 'zcu' and entry_point == 0x200000:
-                region_base = 0
-            else:
-                region_base = entry_point
+            region_base = first_base
         
-        # Else you ask for the base address (in hexa)
+        # Else you ask for the base address (in hexa), placed after all VMs are declared if not given
         else:
-            region_base_str = input(f'What is the base address for region n°{region_index:d}? (type in hexadecimal without 0x) (by default 0)\n')
+            region_base_str = input(f'What is the base address for region n°{region_index:d}? (type in hexadecimal without 0x) (leave empty to place it automatically)\n')
             try:
                 region_base = max(int(region_base_str, 16), 0)
             except:
-                region_base = 0
+                region_base = None
         
         # Ask for region size
         region_size_str = input(f'What is the size of region n°{region_index:d}? (type in hexadecimal without 0x) (by default 0)\n')
@@ -350,26 +237,38 @@ def declare_regions(entry_point: str, platform_name: str, region_number: int) ->
             region_size = 0
         
         # Append to regions
-        regions += region_template.format(base=region_base, size=region_size)
+        regions.append(Region(base=region_base, size=region_size))
         
         # Next one
         region_index += 1
     
-    completed_region = region_structure.format(region_num=region_number, region_template=regions)
-    return completed_region
+    return regions
+
+
+@lru_cache(maxsize=fragment_cache_size)
+def render_ipcs(ipcs: tuple[tuple[int, int, int, int], ...]) -> str:
+    if len(ipcs) == 0:
+        return no_ipc_template
+    
+    completed_ipcs = ''.join([ipc_template.format(base=base, size=size, shmemid=shmem_id, ipc_interrupt=interrupt) for base, size, shmem_id, interrupt in ipcs])
+    return ipc_structure.format(ipc_number=len(ipcs), ipc_template=completed_ipcs)
 
 
-def declare_ipc(ipc_number: int, shmem_sizes: list[int], os_information: dict[str, Any]) -> str:
-    ipcs = ''
+def declare_ipc(ipc_number: int, shmem_sizes: list[int], os_information: dict[str, Any]) -> list[Ipc]:
+    ipcs = []
     ipc_index = 0
     
     while ipc_index < ipc_number:
         # Ask for which shared memory to use
         shmemid = -1
         while shmemid < 0:
-            shmemid_str = input(f'Which shared memory do you want to use for IPC n°{ipc_index}? (from 0 to {ipc_number -1})\n')
+            shmemid_str = input(f'Which shared memory do you want to use for IPC n°{ipc_index}? (from 0 to {len(shmem_sizes) - 1})\n')
             try:
                 shmemid = int(shmemid_str)
+                
+                if shmemid >= len(shmem_sizes):
+                    print('This shared memory does not exist...')
+                    shmemid = -1
             except:
                 shmemid = -1
         
@@ -378,17 +277,33 @@ def declare_ipc(ipc_number: int, shmem_sizes: list[int], os_information: dict[st
         ipc_size = shmem_sizes[shmemid]
         
         # Append to IPC
-        ipcs += ipc_template.format(base=ipc_base, size=ipc_size, shmemid=shmemid, ipc_interrupt=ipc_interrupt_number)
+        ipcs.append(Ipc(base=ipc_base, size=ipc_size, shmem_id=shmemid))
 
         # Next one!
         ipc_index += 1
 
-    completed_ipc = ipc_structure.format(ipc_number=ipc_number, ipc_template=ipcs)
-    return completed_ipc
+    return ipcs
+
+
+@lru_cache(maxsize=fragment_cache_size)
+def render_devices(devices: tuple[tuple[int, int, int, tuple[int, ...]], ...], arch_timer: bool) -> str:
+    completed_devices = []
+    for pa, va, size, interrupts in devices:
+        if len(interrupts) == 0:
+            completed_devices.append(device_template_no_intr.format(pa=pa, va=va, size=size))
+        else:
+            dev_interrupts = ','.join(str(interrupt) for interrupt in interrupts)
+            completed_devices.append(device_template_intr.format(pa=pa, va=va, size=size, interrupt_num=len(interrupts), dev_interrupts=dev_interrupts))
+    
+    # Add arch timer if wanted
+    if arch_timer:
+        completed_devices.append(timer_fragment)
+    
+    return device_structure.format(dev_num=len(completed_devices), device_template=''.join(completed_devices))
 
 
-def declare_devices(device_number: int, os_information: dict[str, Any]) -> str:
-    devices = ''
+def declare_devices(device_number: int, os_information: dict[str, Any]) -> tuple[list[Device], bool]:
+    devices = []
     device_index = 0
     has_uart = 0
     
@@ -398,6 +313,7 @@ def declare_devices(device_number: int, os_information: dict[str, Any]) -> str:
         size = -1
         interrupt_num = 0
         interrupts = []
+        is_uart = False
         
         # If there is no UART yet, ask if the device is a UART
         if has_uart == 0:
@@ -406,6 +322,7 @@ def declare_devices(device_number: int, os_information: dict[str, Any]) -> str:
             # If it is an UART, then auto add everything
             if confirmation.lower() != 'n':
                 has_uart = 1
+                is_uart = True
                 pa = os_information['uart']['pa']
                 va = os_information['uart']['va']
                 
@@ -416,7 +333,7 @@ def declare_devices(device_number: int, os_information: dict[str, Any]) -> str:
                     interrupt_num = 0
                 else:
                     interrupt_num = 1
-                    interrupts.append(str(os_information['uart']['interrupt_number']))
+                    interrupts.append(os_information['uart']['interrupt_number'])
                     
         # Here if device is not UART or if UART already defined, pa should be -1
         if pa == -1:
@@ -455,64 +372,82 @@ def declare_devices(device_number: int, os_information: dict[str, Any]) -> str:
                         except:
                             interrupt_id = -1
                     
-                    interrupts.append(str(interrupt_id))
+                    interrupts.append(interrupt_id)
                     interrupt_index += 1
         
-        # Ask for size of device
-        size_str = input(f'What is the size of device n°{device_index}? (type in hexadecimal without 0x) (by default 10000)\n')
+        # Ask for size of device, a UART has the size of the board description
+        default_size = os_information['uart']['size'] if is_uart else default_device_size
+        size_str = input(f'What is the size of device n°{device_index}? (type in hexadecimal without 0x) (by default {default_size:x})\n')
         try:
             size = max(int(size_str, 16), 0)
         except:
-            size = 0x10000
+            size = default_size
         
         # Append to devices
-        if interrupt_num == 0:
-            devices += device_template_no_intr.format(pa=pa, va=va, size=size)
-        else:
-            interrupts = ','.join(interrupts)
-            devices += device_template_intr.format(pa=pa, va=va, size=size, interrupt_num=interrupt_num, dev_interrupts=interrupts)
+        devices.append(Device(pa=pa, va=va, size=size, interrupts=interrupts))
         
         # Increment device
         device_index += 1
     
     # Add arch timer if wanted
     confirmation = input('Do you want the arch timer? [Y/n]\n')
-    if confirmation.lower() != 'n':
-        devices += timer_template.format(timer_interrupt=timer_interrupt_number)
-        device_number += 1
+    arch_timer = confirmation.lower() != 'n'
     
-    completed_device = device_structure.format(dev_num=device_number, device_template=devices)
-    return completed_device
+    return devices, arch_timer
+
+
+def colors_bitmap(colors: int) -> str:
+    return f'0b{colors:0{max_colors:d}b}'
+
+
+def cpu_bitmap(cpu_affinity: int, cpu_number: int) -> str:
+    return f'0b{cpu_affinity:0{cpu_number:d}b}'
+
+
+@lru_cache(maxsize=fragment_cache_size)
+def render_colors(colors: Optional[int]) -> str:
+    if colors is None:
+        return no_color_template
+    return color_template.format(colors_bitmap=colors_bitmap(colors))
 
 
-def generate_architecture_config(gic_registers: dict[str, int]) -> str:
-    gic1 = list(gic_registers.keys())[0]
-    gic2 = list(gic_registers.keys())[1]
-    completed_architecture = architecture_template.format(gic1=gic1, gic1_addr=gic_registers[gic1], gic2=gic2, gic2_addr=gic_registers[gic2])
-    return completed_architecture
+@lru_cache(maxsize=fragment_cache_size)
+def render_cpu_affinity(cpu_affinity: Optional[int], cpu_number: int) -> str:
+    if cpu_affinity is None:
+        return no_cpu_affinity_template
+    return cpu_affinity_template.format(cpu_bitmap=cpu_bitmap(cpu_affinity, cpu_number))
 
 
-def image_declaration(cpu_number: int, platform_name: str, shmem_sizes: list[int]) -> dict[int, dict[str, str]]:
-    image_folder = os.path.join('..', 'images')
+@lru_cache(maxsize=fragment_cache_size)
+def render_architecture(gic_registers: tuple[tuple[str, int], ...]) -> str:
+    # RISC-V platforms have a PLIC instead of a GIC
+    if gic_registers[0][0] == 'plic':
+        return plic_architecture_template.format(plic_addr=gic_registers[0][1])
     
-    declared_config = {}
+    (gic1, gic1_addr), (gic2, gic2_addr) = gic_registers[0], gic_registers[1]
+    return architecture_template.format(gic1=gic1, gic1_addr=gic1_addr, gic2=gic2, gic2_addr=gic2_addr)
+
+
+def image_declaration(cpu_number: int, platform_name: str, shmem_sizes: list[int]) -> list[VmConfig]:
+    declared_vms = []
     declared_images = {}
 
-    platform_information = image_information[platform_name]
+    platform_information = board_information(platform_name)['oses']
     used_cpu = 0
     used_colors = 0
     image_name = ''
     image_index = 0
     
     # Ask if you want to use colors
-    max_colors = 16
     use_colors = -1
     while use_colors == -1:
-        confirmation = input('Do you want to use colors? [y/n]\n')
+        confirmation = input('Do you want to use colors? [y/n/a] (a to compute them from the working set of each image)\n')
         if confirmation.lower() == 'y':
             use_colors = 1
         elif confirmation.lower() == 'n':
             use_colors = 0
+        elif confirmation.lower() == 'a':
+            use_colors = 2
     
     # Ask if you want to add an image
     while (used_cpu == 0 or image_name) and used_cpu < cpu_number:
@@ -566,7 +501,7 @@ def image_declaration(cpu_number: int, platform_name: str, shmem_sizes: list[int
             image_cpu = max_cpu
         
         # Put CPU number in dict
-        image['cpu_number'] = f'{image_cpu:d}'
+        image['cpu_number'] = image_cpu
         
         # Ask if the image have some CPU affinity
         confirmation = input('Do you want to set a core affinity for this image? [y/N]\n')
@@ -590,7 +525,7 @@ def image_declaration(cpu_number: int, platform_name: str, shmem_sizes: list[int
                 cpu_affinity |= 1 << core
             
             # Add it to the image
-            image['cpu_affinity'] = f'0b{{cpu_affinity:0{cpu_number:d}b}}'.format(cpu_affinity=cpu_affinity)
+            image['cpu_affinity'] = cpu_affinity
         
         # If we use colors, ask how many we want to use (out of 16)
         if use_colors == 1: 
@@ -614,12 +549,24 @@ def image_declaration(cpu_number: int, platform_name: str, shmem_sizes: list[int
                     print('Value not supported, retry...')
             
             # Add to image the bitmap of color
-            color_number_str = (2**color_number - 1) << used_colors
-            image['colors'] = f'0b{color_number_str:016b}'
+            image['colors'] = (2**color_number - 1) << used_colors
             
             # Don't forget to increment
             used_colors += color_number
                 
+        # If colors are computed, ask what they are computed from
+        if use_colors == 2:
+            working_set_str = input('What is the working set of this image? (type in hexadecimal without 0x) (by default the whole cache)\n')
+            try:
+                working_set = max(int(working_set_str, 16), 0)
+            except:
+                working_set = None
+            
+            confirmation = input('Is this image critical? [y/N]\n')
+            cpu_affinity = image.get('cpu_affinity')
+            cores = [core for core in range(0, cpu_number) if cpu_affinity & (1 << core)] if cpu_affinity is not None else None
+            image['requirement'] = VmRequirement(working_set=working_set, criticality=1 if confirmation.lower() == 'y' else 0, cpu_number=image_cpu, cores=cores)
+        
         # Add image to declared images
         declared_images[image_index] = image
         
@@ -627,40 +574,38 @@ def image_declaration(cpu_number: int, platform_name: str, shmem_sizes: list[int
         used_cpu += image_cpu
         image_index += 1
                 
+    # Computed colors keep critical images away from the others, CPU affinities have already been asked
+    if use_colors == 2:
+        requirements = [image['requirement'] for image in declared_images.values()]
+        try:
+            plan = plan_configuration(requirements, cpu_number, color_layout_str, affinity=False)
+        except ValueError as error:
+            print(error)
+            print('Colors cannot be computed... Exit configuration...')
+            exit(3)
+        
+        for image, colors in zip(declared_images.values(), plan.colors):
+            image['colors'] = colors
+        print(f'Colors computed, {plan.shared_colors:d} colors of critical images are shared')
+    
     print('It is now time to ask information for each OS image')
     for image_index in list(declared_images.keys()):
-        image_config = {}
-        
         image = declared_images[image_index]
-        entry_point = platform_information[image['configuration']]['entry']
+        os_information = platform_information[image['configuration']]
+        entry_point = os_information['entry']
         
         print(f'For the image n°{image_index:d} named {image["image_name"]:s}...')
         
-        # Set colors
-        if use_colors == 1:
-            image_config['colors'] = color_template.format(colors_bitmap=image['colors'])
-        else:
-            image_config['colors'] = '            // No color used\n'
-        
-        # Set CPU affinity
-        if 'cpu_affinity' in image:
-            image_config['cpu_affinity'] = cpu_affinity_template.format(cpu_bitmap=image['cpu_affinity'])
-        else:
-            image_config['cpu_affinity'] = '            // No CPU affinity\n'
-        
-        # Set image name and path in config
-        image_config['image_name'] = image["image_name"]
-        image_config['image_path'] = image["image_path"]
-        
-        # Set the number of CPU of the image
-        image_config['cpu_number'] = image['cpu_number']
-        
-        # Generate image string
-        completed_image = generate_image_config(base_address=entry_point, image_name=image["image_name"])
-        image_config['image'] = completed_image
-        
-        # Set entry point string
-        image_config['entry'] = entry_point_template.format(address=entry_point)
+        # Colors and CPU affinity have been asked before, the image begins at the entry point
+        vm = VmConfig(image_name=image['image_name'],
+                      image_path=image['image_path'],
+                      configuration=image['configuration'],
+                      cpu_number=image['cpu_number'],
+                      entry=entry_point,
+                      base_addr=entry_point,
+                      gic=dict(os_information['gic']),
+                      colors=image.get('colors'),
+                      cpu_affinity=image.get('cpu_affinity'))
         
         # Ask for region number
         region_number_str = input('How many region number do you want? (by default 1)\n')
@@ -669,8 +614,7 @@ def image_declaration(cpu_number: int, platform_name: str, shmem_sizes: list[int
         except:
             region_number = 1
         
-        completed_region = declare_regions(entry_point=entry_point, platform_name=platform_name, region_number=region_number)
-        image_config['regions'] = completed_region
+        vm.regions = declare_regions(first_base=first_region_base(os_information), region_number=region_number)
         
         # Ask for IPC (if any shared memory)
         if len(shmem_sizes) > 0: 
@@ -681,11 +625,7 @@ def image_declaration(cpu_number: int, platform_name: str, shmem_sizes: list[int
                 ipc_number = 1
             
             if ipc_number != 0:
-                completed_ipc = declare_ipc(ipc_number=ipc_number, shmem_sizes=shmem_sizes, os_information=platform_information[image['configuration']])
-                image_config['ipc'] = completed_ipc
-
-        if 'ipc' not in image_config:
-            image_config['ipc'] = '                // No IPC\n'
+                vm.ipcs = declare_ipc(ipc_number=ipc_number, shmem_sizes=shmem_sizes, os_information=os_information)
         
         # Ask for devices (do not count the arch timer)
         device_number_str = input('How many devices do you want? (DO NOT INCLUDE THE ARCH TIMER) (by default 1)\n')
@@ -694,50 +634,272 @@ def image_declaration(cpu_number: int, platform_name: str, shmem_sizes: list[int
         except:
             device_number = 1
         
-        completed_device = declare_devices(device_number=device_number, os_information=platform_information[image['configuration']])
-        image_config['devices'] = completed_device
-        
-        # Generate architecture
-        completed_architectre = generate_architecture_config(gic_registers=platform_information[image['configuration']]['gic'])
-        image_config['architecture'] = completed_architectre
+        vm.devices, vm.arch_timer = declare_devices(device_number=device_number, os_information=os_information)
         
         # Add image config to declared config
-        declared_config[image_index] = image_config
+        declared_vms.append(vm)
             
-    return declared_config
+    return declared_vms
 
 
-def generate_image_declaration(generation_config: dict[int, dict[str, str]]) -> str:
-    completed_image_declaration = ''
-    for image_index in generation_config:
-        completed_image_declaration += image_declaration_template.format(vm_name=generation_config[image_index]['image_name'], vm_path=generation_config[image_index]['image_path']) + '\n'
+def generate_image_declaration(vms: list[VmConfig]) -> str:
+    return ''.join([image_declaration_template.format(vm_name=vm.image_name, vm_path=vm.image_path) + '\n' for vm in vms])
+
+
+@lru_cache(maxsize=fragment_cache_size)
+def render_vm(image_name: str, base_addr: int, entry: int, vm_cpu_number: int, cpu_number: int, colors: Optional[int], cpu_affinity: Optional[int], regions: tuple, ipcs: tuple, devices: tuple, arch_timer: bool, gic_registers: tuple) -> str:
+    platform_description = platform_structure.format(cpu_number=f'{vm_cpu_number:d}',
+                                                     region_description=render_regions(regions),
+                                                     ipc_description=render_ipcs(ipcs),
+                                                     device_description=render_devices(devices, arch_timer),
+                                                     architecture_description=render_architecture(gic_registers))
+    
+    return vm_element_structure.format(colors=render_colors(colors),
+                                       cpu_affinity=render_cpu_affinity(cpu_affinity, cpu_number),
+                                       image_description=generate_image_config(base_address=base_addr, image_name=image_name),
+                                       entry_point=entry_point_template.format(address=entry),
+                                       platform_description=platform_description)
+
+
+def generate_vm_config(vm: VmConfig, cpu_number: int) -> str:
+    # The whole VM is cached too, interference VMs are the same in many configurations
+    return render_vm(vm.image_name, vm.base_addr, vm.entry, vm.cpu_number, cpu_number, vm.colors, vm.cpu_affinity,
+                     tuple((region.base, region.size) for region in vm.regions),
+                     tuple((ipc.base, ipc.size, ipc.shmem_id, ipc.interrupt) for ipc in vm.ipcs),
+                     tuple((device.pa, device.va, device.size, tuple(device.interrupts)) for device in vm.devices),
+                     vm.arch_timer,
+                     tuple(vm.gic.items()))
+
+
+def render_configuration(configuration: Configuration) -> str:
+    # Fragments are joined once, never concatenated one after the other
+    vm_config = ''.join([generate_vm_config(vm, configuration.cpu_number) for vm in configuration.vms])
+    vm_list = vm_list_structure.format(vmlist_size=len(configuration.vms), vm_config=vm_config)
+    return config_file_structure.format(images=generate_image_declaration(configuration.vms),
+                                        shared_memory=generate_shared_memory(shmem_sizes=configuration.shmem_sizes),
+                                        vm_config=vm_list)
+
+
+def parse_bitmap(value: Any) -> int:
+    # A bitmap is either a number or the list of its set bits
+    if isinstance(value, list):
+        bitmap = 0
+        for bit in value:
+            bitmap |= 1 << parse_number(bit)
+        return bitmap
+    return parse_number(value)
+
+
+def load_spec(spec_path: str) -> dict[str, Any]:
+    extension = os.path.splitext(spec_path)[1].lower()
+    file = open(spec_path, 'rb')
+    content = file.read()
+    file.close()
     
-    return completed_image_declaration
+    # JSON is always available, TOML and YAML need their parser
+    if extension == '.json':
+        return json.loads(content)
+    elif extension == '.toml':
+        import tomllib
+        return tomllib.loads(content.decode('utf-8'))
+    elif extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f'PyYAML is needed to read {spec_path:s}, install it or use JSON or TOML')
+        return yaml.safe_load(content)
+    
+    raise ValueError(f'Unknown specification format for {spec_path:s} (JSON, TOML or YAML)')
+
+
+def device_from_spec(device_spec: Any, os_information: dict[str, Any]) -> Device:
+    # UART is filled from the platform information, with or without its RX interrupt
+    if device_spec in (uart_device_str, uart_rx_device_str):
+        interrupts = [os_information['uart']['interrupt_number']] if device_spec == uart_rx_device_str else []
+        return Device(pa=os_information['uart']['pa'], va=os_information['uart']['va'], size=os_information['uart']['size'], interrupts=interrupts)
+    
+    pa = parse_number(device_spec['pa'])
+    return Device(pa=pa,
+                  va=parse_number(device_spec.get('va', pa)),
+                  size=parse_number(device_spec.get('size', default_device_size)),
+                  interrupts=[parse_number(interrupt) for interrupt in device_spec.get('interrupts', [])])
+
+
+def vm_from_spec(vm_spec: dict[str, Any], vm_index: int, platform_name: str, shmem_sizes: list[int], used_colors: int, place_ipcs: bool = False) -> VmConfig:
+    platform_information = board_information(platform_name)['oses']
+    
+    # The OS information comes from the platform, unknown OSes must say which one to use
+    os_name = vm_spec['os']
+    configuration = vm_spec.get('configuration', os_name)
+    if configuration not in platform_information:
+        raise ValueError(f'No information for {configuration:s} on {platform_name:s}, set "configuration" to one of {", ".join(platform_information.keys()):s}')
+    os_information = platform_information[configuration]
+    
+    entry_point = parse_number(vm_spec.get('entry', os_information['entry']))
+    vm = VmConfig(image_name=f'{os_name:s}_image{vm_index:d}',
+                  image_path=os.path.join(image_folder, vm_spec['image_path']),
+                  configuration=configuration,
+                  cpu_number=parse_number(vm_spec.get('cpu_number', 1)),
+                  entry=entry_point,
+                  base_addr=parse_number(vm_spec.get('base_addr', entry_point)),
+                  gic=dict(os_information['gic']),
+                  arch_timer=vm_spec.get('arch_timer', board_information(platform_name)['arch_timer']))
+    
+    # Colors are either a bitmap or a number of colors taken after the ones already used
+    if 'colors' in vm_spec:
+        vm.colors = parse_bitmap(vm_spec['colors'])
+    elif 'color_number' in vm_spec:
+        vm.colors = (2**parse_number(vm_spec['color_number']) - 1) << used_colors
+    
+    if 'cpu_affinity' in vm_spec:
+        vm.cpu_affinity = parse_bitmap(vm_spec['cpu_affinity'])
+    
+    # The first region begins by default at the entry point
+    for region_index, region_spec in enumerate(vm_spec.get('regions', [])):
+        if 'base' in region_spec:
+            region_base = parse_number(region_spec['base'])
+        elif region_index == 0:
+            region_base = first_region_base(os_information) if 'entry' not in vm_spec else entry_point
+        else:
+            region_base = None
+        vm.regions.append(Region(base=region_base, size=parse_number(region_spec['size'])))
+    
+    # IPC default to the OS IPC address (or are placed with the regions) and to the size of their shared memory
+    for ipc_spec in vm_spec.get('ipcs', []):
+        shmem_id = parse_number(ipc_spec['shmem_id'])
+        if 'base' in ipc_spec:
+            ipc_base = parse_number(ipc_spec['base'])
+        elif place_ipcs:
+            ipc_base = None
+        else:
+            ipc_base = os_information['ipc']
+        vm.ipcs.append(Ipc(base=ipc_base,
+                           size=parse_number(ipc_spec.get('size', shmem_sizes[shmem_id])),
+                           shmem_id=shmem_id,
+                           interrupt=parse_number(ipc_spec.get('interrupt', ipc_interrupt_number))))
+    
+    for device_spec in vm_spec.get('devices', []):
+        vm.devices.append(device_from_spec(device_spec, os_information))
+    
+    return vm
+
+
+def requirement_from_spec(vm_spec: dict[str, Any]) -> VmRequirement:
+    # Critical VMs can be marked as such or given a criticality, an explicit affinity pins the cores
+    criticality = parse_number(vm_spec.get('criticality', 1 if vm_spec.get('critical', False) else 0))
+    cores = vm_spec.get('cores')
+    if cores is None and 'cpu_affinity' in vm_spec:
+        cpu_affinity = parse_bitmap(vm_spec['cpu_affinity'])
+        cores = [core for core in range(0, cpu_affinity.bit_length()) if cpu_affinity & (1 << core)]
+    
+    return VmRequirement(working_set=parse_number(vm_spec['working_set']) if 'working_set' in vm_spec else None,
+                         criticality=criticality,
+                         cpu_number=parse_number(vm_spec.get('cpu_number', 1)),
+                         cores=[parse_number(core) for core in cores] if cores is not None else None)
+
+
+def apply_plan(configuration: Configuration, vm_specs: list[dict[str, Any]], plan_spec: dict[str, Any]):
+    # Colors and CPU affinities are computed from the requirements of all VMs
+    requirements = [requirement_from_spec(vm_spec) for vm_spec in vm_specs]
+    plan = plan_configuration(requirements, configuration.cpu_number, plan_spec.get('layout', color_layout_str), plan_spec.get('affinity', True))
+    
+    for vm, colors, cpu_affinity in zip(configuration.vms, plan.colors, plan.cpu_affinities):
+        vm.colors = colors
+        vm.cpu_affinity = cpu_affinity
 
 
-def generate_configuration(competed_image_declaration: str, completed_shared_memory: str, generation_config: dict[int, dict[str, str]]) -> str:
-    vm_config = ''
-    for image_configuration in generation_config.values():
-        platform_description = platform_structure.format(cpu_number=image_configuration['cpu_number'],
-                                                         region_description=image_configuration['regions'],
-                                                         ipc_description=image_configuration['ipc'],
-                                                         device_description=image_configuration['devices'],
-                                                         architecture_description=image_configuration['architecture'])
+def configuration_from_spec(config_spec: dict[str, Any]) -> Configuration:
+    platform_name = config_spec['platform']
+    board = board_information(platform_name)
+    
+    configuration = Configuration(name=config_spec['name'],
+                                  platform=platform_name,
+                                  cpu_number=parse_number(config_spec.get('cpu_number', board['cpu_number'])),
+                                  shmem_sizes=[parse_number(size) for size in config_spec.get('shared_memories', [])])
+    
+    used_colors = 0
+    for vm_index, vm_spec in enumerate(config_spec['vms']):
+        vm = vm_from_spec(vm_spec, vm_index, platform_name, configuration.shmem_sizes, used_colors, 'layout' in config_spec)
         
-        vm_config += vm_element_structure.format(colors=image_configuration['colors'],
-                                    cpu_affinity=image_configuration['cpu_affinity'],
-                                    image_description=image_configuration['image'],
-                                    entry_point=image_configuration['entry'],
-                                    platform_description=platform_description)
+        if vm.colors is not None:
+            used_colors = max(used_colors, vm.colors.bit_length())
+        configuration.vms.append(vm)
+    
+    if 'plan' in config_spec:
+        apply_plan(configuration, config_spec['vms'], config_spec['plan'])
     
-    vm_list = vm_list_structure.format(vmlist_size=len(generation_config), vm_config=vm_config)
-    completed_configuration = config_file_structure.format(images=competed_image_declaration,
-                                                           shared_memory=completed_shared_memory,
-                                                           vm_config=vm_list)
-    return completed_configuration
+    # Colors are known, regions and IPCs without base can be placed
+    place_configuration(configuration, config_spec.get('layout', {}).get('strategy', first_fit_str))
+    return configuration
 
 
-def main():
+def load_configurations(spec_path: str) -> list[Configuration]:
+    # A specification holds one configuration or a list of them
+    spec = load_spec(spec_path)
+    config_specs = spec['configs'] if 'configs' in spec else [spec]
+    
+    try:
+        return [configuration_from_spec(config_spec) for config_spec in config_specs]
+    except KeyError as error:
+        raise ValueError(f'Missing field {error} in {spec_path:s}')
+
+
+def configuration_path(configuration: Configuration, output_folder: str = config_folder) -> str:
+    return os.path.join(output_folder, configuration.name, configuration.platform + '.c')
+
+
+def write_configuration(configuration: Configuration, output_folder: str = config_folder, check: bool = True) -> tuple[str, bool]:
+    # Nothing is written if the configuration is not valid
+    if check:
+        check_configuration(configuration)
+    
+    # An unchanged file is not touched, Bao is not rebuilt for nothing
+    config_file_path = configuration_path(configuration, output_folder)
+    changed = write_if_changed(config_file_path, render_configuration(configuration))
+    return config_file_path, changed
+
+
+def generate_from_specs(spec_paths: list[str], output_folder: str = config_folder):
+    start = time.perf_counter()
+    
+    configurations = []
+    for spec_path in spec_paths:
+        configurations += load_configurations(spec_path)
+    
+    # All configurations are checked before writing any of them
+    for configuration in configurations:
+        check_configuration(configuration)
+    
+    changed_number = 0
+    for configuration in configurations:
+        _, changed = write_configuration(configuration, output_folder, check=False)
+        changed_number += changed
+    
+    elapsed = time.perf_counter() - start
+    print(f'{len(configurations):d} configuration files generated in {elapsed:.3f}s ({len(configurations) - changed_number:d} unchanged)')
+
+
+def benchmark_rendering(configurations: list[Configuration], number: int = default_benchmark_number):
+    # Like in a sweep, the first VM changes in every configuration and the other ones are the same
+    variants = []
+    for index in range(0, number):
+        configuration = configurations[index % len(configurations)]
+        first_vm = configuration.vms[0]
+        regions = [Region(base=first_vm.regions[0].base, size=first_vm.regions[0].size + index * 0x1000)] + first_vm.regions[1:]
+        variants.append(dataclasses.replace(configuration, vms=[dataclasses.replace(first_vm, regions=regions)] + configuration.vms[1:]))
+    
+    rendered_size = 0
+    start = time.perf_counter()
+    for configuration in variants:
+        rendered_size += len(render_configuration(configuration))
+    elapsed = time.perf_counter() - start
+    
+    cache_info = render_vm.cache_info()
+    print(f'{number:d} configurations ({rendered_size / 2**20:.1f} MiB) rendered in {elapsed:.3f}s ({number / elapsed:.0f} configurations/s)')
+    print(f'VM cache: {cache_info.hits:d} hits, {cache_info.misses:d} misses')
+
+
+def interactive_generation():
     # Welcome guest
     print("Welcome to the Bao's configuration generator")
     
@@ -747,25 +909,25 @@ def main():
     while not platform_name: 
         config_platform_name = input('Please enter the name of the platform you want to use (leave empty if you want to see suggestions):\n')
               
-        if config_platform_name.lower() not in image_information:
+        if config_platform_name.lower() not in load_boards() and config_platform_name.lower() != 'zcu':
             # Reset platform name
             platform_name = ''
             
             # Show all platforms
-            print(f'Valid platforms are {", ".join(list(image_information.keys())):s}. ZCU can be both 102 or 104. More platforms can be added in the future...')
+            print(f'Valid platforms are {", ".join(load_boards().keys()):s}. ZCU can be both 102 or 104. More platforms can be added in the boards directory...')
         else:
             if config_platform_name.lower() == 'zcu':
                 zcu_number = 0
-                while zcu_number != 102 or zcu_number != 104:
+                while zcu_number != 102 and zcu_number != 104:
                     zcu_number_str = input('Which ZCU do you want to use? (102 or 104)\n')
                     try:
                         zcu_number = int(zcu_number_str)
                     except:
                         zcu_number = 0
                 
-                platform_name = config_platform_name + str(zcu_number)
+                platform_name = config_platform_name.lower() + str(zcu_number)
             else: 
-                platform_name = config_platform_name
+                platform_name = config_platform_name.lower()
 
     # Ask for config name
     config_name = ''
@@ -776,52 +938,69 @@ def main():
     config_dir_path = os.path.join(os.getcwd(), '..', 'config', config_name)
     config_file_path = os.path.join(config_dir_path, platform_name + '.c')
     
-    # Check if config file already exists
+    # Check if config file already exists, it is only replaced once the new one is complete
     if os.path.exists(config_file_path):
         # Asks if want to override it 
         confirmation = input('Do you want to override it? [y/N]\n')
         if confirmation.lower() != 'y':
             print("Alright, we don't touch it! Quitting...")
             exit(0)
-        
-        # Delete the file
-        os.remove(config_file_path)
-    else:
-        # Create if directory does not exist
-        if not os.path.exists(config_dir_path):
-            os.mkdir(config_dir_path)
             
     # Ask number of CPU
-    cpu_number_str = input('How many CPUs do you have? (by default 4)\n')
+    default_cpu_number = board_information(platform_name)['cpu_number']
+    cpu_number_str = input(f'How many CPUs do you have? (by default {default_cpu_number:d})\n')
     try:
         cpu_number = int(cpu_number_str)
     except:
-        cpu_number = 4
+        cpu_number = default_cpu_number
     
     # Ask everything about shared memory
     shmem_sizes = shememlist_definition()
     
-    # Generate shared memory config
-    completed_shared_memory = generate_shared_memory(shmem_sizes=shmem_sizes)
-    
     # Ask everything about OSes
-    generation_config = image_declaration(cpu_number=cpu_number, platform_name=config_platform_name, shmem_sizes=shmem_sizes)
+    vms = image_declaration(cpu_number=cpu_number, platform_name=platform_name, shmem_sizes=shmem_sizes)
+    configuration = Configuration(name=config_name, platform=platform_name, cpu_number=cpu_number, shmem_sizes=shmem_sizes, vms=vms)
+    
+    # Place regions without base, check, create and write the configuration file (overriding mode)
+    try:
+        place_configuration(configuration)
+        write_configuration(configuration, os.path.dirname(config_dir_path))
+    except ValueError as error:
+        print(error)
+        print('Configuration file not generated, please correct these errors')
+        exit(3)
     
-    # Generate image declaration
-    competed_image_declaration = generate_image_declaration(generation_config=generation_config)
+    # Thank user
+    print('Configuration file generated, please verify it and do not hesitate to add things to it, this is just a base configuration')
+
 
-    # Generate configuration string
-    completed_configuration = generate_configuration(competed_image_declaration=competed_image_declaration, completed_shared_memory=completed_shared_memory, generation_config=generation_config)
+def main():
+    # Without specification file, everything is asked to the user
+    parser = argparse.ArgumentParser(description="Bao's configuration generator, interactive without specification file")
+    parser.add_argument('spec', nargs='*', help='specification files (JSON, TOML or YAML) describing the configurations to generate')
+    parser.add_argument('--output', default=config_folder, help=f'folder where configurations are written (by default {config_folder:s})')
+    parser.add_argument('--benchmark', type=int, nargs='?', const=default_benchmark_number, metavar='NUMBER', help=f'render NUMBER configurations (by default {default_benchmark_number:d}) made from the specifications (or from {config_folder:s}) without writing them')
+    arguments = parser.parse_args()
     
-    # Create and write the configuration file (overriding mode)
-    configuration_file = open(config_file_path, 'w')
+    if arguments.benchmark is not None:
+        from parse_config import load_configuration_tree
+        try:
+            configurations = [configuration for spec_path in arguments.spec for configuration in load_configurations(spec_path)] or load_configuration_tree()
+        except (OSError, ValueError) as error:
+            print(error)
+            exit(1)
+        benchmark_rendering(configurations, arguments.benchmark)
+        return
     
-    # Write configuration
-    configuration_file.write(completed_configuration)
+    if not arguments.spec:
+        interactive_generation()
+        return
     
-    # Close file and thank user
-    configuration_file.close()
-    print('Configuration file generated, please verify it and do not hesitate to add things to it, this is just a base configuration')
+    try:
+        generate_from_specs(arguments.spec, arguments.output)
+    except (OSError, ValueError) as error:
+        print(error)
+        exit(1)
     
 if __name__ == '__main__':
     main()
\ No newline at end of file
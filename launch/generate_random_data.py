@@ -1,13 +1,23 @@
 # Imports
-import sys
+import argparse
+import hashlib
+import json
 import os
-from numpy import random, ndarray, dtype, int_
-from typing import Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from numpy import random, ndarray, dtype, uint8, int64, uint64, array, empty, ones, take, arange, cumsum, flatnonzero
+from typing import Any, Callable, Iterator
+from output_file import OutputFile, open_output, write_if_changed
 
 # Constants
 freertos_str = 'freertos'
 baremetal_str = 'baremetal'
 both_str = 'both'
+benchmark_str = 'benchmark'
+
+# Output modes
+text_str = 'text'
+binary_str = 'binary'
 
 freertos_path = os.path.join('..', 'freertos-bao-fpmc', 'src', 'inc', 'appdata.h')
 baremetal_path = os.path.join('..', 'baremetal-bao-fpmc', 'src', 'inc', 'appdata.h')
@@ -15,6 +25,48 @@ baremetal_path = os.path.join('..', 'baremetal-bao-fpmc', 'src', 'inc', 'appdata
 data_size = 1024
 value_min = 0
 value_max = 2**8
+values_per_line = 16
+
+# Data is generated and written by chunks, this must be a multiple of the number of values per line
+chunk_size = 2**20
+size_units = {'k': 2**10, 'm': 2**20, 'g': 2**30}
+
+# Data is seeded so that the same parameters always give the same bytes
+data_seed = 0
+
+# Access patterns, uniform is only random bytes while the others link cache lines together
+uniform_pattern_str = 'uniform'
+chase_pattern_str = 'chase'
+stride_pattern_str = 'stride'
+pattern_names = [uniform_pattern_str, chase_pattern_str, stride_pattern_str]
+
+# Cache geometry (Raspberry Pi 4 Cortex-A72 L2), giving the 16 colors used by generate_config.py
+cache_line_size = 64
+llc_size = 2**20
+llc_ways = 16
+page_size = 4096
+pointer_size = 4
+default_stride = 1
+
+# The chase visits lines in the order of a Feistel network keyed by the seed, the order is never stored
+feistel_rounds = 4
+mix_multipliers = [uint64(0xBF58476D1CE4E5B9), uint64(0x94D049BB133111EB)]
+
+uniform_pattern = {'name': uniform_pattern_str}
+
+# The manifest is stored next to the header, its version changes when the output format changes
+manifest_extension = '.manifest'
+manifest_version = 4
+
+# Sizes used by the formatting benchmark (1 KiB to 64 MiB)
+benchmark_sizes = [2**power for power in range(10, 27, 2)]
+benchmark_repeat = 3
+
+# Each byte value is formatted once as '0xNN, ' and indexed from this table
+hex_value_size = len('0x00, ')
+hex_table = array([list(f'0x{value:02X}, '.encode('ascii')) for value in range(0, 256)], dtype=uint8).view(f'V{hex_value_size:d}').ravel()
+line_end = array(list('\n\t'.encode('ascii')), dtype=uint8)
+line_size = values_per_line * hex_value_size + len(line_end)
 
 appdata_h_template = """/* THIS FILE HAS BEEN GENERATED, ALL MODIFICATIONS WILL BE OVERRIDEN WHEN REGENERATING IT */
 #ifndef __APPDATA_H__
@@ -27,65 +79,427 @@ uint8_t appdata[MAX_DATA_SIZE] = {{
 #endif
 """
 
+appdata_bin_h_template = """/* THIS FILE HAS BEEN GENERATED, ALL MODIFICATIONS WILL BE OVERRIDEN WHEN REGENERATING IT */
+#ifndef __APPDATA_H__
+#define __APPDATA_H__
+
+/* Data is included from {binary_name:s} by {stub_name:s}, add it to the assembly sources and the folder of both to the include path (-I) */
+#define APPDATA_SIZE {size:d}
+
+extern uint8_t appdata[MAX_DATA_SIZE];
+
+#endif
+"""
+
+appdata_s_template = """/* THIS FILE HAS BEEN GENERATED, ALL MODIFICATIONS WILL BE OVERRIDEN WHEN REGENERATING IT */
+    .section .data.appdata, "aw"
+    .global appdata
+    .type appdata, %object
+    .balign {alignment:d}
+appdata:
+    .incbin "{binary_path:s}"
+    .size appdata, . - appdata
+"""
+
 # Functions
-def generate_random_data() -> ndarray[Any, dtype[int_]]:
-    return random.randint(low=value_min, high=value_max, size=(data_size))
+def generate_random_data(size: int = data_size) -> ndarray[Any, dtype[uint8]]:
+    return random.randint(low=value_min, high=value_max, size=(size), dtype=uint8)
+
+
+def color_number(pattern: dict[str, Any]) -> int:
+    # A color is a set of pages sharing the same LLC sets
+    return pattern['llc_size'] // (pattern['llc_ways'] * page_size)
+
+
+def line_period(pattern: dict[str, Any]) -> int:
+    # Colors repeat every color_number pages, so does the set of linked lines
+    return color_number(pattern) * page_size // pattern['line_size']
+
+
+def line_links(size: int, generator: random.Generator, pattern: dict[str, Any]) -> dict[str, Any]:
+    # Linked lines are those in pages of the selected colors, data is assumed to begin on a page of color 0
+    # Only one period of lines is kept, whatever the data size
+    period = line_period(pattern)
+    period_linked = ((pattern['colors'] >> (arange(period, dtype=int64) * pattern['line_size'] // page_size)) & 1).astype(bool)
+    period_offsets = flatnonzero(period_linked)
+    
+    # Lines are numbered by their rank among linked lines, the visit order is a permutation of the ranks
+    period_number, remaining_lines = divmod(size // pattern['line_size'], period)
+    linked_number = period_number * len(period_offsets) + int(period_linked[:remaining_lines].sum())
+    half_bits = max(1, (max(linked_number - 1, 1).bit_length() + 1) // 2)
+    return {
+        'period': period,
+        'period_linked': period_linked,
+        'period_offsets': period_offsets,
+        'period_ranks': cumsum(period_linked) - 1,
+        'linked_number': linked_number,
+        'half_bits': half_bits,
+        'keys': generator.integers(0, 2**64, size=feistel_rounds, dtype=uint64) if pattern['name'] == chase_pattern_str else None
+    }
+
+
+def feistel_round(values: ndarray[Any, dtype[uint64]], key: uint64, half_mask: uint64) -> ndarray[Any, dtype[uint64]]:
+    # SplitMix64 finalizer of the half and the key, truncated to a half
+    mixed = values ^ key
+    mixed = (mixed ^ (mixed >> uint64(30))) * mix_multipliers[0]
+    mixed = (mixed ^ (mixed >> uint64(27))) * mix_multipliers[1]
+    return (mixed ^ (mixed >> uint64(31))) & half_mask
+
+
+def permute_ranks(ranks: ndarray[Any, dtype[int64]], links: dict[str, Any], inverse: bool = False) -> ndarray[Any, dtype[int64]]:
+    # Feistel network on 2 * half_bits bits, values outside of the ranks walk the cycle until they are back in
+    half_bits = uint64(links['half_bits'])
+    half_mask = uint64(2**links['half_bits'] - 1)
+    keys = links['keys'][::-1] if inverse else links['keys']
+    result = ranks.astype(uint64)
+    outside = ones(len(result), dtype=bool)
+    while outside.any():
+        left, right = result[outside] >> half_bits, result[outside] & half_mask
+        for key in keys:
+            if inverse:
+                left, right = right ^ feistel_round(left, key, half_mask), left
+            else:
+                left, right = right, left ^ feistel_round(right, key, half_mask)
+        walked = (left << half_bits) | right
+        result[outside] = walked
+        outside[outside] = walked >= links['linked_number']
+    return result.astype(int64)
+
+
+def next_lines(first_line: int, line_number: int, links: dict[str, Any], pattern: dict[str, Any]) -> ndarray[Any, dtype[int64]]:
+    # Next line of each line of a chunk in the visit order (stride is 1 for the chase), -1 if not linked
+    line_next = empty(line_number, dtype=int64)
+    line_next[:] = -1
+    lines = arange(first_line, first_line + line_number, dtype=int64)
+    period_number, offsets = divmod(lines, links['period'])
+    linked = links['period_linked'][offsets]
+    if links['linked_number'] == 0 or not linked.any():
+        return line_next
+    
+    ranks = period_number[linked] * len(links['period_offsets']) + links['period_ranks'][offsets[linked]]
+    if pattern['name'] == chase_pattern_str:
+        # Visiting lines in a random order is a random cyclic permutation, which defeats prefetchers
+        next_ranks = permute_ranks((permute_ranks(ranks, links, inverse=True) + 1) % links['linked_number'], links)
+    else:
+        next_ranks = (ranks + pattern['stride']) % links['linked_number']
+    
+    # Ranks back to line numbers
+    next_periods, next_offsets = divmod(next_ranks, len(links['period_offsets']))
+    line_next[linked] = next_periods * links['period'] + links['period_offsets'][next_offsets]
+    return line_next
+
+
+def data_alignment(pattern: dict[str, Any]) -> int:
+    # Colors are counted from the beginning of data, which must then begin on a page of color 0
+    if pattern['name'] == uniform_pattern_str:
+        return cache_line_size
+    return page_size * color_number(pattern)
 
 
-def generate_file(path: str):
-    random_data = generate_random_data()
-    data_str = ''
+def create_pattern(name: str = uniform_pattern_str, line_size: int = cache_line_size, llc_size: int = llc_size, llc_ways: int = llc_ways, colors: int = -1, stride: int = default_stride) -> dict[str, Any]:
+    if name == uniform_pattern_str:
+        return uniform_pattern
     
-    # Concatenate all values in string
-    nl_counter = 0
-    for value in random_data:
-        data_str += f'0x{value:02X}, '
-        nl_counter += 1
+    pattern = {
+        'name': name,
+        'line_size': line_size,
+        'llc_size': llc_size,
+        'llc_ways': llc_ways,
+        'colors': colors,
+        'stride': stride
+    }
+    
+    # By default all colors are used
+    if colors < 0:
+        pattern['colors'] = 2**color_number(pattern) - 1
+    return pattern
+
+
+def generate_data_chunks(size: int, generator: random.Generator, pattern: dict[str, Any] = uniform_pattern) -> Iterator[ndarray[Any, dtype[uint8]]]:
+    links = None
+    if pattern['name'] != uniform_pattern_str:
+        links = line_links(size, generator, pattern)
+        lines_per_chunk = chunk_size // pattern['line_size']
+    
+    for chunk_begin in range(0, size, chunk_size):
+        chunk = generator.integers(low=value_min, high=value_max, size=(min(chunk_size, size - chunk_begin)), dtype=uint8)
         
-        if nl_counter == 16:
-            nl_counter = 0
-            data_str += '\n\t'
+        # The byte offset of the next line is written at the beginning of each linked line
+        if links is not None:
+            first_line = chunk_begin // pattern['line_size']
+            chunk_next = next_lines(first_line, min(lines_per_chunk, size // pattern['line_size'] - first_line), links, pattern)
+            linked = chunk_next >= 0
+            lines = chunk[:len(chunk_next) * pattern['line_size']].reshape(len(chunk_next), pattern['line_size'])
+            lines[linked, :pointer_size] = (chunk_next[linked] * pattern['line_size']).astype('<u4').view(uint8).reshape(-1, pointer_size)
         
+        yield chunk
+
+
+def format_chunk(data: ndarray[Any, dtype[uint8]]) -> ndarray[Any, dtype[uint8]]:
+    line_number, remaining = divmod(len(data), values_per_line)
+    line_data_size = line_number * values_per_line
     
+    # Output is allocated once: complete lines of 16 values, then the incomplete last line
+    formatted = empty(line_number * line_size + remaining * hex_value_size, dtype=uint8)
+    lines = formatted[:line_number * line_size].reshape(line_number, line_size)
+    
+    # Values are bytes, they directly index the hexadecimal table
+    take(hex_table, data[:line_data_size].reshape(line_number, values_per_line), out=lines[:, :-len(line_end)].view(hex_table.dtype), mode='clip')
+    lines[:, -len(line_end):] = line_end
+    
+    # Fill the incomplete last line
+    take(hex_table, data[line_data_size:], out=formatted[line_number * line_size:].view(hex_table.dtype), mode='clip')
+    
+    return formatted
+
+
+def format_data(data: ndarray[Any, dtype[uint8]]) -> ndarray[Any, dtype[uint8]]:
     # Remove last space and comma
-    data_str = data_str[:-2]
+    return format_chunk(data)[:-2]
+
+
+def fan_out(executor: ThreadPoolExecutor, files: list[OutputFile]) -> Callable[[Any], None]:
+    # The same buffer is written to all files at once, writes release the GIL
+    def write(data: Any):
+        list(executor.map(lambda file: file.write(data), files))
+    return write
+
+
+def write_formatted_data(write: Callable[[Any], None], chunks: Iterator[ndarray[Any, dtype[uint8]]]):
+    # A chunk is written when the next one is known, the last one loses its last space and comma
+    previous_chunk = None
+    for chunk in chunks:
+        if previous_chunk is not None:
+            write(format_chunk(previous_chunk))
+        previous_chunk = chunk
     
-    # Add to template
-    appdata_h_file = appdata_h_template.format(data=data_str)
+    if previous_chunk is not None:
+        write(format_data(previous_chunk))
+
+
+def generate_files(paths: list[str], size: int = data_size, seed: int = data_seed, pattern: dict[str, Any] = uniform_pattern):
+    generator = random.Generator(random.PCG64(seed))
+    
+    # Split template around data to write the formatted bytes as they are
+    template_begin, template_end = appdata_h_template.split('{data:s}')
     
-    # If file exist then override it
-    file = open(path, 'w')
-    file.write(appdata_h_file)
+    # Data is formatted once for all files, existing files are only replaced once complete and if different
+    files = [open_output(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=len(files)) as executor:
+        try:
+            write = fan_out(executor, files)
+            write(template_begin.format().encode('ascii'))
+            write_formatted_data(write, generate_data_chunks(size, generator, pattern))
+            write(template_end.format().encode('ascii'))
+        except BaseException:
+            for file in files:
+                file.discard()
+            raise
+        
+        list(executor.map(OutputFile.close, files))
 
 
-def generate_freertos():
-    generate_file(freertos_path)
+def binary_paths(path: str) -> tuple[str, str]:
+    base_path = os.path.splitext(path)[0]
+    return base_path + '.bin', base_path + '.S'
+
+
+def generate_binary_files(paths: list[str], size: int = data_size, seed: int = data_seed, pattern: dict[str, Any] = uniform_pattern):
+    generator = random.Generator(random.PCG64(seed))
     
+    # Write raw bytes directly from each chunk, binary files are put next to the headers
+    files = [open_output(binary_paths(path)[0]) for path in paths]
+    with ThreadPoolExecutor(max_workers=len(files)) as executor:
+        try:
+            write = fan_out(executor, files)
+            for chunk in generate_data_chunks(size, generator, pattern):
+                write(chunk)
+        except BaseException:
+            for file in files:
+                file.discard()
+            raise
+        
+        list(executor.map(OutputFile.close, files))
     
-def generate_baremetal():
-    generate_file(baremetal_path)
+    for path in paths:
+        binary_path, stub_path = binary_paths(path)
+        
+        # Assembly stub including the binary file in the image, found through the include path so the stub does not depend on the checkout
+        appdata_s_file = appdata_s_template.format(binary_path=os.path.basename(binary_path), alignment=data_alignment(pattern))
+        write_if_changed(stub_path, appdata_s_file)
+        
+        # Header only declares the symbol defined by the stub
+        appdata_h_file = appdata_bin_h_template.format(binary_name=os.path.basename(binary_path), stub_name=os.path.basename(stub_path), size=size)
+        write_if_changed(path, appdata_h_file)
+
+
+def benchmark():
+    print(f'{"size (B)":>12s} {"time (s)":>10s} {"ns/byte":>8s}')
+    for size in benchmark_sizes:
+        random_data = generate_random_data(size=size)
+        
+        # Keep the best run to not measure the allocator warming up
+        elapsed = float('inf')
+        for _ in range(0, benchmark_repeat):
+            start = time.perf_counter()
+            format_data(random_data)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        
+        # A constant time per byte means a linear scaling
+        print(f'{size:12d} {elapsed:10.4f} {elapsed * 1e9 / size:8.2f}')
+
+
+def data_parameters(mode: str, size: int, seed: int, pattern: dict[str, Any]) -> dict[str, Any]:
+    # Everything that changes the generated files must be in there
+    return {
+        'version': manifest_version,
+        'mode': mode,
+        'size': size,
+        'seed': seed,
+        'pattern': pattern,
+        'value_min': value_min,
+        'value_max': value_max,
+        'chunk_size': chunk_size,
+        'bit_generator': random.PCG64.__name__
+    }
+
+
+def parameters_hash(parameters: dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def output_paths(path: str, mode: str) -> list[str]:
+    if mode == binary_str:
+        return [path, *binary_paths(path)]
+    return [path]
+
+
+def is_up_to_date(path: str, mode: str, digest: str) -> bool:
+    manifest_path = os.path.splitext(path)[0] + manifest_extension
+    if not all(os.path.exists(output_path) for output_path in output_paths(path, mode)):
+        return False
+    
+    try:
+        file = open(manifest_path, 'r')
+        manifest = json.load(file)
+        file.close()
+    except (OSError, ValueError):
+        return False
+    
+    return manifest.get('hash') == digest
+
+
+def write_manifest(path: str, parameters: dict[str, Any], digest: str):
+    manifest_path = os.path.splitext(path)[0] + manifest_extension
+    write_if_changed(manifest_path, json.dumps({'hash': digest, 'parameters': parameters}, indent=4, sort_keys=True) + '\n')
+
+
+def generate_targets(paths: list[str], mode: str = text_str, size: int = data_size, seed: int = data_seed, force: bool = False, distinct: bool = False, pattern: dict[str, Any] = uniform_pattern):
+    # By default all targets share the same payload, else each target has its own seed
+    if distinct:
+        jobs = [([path], seed + path_index) for path_index, path in enumerate(paths)]
+    else:
+        jobs = [(paths, seed)]
+    
+    for job_paths, job_seed in jobs:
+        parameters = data_parameters(mode, size, job_seed, pattern)
+        digest = parameters_hash(parameters)
+        
+        # Nothing to do if files were generated with the same parameters, the guest will not be rebuilt
+        outdated_paths = []
+        for path in job_paths:
+            if not force and is_up_to_date(path, mode, digest):
+                print(f'{path:s} is up to date, skipping...')
+            else:
+                outdated_paths.append(path)
+        
+        if outdated_paths:
+            generators[mode](outdated_paths, size, job_seed, pattern)
+            for path in outdated_paths:
+                write_manifest(path, parameters, digest)
+
+
+def generate_freertos(mode: str = text_str, size: int = data_size, seed: int = data_seed, force: bool = False, pattern: dict[str, Any] = uniform_pattern):
+    generate_targets([freertos_path], mode, size, seed, force, pattern=pattern)
+
+
+def generate_baremetal(mode: str = text_str, size: int = data_size, seed: int = data_seed, force: bool = False, pattern: dict[str, Any] = uniform_pattern):
+    generate_targets([baremetal_path], mode, size, seed, force, pattern=pattern)
+
+
+# Generator for each output mode
+generators = {
+    text_str: generate_files,
+    binary_str: generate_binary_files
+}
+
+
+def parse_size(size_str: str) -> int:
+    # Size in bytes, with an optional K, M or G suffix
+    unit = size_units.get(size_str[-1:].lower(), 1)
+    if unit != 1:
+        size_str = size_str[:-1]
+    
+    try:
+        size = int(size_str, 0) * unit
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid size: {size_str!r}')
+    
+    if size <= 0:
+        raise argparse.ArgumentTypeError('size must be greater than 0')
+    return size
 
 
 def main():
     # The 1st argument will tell if we generate random data for baremetal, FreeRTOS or both
-    argv = sys.argv
-    if len(argv) != 2:
-        print('There must be exactly one argument for the data generator')
-        print(f'Possible values are {freertos_str:s}, {baremetal_str:s} or {both_str:s}')
-        exit(1)
+    # The optional 2nd argument tells if data is written as a C array or as a binary file
+    parser = argparse.ArgumentParser(description='Random data generator for the FreeRTOS and baremetal guests')
+    parser.add_argument('target', type=str.lower, choices=[freertos_str, baremetal_str, both_str, benchmark_str])
+    parser.add_argument('mode', type=str.lower, choices=list(generators.keys()), nargs='?', default=text_str)
+    parser.add_argument('--size', type=parse_size, default=data_size, help=f'number of bytes to generate, K, M and G suffixes are accepted (by default {data_size:d})')
+    parser.add_argument('--seed', type=int, default=data_seed, help=f'seed of the random generator (by default {data_seed:d})')
+    parser.add_argument('--force', action='store_true', help='regenerate files even if their manifest matches')
+    parser.add_argument('--path', action='append', default=[], help='other header to generate with the same payload (can be repeated)')
+    parser.add_argument('--distinct', action='store_true', help='give each target its own payload instead of the same one')
+    parser.add_argument('--pattern', type=str.lower, choices=pattern_names, default=uniform_pattern_str, help='access pattern linking cache lines (by default uniform random bytes)')
+    parser.add_argument('--line-size', type=parse_size, default=cache_line_size, help=f'cache line size in bytes (by default {cache_line_size:d})')
+    parser.add_argument('--llc-size', type=parse_size, default=llc_size, help=f'last level cache size in bytes (by default {llc_size:d})')
+    parser.add_argument('--llc-ways', type=int, default=llc_ways, help=f'last level cache associativity (by default {llc_ways:d})')
+    parser.add_argument('--colors', type=lambda colors: int(colors, 0), default=-1, help='bitmap of the colors the pattern stays in, same format as in the configuration (by default all colors)')
+    parser.add_argument('--stride', type=int, default=default_stride, help=f'stride between linked lines, for the stride pattern (by default {default_stride:d})')
+    arguments = parser.parse_args()
+    
+    # Data is generated once and written to all targets
+    target = arguments.target
+    if target == benchmark_str:
+        benchmark()
+        return
+    
+    target_paths = {
+        freertos_str: [freertos_path],
+        baremetal_str: [baremetal_path],
+        both_str: [freertos_path, baremetal_path]
+    }
+    paths = target_paths[target] + arguments.path
+    
+    # Lines are linked with 32 bits offsets and chunks must contain complete lines
+    if arguments.pattern != uniform_pattern_str:
+        if arguments.line_size < pointer_size or chunk_size % arguments.line_size != 0:
+            parser.error(f'line size must be a power of 2 between {pointer_size:d} and {chunk_size:d}')
+        if arguments.size > 2**(8 * pointer_size):
+            parser.error('linked patterns cannot be larger than 4 GiB')
         
-    target = argv[1].lower()
-    if target == freertos_str:
-        generate_freertos()
-    elif target == baremetal_str:
-        generate_baremetal()
-    elif target == both_str:
-        generate_freertos()
-        generate_baremetal()
-    else:
-        print('Invalid argument...')
-        print(f'Possible values are {freertos_str:s}, {baremetal_str:s} or {both_str:s}')
-        exit(1)
+        # Colors are whole pages of each way of the LLC, the bitmap can only use these colors
+        if arguments.llc_ways <= 0 or arguments.llc_size < arguments.llc_ways * page_size:
+            parser.error(f'the LLC must have at least one page ({page_size:d} bytes) per way')
+        colors = arguments.llc_size // (arguments.llc_ways * page_size)
+        if arguments.colors != -1 and (arguments.colors <= 0 or arguments.colors >> colors != 0):
+            parser.error(f'colors must be a bitmap of at least one of the {colors:d} colors of the LLC (0x1 to {2**colors - 1:#x})')
+        if arguments.pattern == stride_pattern_str and arguments.stride == 0:
+            parser.error('stride cannot be 0, every line would point to itself')
+    
+    pattern = create_pattern(arguments.pattern, arguments.line_size, arguments.llc_size, arguments.llc_ways, arguments.colors, arguments.stride)
+    generate_targets(paths, arguments.mode, arguments.size, arguments.seed, arguments.force, arguments.distinct, pattern)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
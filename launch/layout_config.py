@@ -0,0 +1,178 @@
+# Imports
+import argparse
+from typing import Optional
+from config_model import Configuration, VmConfig, max_colors
+from board_database import load_boards
+
+# Constants
+page_size = 0x1000
+block_size = 0x200000
+
+# A colored region is made of pages of all colors, one page per color at least
+color_granule = page_size * max_colors
+
+# VM addresses go up to 4 GiB, GIC registers of the VM are 64 KiB (redistributors are 128 KiB per CPU, the PLIC 64 MiB)
+guest_memory_end = 2**32
+gic_size = 0x10000
+gicr_size = 0x20000
+plic_size = 0x4000000
+
+# Allocation strategies
+first_fit_str = 'first_fit'
+best_fit_str = 'best_fit'
+strategies = [first_fit_str, best_fit_str]
+
+
+def platform_memory_size(platform_name: str) -> Optional[int]:
+    # Physical memory of the platform given to Bao, when the board database knows it
+    return load_boards().get(platform_name, {}).get('memory_size')
+
+
+def align_up(value: int, alignment: int) -> int:
+    return -(-value // alignment) * alignment
+
+
+def reserve(free: list[tuple[int, int]], base: int, size: int) -> list[tuple[int, int]]:
+    # Remove [base, base + size) from the sorted free intervals
+    end = base + size
+    remaining = []
+    for free_base, free_end in free:
+        if free_end <= base or free_base >= end:
+            remaining.append((free_base, free_end))
+            continue
+        if free_base < base:
+            remaining.append((free_base, base))
+        if free_end > end:
+            remaining.append((end, free_end))
+    return remaining
+
+
+def allocate(free: list[tuple[int, int]], size: int, alignment: int, strategy: str = first_fit_str) -> Optional[int]:
+    # First fit takes the lowest hole, best fit the smallest one (the lowest among equal holes)
+    chosen = None
+    chosen_waste = None
+    for free_base, free_end in free:
+        base = align_up(free_base, alignment)
+        if base + size > free_end:
+            continue
+        
+        waste = free_end - base - size
+        if strategy == first_fit_str:
+            return base
+        if chosen is None or waste < chosen_waste:
+            chosen = base
+            chosen_waste = waste
+    
+    return chosen
+
+
+def fragmentation(free: list[tuple[int, int]]) -> float:
+    # External fragmentation: part of the free memory that is not in the largest hole
+    total = sum(free_end - free_base for free_base, free_end in free)
+    if total == 0:
+        return 0.0
+    return 1 - max(free_end - free_base for free_base, free_end in free) / total
+
+
+def region_alignment(vm: VmConfig) -> int:
+    # Colored memory is mapped page by page, else regions are mapped with stage-2 blocks
+    if vm.colors is not None:
+        return color_granule
+    return block_size
+
+
+def free_address_space(vm: VmConfig, cpu_number: int) -> list[tuple[int, int]]:
+    free = [(0, guest_memory_end)]
+    
+    # Devices, GIC registers and everything already placed are taken
+    for device in vm.devices:
+        free = reserve(free, device.va - device.va % page_size, align_up(device.size + device.va % page_size, page_size))
+    for gic_name, gic_address in vm.gic.items():
+        free = reserve(free, gic_address, gicr_size * cpu_number if gic_name == 'gicr' else plic_size if gic_name == 'plic' else gic_size)
+    for region in vm.regions:
+        if region.base is not None:
+            free = reserve(free, region.base, region.size)
+    for ipc in vm.ipcs:
+        if ipc.base is not None:
+            free = reserve(free, ipc.base, ipc.size)
+    
+    return free
+
+
+def place_vm(vm: VmConfig, cpu_number: int, strategy: str = first_fit_str) -> float:
+    free = free_address_space(vm, cpu_number)
+    
+    # Biggest first, they are the hardest to place
+    alignment = region_alignment(vm)
+    for region in sorted((region for region in vm.regions if region.base is None), key=lambda region: -region.size):
+        region.base = allocate(free, region.size, alignment, strategy)
+        if region.base is None:
+            raise ValueError(f'{vm.image_name:s}: no room for a region of 0x{region.size:x} bytes')
+        free = reserve(free, region.base, region.size)
+    
+    for ipc in sorted((ipc for ipc in vm.ipcs if ipc.base is None), key=lambda ipc: -ipc.size):
+        ipc.base = allocate(free, align_up(ipc.size, page_size), page_size, strategy)
+        if ipc.base is None:
+            raise ValueError(f'{vm.image_name:s}: no room for an IPC of 0x{ipc.size:x} bytes')
+        free = reserve(free, ipc.base, align_up(ipc.size, page_size))
+    
+    return fragmentation(free)
+
+
+def place_configuration(configuration: Configuration, strategy: str = first_fit_str) -> list[float]:
+    # Regions and IPCs without base are placed in the address space of their VM
+    if strategy not in strategies:
+        raise ValueError(f'Unknown allocation strategy {strategy:s}, valid strategies are {", ".join(strategies):s}')
+    return [place_vm(vm, configuration.cpu_number, strategy) for vm in configuration.vms]
+
+
+def physical_footprint(configuration: Configuration) -> int:
+    # A region with k colors out of 16 spreads over 16/k times its size of physical memory
+    footprint = sum(align_up(shmem_size, page_size) for shmem_size in configuration.shmem_sizes)
+    for vm in configuration.vms:
+        for region in vm.regions:
+            if vm.colors:
+                footprint += align_up(region.size, color_granule) * max_colors // bin(vm.colors).count('1')
+            else:
+                footprint += align_up(region.size, page_size)
+    return footprint
+
+
+def describe_layout(configuration: Configuration) -> list[str]:
+    lines = []
+    for vm in configuration.vms:
+        free = free_address_space(vm, configuration.cpu_number)
+        used = sorted([(region.base, region.size, 'region') for region in vm.regions] + [(ipc.base, ipc.size, f'IPC (shmem {ipc.shmem_id:d})') for ipc in vm.ipcs])
+        lines.append(f'{vm.image_name:s}: largest hole 0x{max(free_end - free_base for free_base, free_end in free):x}, fragmentation {fragmentation(free):.1%}')
+        for base, size, label in used:
+            lines.append(f'    0x{base:08x}-0x{base + size:08x} {label:s}')
+    
+    footprint = physical_footprint(configuration)
+    memory_size = platform_memory_size(configuration.platform)
+    if memory_size is not None:
+        lines.append(f'Physical memory: 0x{footprint:x} out of 0x{memory_size:x} bytes ({footprint / memory_size:.1%})')
+    else:
+        lines.append(f'Physical memory: 0x{footprint:x} bytes')
+    return lines
+
+
+def main():
+    from parse_config import load_configuration
+    
+    parser = argparse.ArgumentParser(description='Show the memory layout of configuration files')
+    parser.add_argument('paths', nargs='+', help='configuration files')
+    arguments = parser.parse_args()
+    
+    for path in arguments.paths:
+        try:
+            configuration = load_configuration(path)
+        except (OSError, ValueError) as error:
+            print(error)
+            exit(1)
+        
+        print(f'{configuration.name:s} ({configuration.platform:s})')
+        for line in describe_layout(configuration):
+            print(f'    {line:s}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+# Imports
+import argparse
+import codecs
+import glob
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+import numpy
+from generate_config import config_folder
+from parse_logs import LogParser, log_folder, log_key, log_name_regex, read_size
+from log_statistics import default_percentiles, percentile_name
+
+# Constants
+default_port = 8765
+default_interval = 2.0
+
+# Logs are followed if they changed in the last hour (0 to follow all logs of the folder)
+default_recent_time = 3600
+
+# A log without new data for this long is shown as stalled
+default_stall_time = 60
+
+# Quantiles are within 1% of the true value, whatever the number of samples
+default_relative_accuracy = 0.01
+live_percentiles = (50,) + default_percentiles
+
+# Log states
+running_str = 'running'
+stalled_str = 'stalled'
+closed_str = 'closed'
+
+
+# Running min, max, mean and variance of a stream of values (Welford, batches are merged with Chan's formula)
+class RunningStatistics:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+    
+    def merge(self, count: int, mean: float, m2: float, minimum: int, maximum: int):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.minimum = minimum if self.minimum is None else min(self.minimum, minimum)
+        self.maximum = maximum if self.maximum is None else max(self.maximum, maximum)
+    
+    def add(self, values: numpy.ndarray):
+        if len(values) == 0:
+            return
+        samples = values.astype(numpy.float64)
+        mean = samples.mean()
+        deviations = samples - mean
+        self.merge(len(samples), float(mean), float(numpy.dot(deviations, deviations)), int(values.min()), int(values.max()))
+    
+    def add_statistics(self, other: 'RunningStatistics'):
+        self.merge(other.count, other.mean, other.m2, other.minimum, other.maximum)
+    
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count > 0 else math.nan
+
+
+# Streaming quantiles with a bounded relative error: values are counted in logarithmic buckets (like DDSketch)
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = default_relative_accuracy):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        
+        # Execution times are positive, anything below 1 is counted as 0
+        self.zero_count = 0
+        self.count = 0
+    
+    def add(self, values: numpy.ndarray):
+        positive = values[values >= 1].astype(numpy.float64)
+        self.zero_count += len(values) - len(positive)
+        self.count += len(values)
+        indices, counts = numpy.unique(numpy.ceil(numpy.log(positive) / self.log_gamma).astype(numpy.int64), return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            self.buckets[index] = self.buckets.get(index, 0) + count
+    
+    def add_sketch(self, other: 'QuantileSketch'):
+        self.zero_count += other.zero_count
+        self.count += other.count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+    
+    def quantile(self, percentile: float) -> float:
+        if self.count == 0:
+            return math.nan
+        
+        # Middle of the bucket holding the rank, within the relative accuracy of the value
+        rank = (self.count - 1) * percentile / 100
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma**index / (self.gamma + 1)
+        return 2 * self.gamma**max(self.buckets) / (self.gamma + 1)
+
+
+# Statistics of one variable (one task), for one log or merged for a configuration
+class LiveVariable:
+    def __init__(self, relative_accuracy: float = default_relative_accuracy):
+        self.statistics = RunningStatistics()
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.arrays = 0
+    
+    def add(self, values: numpy.ndarray):
+        self.statistics.add(values)
+        self.sketch.add(values)
+    
+    def add_variable(self, other: 'LiveVariable'):
+        self.statistics.add_statistics(other.statistics)
+        self.sketch.add_sketch(other.sketch)
+        self.arrays += other.arrays
+    
+    def summary(self) -> dict[str, Any]:
+        summary = {
+            'arrays': self.arrays,
+            'count': self.statistics.count,
+            'min': self.statistics.minimum,
+            'max': self.statistics.maximum,
+            'mean': self.statistics.mean if self.statistics.count > 0 else None,
+            'stddev': math.sqrt(self.statistics.variance()) if self.statistics.count > 0 else None
+        }
+        # Bucket middles can be past the extreme values
+        for percentile in live_percentiles:
+            summary[percentile_name(percentile)] = min(max(self.sketch.quantile(percentile), self.statistics.minimum), self.statistics.maximum) if self.sketch.count > 0 else None
+        return summary
+
+
+# Log being written, read from where the previous poll stopped
+class LogTail:
+    def __init__(self, path: str, config_names: Optional[list[str]] = None, relative_accuracy: float = default_relative_accuracy):
+        self.path = path
+        self.key = log_key(path, config_names)
+        self.relative_accuracy = relative_accuracy
+        self.closed = False
+        self.last_data = None
+        self.reset()
+    
+    def reset(self):
+        self.identity = None
+        self.offset = 0
+        self.parser = LogParser()
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.variables = {}
+        self.scalars = {}
+        self.comments = 0
+    
+    def apply(self, events: list[tuple]):
+        for event in events:
+            if event[0] == 'values':
+                if event[1] not in self.variables:
+                    self.variables[event[1]] = LiveVariable(self.relative_accuracy)
+                self.variables[event[1]].add(event[2])
+            elif event[0] == 'end':
+                self.variables.setdefault(event[1], LiveVariable(self.relative_accuracy)).arrays += 1
+            elif event[0] == 'scalar':
+                self.scalars[event[1]] = event[2]
+            elif event[0] == 'comment':
+                self.comments += 1
+    
+    def poll(self):
+        try:
+            status = os.stat(self.path)
+        except FileNotFoundError:
+            # Removed, or compressed once the capture ended: what was printed last is kept
+            self.apply(self.parser.finish())
+            self.closed = True
+            return
+        
+        # A log written again from the start (same name, new file or truncated) is followed from the start
+        identity = (status.st_dev, status.st_ino)
+        if self.identity is not None and (identity != self.identity or status.st_size < self.offset):
+            self.reset()
+        self.identity = identity
+        if status.st_size == self.offset:
+            return
+        
+        file = open(self.path, 'rb')
+        file.seek(self.offset)
+        piece = file.readline(read_size)
+        while piece:
+            self.offset += len(piece)
+            self.apply(self.parser.feed(self.decoder.decode(piece)))
+            piece = file.readline(read_size)
+        file.close()
+        self.last_data = time.time()
+    
+    def state(self, stall_time: float) -> str:
+        if self.closed:
+            return closed_str
+        if self.last_data is None or time.time() - self.last_data > stall_time:
+            return stalled_str
+        return running_str
+    
+    def summary(self, stall_time: float) -> dict[str, Any]:
+        return {
+            **self.key,
+            'state': self.state(stall_time),
+            'size': self.offset,
+            'idle': time.time() - self.last_data if self.last_data is not None else None,
+            'array': self.parser.array_name,
+            'comments': self.comments,
+            'scalars': dict(self.scalars),
+            'variables': {name: variable.summary() for name, variable in sorted(self.variables.items())}
+        }
+
+
+# Statistics of all logs being written in a folder, updated by polls and read by the HTTP server
+class LiveStatistics:
+    def __init__(self, folder: str = log_folder, recent_time: float = default_recent_time, stall_time: float = default_stall_time, relative_accuracy: float = default_relative_accuracy):
+        self.folder = folder
+        self.recent_time = recent_time
+        self.stall_time = stall_time
+        self.relative_accuracy = relative_accuracy
+        self.config_names = os.listdir(config_folder) if os.path.isdir(config_folder) else []
+        self.tails = {}
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+    
+    def update(self):
+        # New logs are followed as soon as they appear, old logs only if they changed recently
+        for path in sorted(glob.glob(os.path.join(self.folder, '*.log'))):
+            if path in self.tails and not self.tails[path].closed:
+                continue
+            if not log_name_regex.fullmatch(os.path.basename(path)):
+                continue
+            if path not in self.tails and self.recent_time:
+                try:
+                    if os.path.getmtime(path) < self.start_time - self.recent_time:
+                        continue
+                except FileNotFoundError:
+                    continue
+            
+            # A closed log written again is a new log
+            tail = LogTail(path, self.config_names, self.relative_accuracy)
+            with self.lock:
+                self.tails[path] = tail
+        
+        for tail in list(self.tails.values()):
+            if not tail.closed:
+                with self.lock:
+                    tail.poll()
+    
+    def groups(self) -> dict[tuple[str, str, str], LiveVariable]:
+        # Statistics of each variable (task) of each configuration, all its logs together
+        groups = {}
+        for tail in self.tails.values():
+            for name, variable in tail.variables.items():
+                key = (tail.key['config'], tail.key['main'], name)
+                if key not in groups:
+                    groups[key] = LiveVariable(self.relative_accuracy)
+                groups[key].add_variable(variable)
+        return groups
+    
+    def snapshot(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                'time': time.time(),
+                'folder': self.folder,
+                'configs': [{'config': config, 'main': main, 'variable': name, **variable.summary()} for (config, main, name), variable in sorted(self.groups().items())],
+                'logs': [tail.summary(self.stall_time) for _, tail in sorted(self.tails.items())]
+            }
+
+
+def format_value(value: Optional[float]) -> str:
+    return '-' if value is None or (isinstance(value, float) and math.isnan(value)) else f'{value:.6g}'
+
+
+def describe_snapshot(snapshot: dict[str, Any]) -> list[str]:
+    statistic_names = ['count', 'min', 'max', 'mean', 'stddev'] + [percentile_name(percentile) for percentile in live_percentiles]
+    lines = ['config/main variable arrays ' + ' '.join(statistic_names)]
+    for group in snapshot['configs']:
+        statistics = ' '.join(format_value(group[name]) for name in statistic_names)
+        lines.append(f'{group["config"]:s}/{group["main"] or "-":s} {group["variable"]:s} {group["arrays"]:d} {statistics:s}')
+    
+    lines.append('')
+    for log in snapshot['logs']:
+        idle = f'{log["idle"]:.0f}s ago' if log['idle'] is not None else 'nothing yet'
+        array = f', printing {log["array"]:s}' if log['array'] is not None else ''
+        lines.append(f'{log["log"]:s}: {log["state"]:s} ({log["size"]:d} bytes, last data {idle:s}{array:s})')
+    return lines
+
+
+def statistics_handler(live: LiveStatistics) -> type:
+    # Statistics as JSON on /statistics.json, as text on /
+    class StatisticsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/statistics.json':
+                content, content_type = json.dumps(live.snapshot(), indent=4).encode('utf-8'), 'application/json'
+            elif self.path == '/':
+                content, content_type = ('\n'.join(describe_snapshot(live.snapshot())) + '\n').encode('utf-8'), 'text/plain; charset=utf-8'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        
+        def log_message(self, format: str, *args: Any):
+            pass
+    
+    return StatisticsHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Statistics of the benchmark logs being written, updated as the logs grow')
+    parser.add_argument('--folder', default=log_folder, help=f'folder of the logs (by default {log_folder:s})')
+    parser.add_argument('--port', type=int, default=default_port, help=f'port of the local HTTP server (by default {default_port:d})')
+    parser.add_argument('--no-http', action='store_true', help='do not start the HTTP server')
+    parser.add_argument('--terminal', action='store_true', help='show the statistics in the terminal')
+    parser.add_argument('--interval', type=float, default=default_interval, help=f'seconds between two reads of the logs (by default {default_interval:g})')
+    parser.add_argument('--recent', type=float, default=default_recent_time, help=f'also follow logs changed in the last seconds, 0 for all logs (by default {default_recent_time:d})')
+    parser.add_argument('--stall', type=float, default=default_stall_time, help=f'seconds without data after which a log is stalled (by default {default_stall_time:d})')
+    parser.add_argument('--once', action='store_true', help='read the logs once, show the statistics and exit')
+    arguments = parser.parse_args()
+    
+    live = LiveStatistics(arguments.folder, arguments.recent, arguments.stall)
+    if arguments.once:
+        live.update()
+        print('\n'.join(describe_snapshot(live.snapshot())))
+        return
+    
+    server = None
+    if not arguments.no_http:
+        try:
+            server = ThreadingHTTPServer(('127.0.0.1', arguments.port), statistics_handler(live))
+        except OSError as error:
+            print(error)
+            exit(1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f'Statistics on http://127.0.0.1:{arguments.port:d}/ and http://127.0.0.1:{arguments.port:d}/statistics.json')
+    
+    try:
+        while True:
+            live.update()
+            if arguments.terminal:
+                # Screen cleared and statistics drawn again
+                print('\033[H\033[J' + '\n'.join(describe_snapshot(live.snapshot())), flush=True)
+            time.sleep(arguments.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.shutdown()
+
+if __name__ == '__main__':
+    main()
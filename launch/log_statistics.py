@@ -0,0 +1,194 @@
+# Imports
+import argparse
+import time
+from typing import Any, Optional
+import numpy
+from parse_logs import store_folder, store_version, load_metadata, load_variable, select_logs
+from analysis_cache import cache_folder, default_cache_limit, cache_key, load_cached, store_cached, evict_cache
+
+# Constants
+default_variable = 'elapsed_time_array'
+default_percentiles = (99, 99.9)
+
+# Increased when statistics change, cached statistics are computed again
+statistics_version = 1
+
+# Columns describing where each sample array comes from
+key_columns = ['log', 'config', 'main', 'date', 'run', 'assignment']
+
+# Statistics are tables of columns, one row per printed sample array
+Table = dict[str, numpy.ndarray]
+
+
+def segment_starts(lengths: numpy.ndarray) -> numpy.ndarray:
+    return numpy.concatenate(([0], numpy.cumsum(lengths)[:-1])).astype(numpy.int64)
+
+
+def percentile_name(percentile: float) -> str:
+    return f'p{percentile:g}'
+
+
+def segment_percentiles(sorted_values: numpy.ndarray, starts: numpy.ndarray, lengths: numpy.ndarray, percentile: float) -> numpy.ndarray:
+    # Linear interpolation between closest ranks, like numpy.percentile, for every segment at once
+    positions = (lengths - 1) * (percentile / 100)
+    lower = numpy.floor(positions).astype(numpy.int64)
+    upper = numpy.minimum(lower + 1, lengths - 1)
+    fraction = positions - lower
+    lower_values = sorted_values[starts + lower].astype(numpy.float64)
+    upper_values = sorted_values[starts + upper].astype(numpy.float64)
+    return lower_values + (upper_values - lower_values) * fraction
+
+
+def ragged_statistics(values: numpy.ndarray, lengths: numpy.ndarray, percentiles: tuple[float, ...] = default_percentiles) -> Table:
+    # Statistics of each segment of values (lengths[i] values for segment i), empty segments give NaN
+    lengths = numpy.asarray(lengths, dtype=numpy.int64)
+    starts = segment_starts(lengths)
+    filled = lengths > 0
+    filled_starts = starts[filled]
+    filled_lengths = lengths[filled]
+    
+    table = {'count': lengths}
+    for name in ['min', 'max', 'mean', 'stddev'] + [percentile_name(percentile) for percentile in percentiles]:
+        table[name] = numpy.full(len(lengths), numpy.nan)
+    if not filled.any():
+        return table
+    
+    # Every reduction runs over all segments in one call, float sums avoid overflows of squares
+    samples = numpy.asarray(values, dtype=numpy.float64)
+    sums = numpy.add.reduceat(samples, filled_starts)
+    means = numpy.zeros(len(lengths))
+    means[filled] = sums / filled_lengths
+    deviations = samples - numpy.repeat(means, lengths)
+    table['min'][filled] = numpy.minimum.reduceat(samples, filled_starts)
+    table['max'][filled] = numpy.maximum.reduceat(samples, filled_starts)
+    table['mean'][filled] = means[filled]
+    table['stddev'][filled] = numpy.sqrt(numpy.add.reduceat(deviations * deviations, filled_starts) / filled_lengths)
+    
+    # Sorted within segments: segments stay in order, values are sorted inside each of them
+    segments = numpy.repeat(numpy.arange(len(lengths)), lengths)
+    sorted_values = samples[numpy.lexsort((samples, segments))]
+    for percentile in percentiles:
+        table[percentile_name(percentile)][filled] = segment_percentiles(sorted_values, filled_starts, filled_lengths, percentile)
+    
+    return table
+
+
+def high_water_marks(values: numpy.ndarray, lengths: numpy.ndarray) -> numpy.ndarray:
+    # WCET observed after each execution (running maximum inside each segment)
+    samples = numpy.asarray(values, dtype=numpy.int64)
+    if len(samples) == 0:
+        return samples
+    
+    # Segments are shifted above each other so that one running maximum does not cross segments
+    lengths = numpy.asarray(lengths, dtype=numpy.int64)
+    span = int(samples.max() - samples.min()) + 1
+    offsets = numpy.repeat(numpy.arange(len(lengths), dtype=numpy.int64) * span, lengths)
+    shifted = samples - samples.min() + offsets
+    return numpy.maximum.accumulate(shifted) - offsets + samples.min()
+
+
+def compute_statistics(rows: list[dict[str, Any]], variable: str, store: str, percentiles: tuple[float, ...]) -> list[Table]:
+    # Statistics of the arrays of each log, computed in one batch for all logs
+    all_values = []
+    all_lengths = []
+    for row in rows:
+        values, lengths = load_variable(row, variable, store)
+        all_values.append(values)
+        all_lengths.append(lengths)
+    if not rows:
+        return []
+    
+    statistics = ragged_statistics(numpy.concatenate(all_values), numpy.concatenate(all_lengths), percentiles)
+    bounds = numpy.cumsum([0] + [len(lengths) for lengths in all_lengths])
+    return [{name: column[bounds[index]:bounds[index + 1]] for name, column in statistics.items()} for index in range(0, len(rows))]
+
+
+def statistics_key(row: dict[str, Any], variable: str, percentiles: tuple[float, ...]) -> str:
+    return cache_key(row['source_hash'], row['log'], variable, tuple(percentiles), store_version, statistics_version)
+
+
+def statistics_table(rows: list[dict[str, Any]], variable: str = default_variable, store: str = store_folder, percentiles: tuple[float, ...] = default_percentiles, cache: Optional[str] = cache_folder, cache_limit: int = default_cache_limit) -> Table:
+    # Statistics of every assignment of the variable in all the logs, only logs that are not in the cache are read
+    rows = [row for row in rows if variable in row['variables']]
+    row_statistics = [load_cached(statistics_key(row, variable, percentiles), cache) if cache is not None else None for row in rows]
+    missing = [index for index, statistics in enumerate(row_statistics) if statistics is None]
+    for index, statistics in zip(missing, compute_statistics([rows[index] for index in missing], variable, store, percentiles)):
+        row_statistics[index] = statistics
+        if cache is not None:
+            store_cached(statistics_key(rows[index], variable, percentiles), statistics, cache)
+    if cache is not None and missing:
+        evict_cache(cache_limit, cache)
+    
+    # One row per assignment, logs one after the other
+    keys = {column: [] for column in key_columns}
+    for row, statistics in zip(rows, row_statistics):
+        assignment_number = len(statistics['count'])
+        for column in key_columns[:-1]:
+            keys[column] += [row[column]] * assignment_number
+        keys['assignment'] += range(0, assignment_number)
+    
+    table = {column: numpy.array(column_keys) for column, column_keys in keys.items()}
+    for name in ['count', 'min', 'max', 'mean', 'stddev'] + [percentile_name(percentile) for percentile in percentiles]:
+        table[name] = numpy.concatenate([statistics[name] for statistics in row_statistics]) if row_statistics else numpy.zeros(0)
+    return table
+
+
+def baseline_ratios(table: Table, baseline: Table, statistic: str = 'max') -> numpy.ndarray:
+    # Ratio of each row to the baseline (e.g. the solo configuration) of the same assignment, averaged over baseline runs
+    assignment_number = max(int(table['assignment'].max(initial=-1)), int(baseline['assignment'].max(initial=-1))) + 1
+    totals = numpy.bincount(baseline['assignment'], weights=baseline[statistic], minlength=assignment_number)
+    counts = numpy.bincount(baseline['assignment'], minlength=assignment_number)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        references = totals / counts
+        return table[statistic] / references[table['assignment']]
+
+
+def select_table(table: Table, **criteria: Any) -> Table:
+    # Rows matching all criteria, e.g. select_table(table, config='bench_solo_legacy')
+    mask = numpy.ones(len(table['count']), dtype=bool)
+    for column, value in criteria.items():
+        mask &= table[column] == value
+    return {column: values[mask] for column, values in table.items()}
+
+
+def describe_table(table: Table, ratios: Optional[numpy.ndarray] = None) -> list[str]:
+    statistic_columns = [column for column in table if column not in key_columns]
+    lines = ['config/main date run assignment ' + ' '.join(statistic_columns) + (' ratio' if ratios is not None else '')]
+    for index in range(0, len(table['count'])):
+        statistics = ' '.join(f'{table[column][index]:.6g}' for column in statistic_columns)
+        ratio = f' {ratios[index]:.3f}' if ratios is not None else ''
+        lines.append(f'{table["config"][index]:s}/{table["main"][index] or "-":s} {table["date"][index]:s} {table["run"][index]:d} {table["assignment"][index]:d} {statistics:s}{ratio:s}')
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Statistics of the sample arrays of stored benchmark logs')
+    parser.add_argument('--store', default=store_folder, help=f'folder of the stored logs (by default {store_folder:s})')
+    parser.add_argument('--variable', default=default_variable, help=f'sample arrays to use (by default {default_variable:s})')
+    parser.add_argument('--config', help='only use logs of this configuration')
+    parser.add_argument('--main', help='only use logs of this selected main')
+    parser.add_argument('--baseline', metavar='CONFIG', help='add the ratio of the WCET to the one of this configuration (e.g. a solo configuration)')
+    parser.add_argument('--no-cache', action='store_true', help=f'compute all statistics again without using {cache_folder:s}')
+    arguments = parser.parse_args()
+    
+    cache = None if arguments.no_cache else cache_folder
+    criteria = {field: value for field, value in [('config', arguments.config), ('main', arguments.main)] if value is not None}
+    start = time.perf_counter()
+    try:
+        rows = load_metadata(arguments.store)
+        table = statistics_table(select_logs(rows, **criteria), arguments.variable, arguments.store, cache=cache)
+        ratios = None
+        if arguments.baseline is not None:
+            baseline_criteria = {'config': arguments.baseline, **({'main': arguments.main} if arguments.main is not None else {})}
+            ratios = baseline_ratios(table, statistics_table(select_logs(rows, **baseline_criteria), arguments.variable, arguments.store, cache=cache))
+    except (OSError, ValueError) as error:
+        print(error)
+        exit(1)
+    
+    elapsed = time.perf_counter() - start
+    for line in describe_table(table, ratios):
+        print(line)
+    print(f'{len(table["count"]):d} sample arrays ({int(table["count"].sum()):d} samples) analysed in {elapsed:.3f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Imports
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from typing import Any, Union
+
+# Constants
+compare_block_size = 2**20
+
+# Used when the umask cannot be read (no /proc), the umask of most systems is 0o022
+fallback_file_mode = 0o644
+
+
+@lru_cache(maxsize=1)
+def new_file_mode() -> int:
+    # Files are created with the usual permissions, temporary files only allow the owner
+    # The umask is read once from /proc, os.umask would change it for the whole process to read it
+    try:
+        status = open('/proc/self/status', 'r')
+        umask_lines = [line for line in status if line.startswith('Umask:')]
+        status.close()
+    except OSError:
+        return fallback_file_mode
+    if not umask_lines:
+        return fallback_file_mode
+    return 0o666 & ~int(umask_lines[0].split()[1], 8)
+
+
+def file_hash(path: str) -> bytes:
+    digest = hashlib.sha256()
+    file = open(path, 'rb')
+    block = file.read(compare_block_size)
+    while block:
+        digest.update(block)
+        block = file.read(compare_block_size)
+    file.close()
+    return digest.digest()
+
+
+# Output written to a temporary file next to its path, then replacing it only if the content changed
+class OutputFile:
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self.digest = hashlib.sha256()
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, self.temporary_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path):s}.', suffix='.tmp')
+        self.file = os.fdopen(descriptor, 'wb')
+    
+    def write(self, data: Any) -> int:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.digest.update(data)
+        self.size += memoryview(data).nbytes
+        return self.file.write(data)
+    
+    def discard(self):
+        # Nothing is touched when generation fails, the previous file stays as it was
+        self.file.close()
+        if os.path.exists(self.temporary_path):
+            os.remove(self.temporary_path)
+    
+    def close(self) -> bool:
+        self.file.close()
+        
+        # Same content, the old file is kept with its modification time
+        if os.path.isfile(self.path) and os.path.getsize(self.path) == self.size and file_hash(self.path) == self.digest.digest():
+            os.remove(self.temporary_path)
+            return False
+        
+        # Keep the permissions of the replaced file
+        try:
+            os.chmod(self.temporary_path, os.stat(self.path).st_mode & 0o7777 if os.path.exists(self.path) else new_file_mode())
+            os.replace(self.temporary_path, self.path)
+        except OSError:
+            os.remove(self.temporary_path)
+            raise
+        return True
+
+
+def open_output(path: str) -> OutputFile:
+    return OutputFile(path)
+
+
+def write_if_changed(path: str, content: Union[str, bytes]) -> bool:
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    
+    # The whole content is known, it is compared before writing anything
+    if os.path.isfile(path) and os.path.getsize(path) == len(content):
+        file = open(path, 'rb')
+        same_content = file.read() == content
+        file.close()
+        if same_content:
+            return False
+    
+    # True if the file has been written
+    file = open_output(path)
+    file.write(content)
+    return file.close()
@@ -0,0 +1,254 @@
+# Imports
+import argparse
+import glob
+import os
+import re
+import time
+from typing import Any, Union
+from config_model import Configuration, Device, Ipc, Region, VmConfig, ipc_interrupt_number, timer_interrupt_number
+from generate_config import config_folder, write_configuration
+from board_database import load_boards, board_information
+from validate_config import validate_configuration
+
+# Constants
+# Regular expressions of the configuration dialect
+comment_regex = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+image_regex = re.compile(r'VM_IMAGE\(\s*(\w+)\s*,\s*XSTR\(\s*([^)]*?)\s*\)\s*\)')
+config_regex = re.compile(r'struct\s+config\s+config\s*=')
+token_regex = re.compile(r'(?:0[xX][0-9a-fA-F]+|0[bB][01]+|\d+)[uUlL]*|\w+|\S')
+number_regex = re.compile(r'(0[xX][0-9a-fA-F]+|0[bB][01]+|\d+)[uUlL]*')
+identifier_regex = re.compile(r'[A-Za-z_]\w*')
+image_name_regex = re.compile(r'(.+?)_image\d*$')
+
+# An initializer maps field names (designated) and positions (indexed or not) to values
+Initializer = dict[Union[str, int], Any]
+
+
+def tokenize(text: str) -> list[str]:
+    return token_regex.findall(comment_regex.sub(' ', text))
+
+
+def skip_parenthesis(tokens: list[str], position: int) -> int:
+    # Position after the parenthesis closing the one at position
+    depth = 0
+    while position < len(tokens):
+        if tokens[position] == '(':
+            depth += 1
+        elif tokens[position] == ')':
+            depth -= 1
+            if depth == 0:
+                return position + 1
+        position += 1
+    
+    raise ValueError('Unbalanced parenthesis')
+
+
+def parse_value(tokens: list[str], position: int) -> tuple[Any, int]:
+    token = tokens[position]
+    
+    # Casts like (struct vm_mem_region[]) or (irqid_t[]) come before compound literals
+    if token == '(':
+        return parse_value(tokens, skip_parenthesis(tokens, position))
+    
+    if token == '{':
+        return parse_initializer(tokens, position)
+    
+    number = number_regex.fullmatch(token)
+    if number:
+        return int(number.group(1), 0), position + 1
+    
+    # Macro calls are kept as their name and the text of their arguments
+    if position + 1 < len(tokens) and tokens[position + 1] == '(':
+        end = skip_parenthesis(tokens, position + 1)
+        return (token, ''.join(tokens[position + 2:end - 1])), end
+    
+    return token, position + 1
+
+
+def parse_initializer(tokens: list[str], position: int) -> tuple[Initializer, int]:
+    initializer = {}
+    next_index = 0
+    position += 1
+    while tokens[position] != '}':
+        # Designated by field (.name = value), by index ([n] = value) or positional
+        if tokens[position] == '.':
+            key = tokens[position + 1]
+            if tokens[position + 2] != '=':
+                raise ValueError(f'Expected "=" after .{key:s}')
+            value, position = parse_value(tokens, position + 3)
+        elif tokens[position] == '[':
+            key = int(number_regex.fullmatch(tokens[position + 1]).group(1), 0)
+            if tokens[position + 2] != ']' or tokens[position + 3] != '=':
+                raise ValueError(f'Expected "] =" after [{key:d}')
+            value, position = parse_value(tokens, position + 4)
+            next_index = key + 1
+        elif identifier_regex.fullmatch(tokens[position]) and tokens[position + 1] in ('.', '['):
+            # Macros expanding to fields (e.g. CONFIG_HEADER) are not followed by a comma
+            position += 1
+            continue
+        else:
+            key = next_index
+            value, position = parse_value(tokens, position)
+            next_index += 1
+        
+        initializer[key] = value
+        
+        if tokens[position] == ',':
+            position += 1
+        elif tokens[position] != '}':
+            raise ValueError(f'Expected "," or "}}" but found "{tokens[position]:s}"')
+    
+    return initializer, position + 1
+
+
+def elements(initializer: Initializer) -> list[Any]:
+    # Values of an array initializer, in index order
+    return [initializer[index] for index in sorted(key for key in initializer if isinstance(key, int))]
+
+
+def vm_configuration(image_name: str, platform: str) -> str:
+    # The OS is the prefix of the image name, unknown OSes use baremetal values like the generator
+    match = image_name_regex.match(image_name)
+    os_name = match.group(1) if match else image_name
+    if os_name in load_boards().get(platform, {}).get('oses', {}):
+        return os_name
+    return 'baremetal'
+
+
+def interrupt_controller(architecture: Initializer) -> dict[str, int]:
+    # GIC registers (.gicd_addr, ...) or the RISC-V PLIC (.plic_base)
+    if 'plic_base' in architecture:
+        return {'plic': architecture['plic_base']}
+    return {name.removesuffix('_addr'): address for name, address in architecture['gic'].items()}
+
+
+def vm_from_initializer(vm_initializer: Initializer, image_paths: dict[str, str], platform: str) -> VmConfig:
+    image = vm_initializer['image']
+    image_name = image['load_addr'][1]
+    vm_platform = vm_initializer['platform']
+    
+    vm = VmConfig(image_name=image_name,
+                  image_path=image_paths.get(image_name, ''),
+                  configuration=vm_configuration(image_name, platform),
+                  cpu_number=vm_platform['cpu_num'],
+                  entry=vm_initializer['entry'],
+                  base_addr=image['base_addr'],
+                  gic=interrupt_controller(vm_platform['arch']),
+                  colors=vm_initializer.get('colors'),
+                  cpu_affinity=vm_initializer.get('cpu_affinity'),
+                  arch_timer=False)
+    
+    for region in elements(vm_platform.get('regions', {})):
+        vm.regions.append(Region(base=region['base'], size=region['size']))
+    
+    for ipc in elements(vm_platform.get('ipcs', {})):
+        interrupts = elements(ipc.get('interrupts', {}))
+        vm.ipcs.append(Ipc(base=ipc['base'], size=ipc['size'], shmem_id=ipc['shmem_id'], interrupt=interrupts[0] if interrupts else ipc_interrupt_number))
+    
+    # A device without address is the arch timer
+    for device in elements(vm_platform.get('devs', {})):
+        interrupts = elements(device.get('interrupts', {}))
+        if 'pa' not in device:
+            if interrupts != [timer_interrupt_number]:
+                raise ValueError(f'{image_name:s}: device without address that is not the arch timer')
+            vm.arch_timer = True
+        else:
+            vm.devices.append(Device(pa=device['pa'], va=device.get('va', device['pa']), size=device['size'], interrupts=interrupts))
+    
+    return vm
+
+
+def parse_configuration(text: str, name: str, platform: str) -> Configuration:
+    image_paths = {image_name: image_path for image_name, image_path in image_regex.findall(comment_regex.sub(' ', text))}
+    
+    config_match = config_regex.search(text)
+    if config_match is None:
+        raise ValueError('No "struct config config" in the configuration')
+    config_initializer, _ = parse_value(tokenize(text[config_match.end():]), 0)
+    
+    configuration = Configuration(name=name, platform=platform, cpu_number=0)
+    configuration.shmem_sizes = [shmem['size'] for shmem in elements(config_initializer.get('shmemlist', {}))]
+    configuration.vms = [vm_from_initializer(vm_initializer, image_paths, platform) for vm_initializer in elements(config_initializer['vmlist'])]
+    
+    # The number of cores is not written, it comes from the board database (unknown platforms have at least the used ones)
+    if platform in load_boards():
+        configuration.cpu_number = board_information(platform)['cpu_number']
+    else:
+        affinity_cpus = [vm.cpu_affinity.bit_length() for vm in configuration.vms if vm.cpu_affinity is not None]
+        configuration.cpu_number = max(affinity_cpus + [sum(vm.cpu_number for vm in configuration.vms)])
+    return configuration
+
+
+def load_configuration(config_file_path: str) -> Configuration:
+    # Configurations are stored in <name>/<platform>.c
+    name = os.path.basename(os.path.dirname(os.path.abspath(config_file_path)))
+    platform = os.path.splitext(os.path.basename(config_file_path))[0]
+    
+    config_file = open(config_file_path, 'r')
+    text = config_file.read()
+    config_file.close()
+    
+    try:
+        return parse_configuration(text, name, platform)
+    except (KeyError, IndexError, TypeError, ValueError) as error:
+        raise ValueError(f'Cannot parse {config_file_path:s}: {error}')
+
+
+def load_configuration_tree(input_folder: str = config_folder) -> list[Configuration]:
+    config_file_paths = sorted(glob.glob(os.path.join(input_folder, '**', '*.c'), recursive=True))
+    return [load_configuration(config_file_path) for config_file_path in config_file_paths]
+
+
+def describe_configuration(configuration: Configuration) -> str:
+    vm_descriptions = []
+    for vm in configuration.vms:
+        memory = sum(region.size for region in vm.regions)
+        colors = f'0b{vm.colors:b}' if vm.colors is not None else '-'
+        cpu_affinity = f'0b{vm.cpu_affinity:b}' if vm.cpu_affinity is not None else '-'
+        vm_descriptions.append(f'{vm.image_name:s} ({vm.cpu_number:d} CPU, 0x{memory:x} bytes, colors {colors:s}, affinity {cpu_affinity:s})')
+    return f'{configuration.name:s}/{configuration.platform:s}: ' + ', '.join(vm_descriptions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read configuration files back into the configuration model')
+    parser.add_argument('paths', nargs='*', help=f'configuration files or folders (by default {config_folder:s})')
+    parser.add_argument('--check', action='store_true', help='validate the configurations')
+    parser.add_argument('--regenerate', metavar='FOLDER', help='write the configurations again with the generator in this folder')
+    arguments = parser.parse_args()
+    
+    start = time.perf_counter()
+    configurations = []
+    try:
+        for path in arguments.paths or [config_folder]:
+            configurations += load_configuration_tree(path) if os.path.isdir(path) else [load_configuration(path)]
+    except (OSError, ValueError) as error:
+        print(error)
+        exit(1)
+    
+    elapsed = time.perf_counter() - start
+    for configuration in configurations:
+        print(describe_configuration(configuration))
+    print(f'{len(configurations):d} configuration files read in {elapsed:.3f}s')
+    
+    error_number = 0
+    if arguments.check:
+        for configuration in configurations:
+            errors, warnings = validate_configuration(configuration)
+            for error in errors:
+                print(f'Error in {configuration.name:s} ({configuration.platform:s}): {error:s}')
+            for warning in warnings:
+                print(f'Warning in {configuration.name:s} ({configuration.platform:s}): {warning:s}')
+            error_number += len(errors)
+    
+    if arguments.regenerate is not None:
+        changed_number = 0
+        for configuration in configurations:
+            _, changed = write_configuration(configuration, arguments.regenerate, check=False)
+            changed_number += changed
+        print(f'{len(configurations):d} configuration files written in {arguments.regenerate:s} ({len(configurations) - changed_number:d} unchanged)')
+    
+    if error_number > 0:
+        exit(2)
+
+if __name__ == '__main__':
+    main()
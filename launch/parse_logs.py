@@ -0,0 +1,532 @@
+# Imports
+import argparse
+import glob
+import codecs
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Iterator, Optional
+import numpy
+from generate_config import config_folder
+from output_file import file_hash, write_if_changed
+
+# Constants
+log_folder = os.path.join('..', 'test-logs')
+store_folder = os.path.join(log_folder, 'store')
+metadata_file_name = 'metadata.json'
+comments_file_name = 'comments.txt'
+
+# Logs are read by pieces, values are written to disk every flush_size values
+read_size = 2**20
+flush_size = 2**16
+value_type = numpy.int64
+
+# Increased when the store format changes, older entries are parsed again
+store_version = 4
+
+# Logs are read as they are decompressed, archives are never extracted to disk
+log_extension = '.log'
+compressed_log_extensions = ('.log.gz', '.log.zst')
+archive_extensions = ('.tar.gz', '.tgz', '.tar.zst')
+source_extensions = (log_extension,) + compressed_log_extensions + archive_extensions
+default_jobs = os.cpu_count() or 1
+
+# What benchmark.h prints: arrays and scalars as Python assignments, and comments
+array_regex = re.compile(r'\s*([A-Za-z_]\w*)\s*=\s*\[(.*)', re.DOTALL)
+scalar_regex = re.compile(r'\s*([A-Za-z_]\w*)\s*=\s*(-?\d+)\s*')
+comment_regex = re.compile(r'\s*#\s?(.*?)\s*')
+value_regex = re.compile(r'-?\d+')
+plain_values_regex = re.compile(r'[\d\s,-]*')
+
+# Log names are [config name]-[selected main]-[date]-[test number].log (see launch-minicom.sh), rotated logs add .part[number] to their next parts
+log_name_regex = re.compile(r'(.+)-(\d{2}-\d{2}-\d{2})-(\d+)(?:\.part(\d+))?\.log')
+
+
+def log_key(log_path: str, config_names: Optional[list[str]] = None) -> dict[str, Any]:
+    log_name = os.path.basename(log_path)
+    match = log_name_regex.fullmatch(log_name)
+    if not match:
+        raise ValueError(f'{log_name:s} is not named [config name]-[selected main]-[date]-[test number][.part[number]].log')
+    name, date, run, part = match.groups()
+    
+    # Both names can contain dashes, known configurations are tried first (longest first)
+    config_name = None
+    for known_name in sorted(config_names or [], key=len, reverse=True):
+        if name == known_name or name.startswith(known_name + '-'):
+            config_name = known_name
+            break
+    if config_name is None:
+        config_name = name.split('-', 1)[0]
+    selected_main = name[len(config_name) + 1:]
+    
+    return {
+        'log': f'{name:s}-{date:s}-{run:s}',
+        'config': config_name,
+        'main': selected_main,
+        'date': '20' + date,
+        'run': int(run),
+        'part': int(part) if part else 1
+    }
+
+
+def read_pieces(file: BinaryIO) -> Iterator[str]:
+    # Pieces end at line ends or after read_size bytes, a long line never has to fit in memory
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    piece = file.readline(read_size)
+    while piece:
+        yield decoder.decode(piece)
+        piece = file.readline(read_size)
+    
+    # Serial garbage at the end of the log
+    rest = decoder.decode(b'', final=True)
+    if rest:
+        yield rest
+
+
+def array_values(text: str) -> tuple[Optional[numpy.ndarray], str, bool]:
+    # Values of a piece of array, what may be the beginning of a value in the next piece and whether the array ended
+    end = text.find(']')
+    if end != -1:
+        text, pending = text[:end], ''
+    else:
+        partial = len(text.rstrip('0123456789'))
+        if partial > 0 and text[partial - 1] == '-':
+            partial -= 1
+        text, pending = text[:partial], text[partial:]
+    
+    # NumPy reads plain values much faster (but reads blanks as a 0), anything else printed in the array is skipped by the regular expression
+    if not value_regex.search(text):
+        return None, pending, end != -1
+    if plain_values_regex.fullmatch(text):
+        return numpy.fromstring(text.replace(',', ' '), dtype=value_type, sep=' '), pending, end != -1
+    return numpy.array(value_regex.findall(text), dtype=value_type), pending, end != -1
+
+
+def line_event(line: str) -> Optional[tuple]:
+    scalar_match = scalar_regex.fullmatch(line)
+    if scalar_match:
+        return ('scalar', scalar_match.group(1), int(scalar_match.group(2)))
+    comment_match = comment_regex.fullmatch(line)
+    if comment_match:
+        return ('comment', comment_match.group(1))
+    if line.strip():
+        return ('ignored', line)
+    return None
+
+
+# Incremental parser, pieces of the log are given as they come (lines, or parts of lines ending a piece)
+class LogParser:
+    def __init__(self):
+        self.array_name = None
+        self.pending = ''
+        self.line = ''
+    
+    def feed(self, piece: str) -> list[tuple]:
+        # Events: ('comment', text), ('scalar', name, value), ('values', name, array), ('end', name), ('ignored', line)
+        events = []
+        if self.array_name is None:
+            # Outside of arrays, lines are short except the one beginning an array
+            self.line += piece
+            array_match = array_regex.match(self.line)
+            if not array_match:
+                if self.line.endswith('\n'):
+                    event = line_event(self.line)
+                    if event is not None:
+                        events.append(event)
+                    self.line = ''
+                return events
+            
+            self.array_name = array_match.group(1)
+            piece = array_match.group(2)
+            self.line = ''
+        
+        values, self.pending, ended = array_values(self.pending + piece)
+        if values is not None:
+            events.append(('values', self.array_name, values))
+        if ended:
+            events.append(('end', self.array_name))
+            self.array_name = None
+        return events
+    
+    def finish(self) -> list[tuple]:
+        # A log cut in the middle of a line or of an array keeps what was printed
+        events = []
+        if self.line:
+            event = line_event(self.line)
+            if event is not None:
+                events.append(event)
+            self.line = ''
+        if self.array_name is not None:
+            if value_regex.fullmatch(self.pending):
+                events.append(('values', self.array_name, numpy.array([self.pending], dtype=value_type)))
+            events.append(('end', self.array_name))
+            self.array_name = None
+            self.pending = ''
+        return events
+
+
+def log_events(file: BinaryIO) -> Iterator[tuple]:
+    parser = LogParser()
+    for piece in read_pieces(file):
+        yield from parser.feed(piece)
+    yield from parser.finish()
+
+
+# Column of values written to a .npy file as they come, its header is written again once the length is known
+class ColumnWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self.length = 0
+        self.buffer = []
+        self.buffer_length = 0
+        self.file = open(path, 'wb')
+        self.header_size = self.write_header()
+    
+    def write_header(self) -> int:
+        self.file.seek(0)
+        numpy.lib.format.write_array_header_1_0(self.file, {'descr': numpy.dtype(value_type).str, 'fortran_order': False, 'shape': (self.length,)})
+        return self.file.tell()
+    
+    def append(self, values: numpy.ndarray):
+        self.buffer.append(values)
+        self.buffer_length += len(values)
+        if self.buffer_length >= flush_size:
+            self.flush()
+    
+    def flush(self):
+        if self.buffer:
+            values = numpy.concatenate(self.buffer)
+            values.tofile(self.file)
+            self.length += len(values)
+            self.buffer = []
+            self.buffer_length = 0
+    
+    def close(self):
+        self.flush()
+        
+        # Headers are padded so that the shape can grow without moving the values
+        if self.write_header() != self.header_size:
+            raise ValueError(f'{self.path:s}: header of the column changed size')
+        self.file.close()
+
+
+# Values of a variable (all assignments one after the other) and the length of each assignment
+class VariableWriter:
+    def __init__(self, folder: str, name: str):
+        self.values = ColumnWriter(os.path.join(folder, f'{name:s}.npy'))
+        self.lengths = ColumnWriter(os.path.join(folder, f'{name:s}.lengths.npy'))
+        self.kind = None
+        self.assignment_length = 0
+    
+    def append(self, values: numpy.ndarray):
+        self.values.append(values)
+        self.assignment_length += len(values)
+    
+    def end(self, kind: str):
+        self.lengths.append(numpy.array([self.assignment_length], dtype=value_type))
+        self.assignment_length = 0
+        self.kind = kind if self.kind in (None, kind) else 'mixed'
+    
+    def close(self) -> dict[str, Any]:
+        self.values.close()
+        self.lengths.close()
+        return {'kind': self.kind, 'assignments': self.lengths.length, 'values': self.values.length}
+
+
+def zstd_reader(file: BinaryIO) -> BinaryIO:
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('zstandard is needed to read .zst files, install it or use .gz archives')
+    return zstandard.ZstdDecompressor().stream_reader(file)
+
+
+def source_logs(source_path: str) -> Iterator[tuple[str, BinaryIO]]:
+    # Name and content of each log of a source: a log, a compressed log or the logs of an archive
+    source_name = os.path.basename(source_path)
+    file = open(source_path, 'rb')
+    try:
+        if source_name.endswith(archive_extensions):
+            # Streaming mode, members are decompressed while they are parsed and never seeked
+            if source_name.endswith('.tar.zst'):
+                archive = tarfile.open(fileobj=zstd_reader(file), mode='r|')
+            else:
+                archive = tarfile.open(fileobj=file, mode='r|gz')
+            for member in archive:
+                if member.isfile() and member.name.endswith(log_extension):
+                    yield os.path.basename(member.name), archive.extractfile(member)
+        elif source_name.endswith('.log.gz'):
+            yield source_name.removesuffix('.gz'), gzip.GzipFile(fileobj=file)
+        elif source_name.endswith('.log.zst'):
+            yield source_name.removesuffix('.zst'), zstd_reader(file)
+        else:
+            yield source_name, file
+    finally:
+        file.close()
+
+
+def parse_log(log_content: BinaryIO, output_folder: str) -> dict[str, Any]:
+    os.makedirs(output_folder, exist_ok=True)
+    variables = {}
+    comment_number = 0
+    ignored_number = 0
+    
+    comments_file = open(os.path.join(output_folder, comments_file_name), 'w')
+    try:
+        for event in log_events(log_content):
+            kind = event[0]
+            if kind == 'comment':
+                comments_file.write(event[1] + '\n')
+                comment_number += 1
+            elif kind == 'ignored':
+                ignored_number += 1
+            else:
+                name = event[1]
+                if name not in variables:
+                    variables[name] = VariableWriter(output_folder, name)
+                if kind == 'scalar':
+                    variables[name].append(numpy.array([event[2]], dtype=value_type))
+                    variables[name].end('scalar')
+                elif kind == 'values':
+                    variables[name].append(event[2])
+                else:
+                    variables[name].end('array')
+    finally:
+        comments_file.close()
+        variable_information = {name: variable.close() for name, variable in variables.items()}
+    
+    return {'variables': variable_information, 'comments': comment_number, 'ignored_lines': ignored_number}
+
+
+def merge_parts(part_folders: list[str], part_information: list[dict[str, Any]], output_folder: str) -> dict[str, Any]:
+    # Parts of a rotated log one after the other, arrays are never split between two parts
+    os.makedirs(output_folder, exist_ok=True)
+    comments_file = open(os.path.join(output_folder, comments_file_name), 'wb')
+    for part_folder in part_folders:
+        part_comments = open(os.path.join(part_folder, comments_file_name), 'rb')
+        shutil.copyfileobj(part_comments, comments_file)
+        part_comments.close()
+    comments_file.close()
+    
+    # Columns are copied by pieces from the memory-mapped parts
+    variable_information = {}
+    for name in dict.fromkeys(name for information in part_information for name in information['variables']):
+        parts = [(part_folder, information['variables'][name]) for part_folder, information in zip(part_folders, part_information) if name in information['variables']]
+        columns = []
+        for file_name in (f'{name:s}.npy', f'{name:s}.lengths.npy'):
+            column = ColumnWriter(os.path.join(output_folder, file_name))
+            for part_folder, _ in parts:
+                values = numpy.load(os.path.join(part_folder, file_name), mmap_mode='r')
+                for start in range(0, len(values), flush_size):
+                    column.append(values[start:start + flush_size])
+            column.close()
+            columns.append(column)
+        kinds = {information['kind'] for _, information in parts}
+        variable_information[name] = {'kind': kinds.pop() if len(kinds) == 1 else 'mixed', 'assignments': columns[1].length, 'values': columns[0].length}
+    
+    return {
+        'variables': variable_information,
+        'comments': sum(information['comments'] for information in part_information),
+        'ignored_lines': sum(information['ignored_lines'] for information in part_information)
+    }
+
+
+def source_signature(source_paths: list[str]) -> dict[str, Any]:
+    # The parts of a rotated log are one source, named after its first part
+    statuses = [os.stat(source_path) for source_path in source_paths]
+    return {'source': os.path.basename(source_paths[0]), 'source_size': sum(status.st_size for status in statuses), 'source_mtime_ns': max(status.st_mtime_ns for status in statuses)}
+
+
+def source_hash(source_paths: list[str]) -> str:
+    if len(source_paths) == 1:
+        return file_hash(source_paths[0]).hex()
+    return hashlib.sha256(b''.join(file_hash(source_path) for source_path in source_paths)).hexdigest()
+
+
+def source_part(source_path: str) -> tuple[str, int]:
+    # Logs are grouped by run (the parts of a rotated log) with their part number, archives are groups of their own
+    source_name = os.path.basename(source_path)
+    for extension in compressed_log_extensions:
+        source_name = source_name.removesuffix(extension.removeprefix(log_extension))
+    match = log_name_regex.fullmatch(source_name)
+    if not match:
+        return source_path, 1
+    name, date, run, part = match.groups()
+    return os.path.join(os.path.dirname(source_path), f'{name:s}-{date:s}-{run:s}'), int(part) if part else 1
+
+
+def load_metadata(store: str = store_folder) -> dict[str, dict[str, Any]]:
+    # Metadata of the store, one row per log keyed by its name
+    metadata_path = os.path.join(store, metadata_file_name)
+    if not os.path.isfile(metadata_path):
+        return {}
+    
+    file = open(metadata_path, 'r')
+    metadata = json.load(file)
+    file.close()
+    if metadata.get('version') != store_version:
+        return {}
+    return {row['log']: row for row in metadata['logs']}
+
+
+def write_metadata(rows: dict[str, dict[str, Any]], store: str = store_folder) -> bool:
+    ordered_rows = sorted(rows.values(), key=lambda row: (row['config'], row['main'], row['date'], row['run']))
+    return write_if_changed(os.path.join(store, metadata_file_name), json.dumps({'version': store_version, 'logs': ordered_rows}, indent=4) + '\n')
+
+
+def store_source(source_paths: list[str], store: str, rows: dict[str, dict[str, Any]], force: bool = False, config_names: Optional[list[str]] = None) -> list[tuple[dict[str, Any], bool]]:
+    # Returns the metadata rows of the logs of the source (one archive or the parts of one log) and whether they were parsed (unchanged sources are not)
+    signature = source_signature(source_paths)
+    stored_rows = [row for row in rows.values() if row['source'] == signature['source']]
+    if not force and stored_rows and all(row[field] == signature[field] for row in stored_rows for field in signature):
+        return [(row, False) for row in stored_rows]
+    
+    # Logs are never modified once written, a source copied or touched again keeps its entries
+    signature['source_hash'] = source_hash(source_paths)
+    if not force and stored_rows and all(row['source_hash'] == signature['source_hash'] for row in stored_rows):
+        return [(dict(row, **signature), False) for row in stored_rows]
+    
+    # Parsed in temporary folders, the previous entries stay usable if parsing fails
+    parts = {}
+    try:
+        for source_path in source_paths:
+            for log_name, log_content in source_logs(source_path):
+                row = log_key(log_name, config_names)
+                part = row.pop('part')
+                if part in parts.get(row['log'], {}):
+                    raise ValueError(f'{source_path:s}: part {part:d} of {row["log"]:s} is given twice')
+                temporary_folder = os.path.join(store, f'.{row["log"]:s}.{part:d}.tmp')
+                parts.setdefault(row['log'], {})[part] = (row, temporary_folder)
+                shutil.rmtree(temporary_folder, ignore_errors=True)
+                row.update(parse_log(log_content, temporary_folder))
+        
+        results = []
+        for log, log_parts in parts.items():
+            ordered_parts = [log_parts[part] for part in sorted(log_parts)]
+            row, temporary_folder = ordered_parts[0]
+            if len(ordered_parts) > 1:
+                temporary_folder = os.path.join(store, f'.{log:s}.tmp')
+                shutil.rmtree(temporary_folder, ignore_errors=True)
+                row = dict(row, **merge_parts([folder for _, folder in ordered_parts], [part_row for part_row, _ in ordered_parts], temporary_folder))
+            row.update(signature, parts=len(ordered_parts))
+            
+            output_folder = os.path.join(store, log)
+            shutil.rmtree(output_folder, ignore_errors=True)
+            os.replace(temporary_folder, output_folder)
+            results.append((row, True))
+    finally:
+        for log, log_parts in parts.items():
+            for _, temporary_folder in log_parts.values():
+                shutil.rmtree(temporary_folder, ignore_errors=True)
+            shutil.rmtree(os.path.join(store, f'.{log:s}.tmp'), ignore_errors=True)
+    
+    return results
+
+
+def store_logs(source_paths: list[str], store: str = store_folder, force: bool = False, jobs: int = 1) -> list[tuple[dict[str, Any], bool]]:
+    os.makedirs(store, exist_ok=True)
+    config_names = os.listdir(config_folder) if os.path.isdir(config_folder) else []
+    rows = load_metadata(store)
+    
+    # Parts of a rotated log are stored together as one log, first part first
+    groups = {}
+    for source_path in source_paths:
+        group, part = source_part(source_path)
+        groups.setdefault(group, []).append((part, source_path))
+    source_groups = [[source_path for _, source_path in sorted(group)] for group in groups.values()]
+    
+    # Decompression and NumPy conversions release the GIL, threads are enough to parse sources in parallel
+    if jobs > 1:
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        source_results = list(executor.map(lambda group: store_source(group, store, rows, force, config_names), source_groups))
+        executor.shutdown()
+    else:
+        source_results = [store_source(group, store, rows, force, config_names) for group in source_groups]
+    
+    # Rows of parsed sources replace all their previous rows (logs removed from an archive disappear)
+    results = []
+    for group, source_result in zip(source_groups, source_results):
+        if any(parsed for _, parsed in source_result):
+            source_name = os.path.basename(group[0])
+            for log in [log for log, row in rows.items() if row['source'] == source_name]:
+                del rows[log]
+        for row, _ in source_result:
+            rows[row['log']] = row
+        results += source_result
+    
+    write_metadata(rows, store)
+    return results
+
+
+def load_variable(row: dict[str, Any], name: str, store: str = store_folder) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # Values are memory-mapped, nothing is read before it is used
+    if name not in row['variables']:
+        raise ValueError(f'No variable {name:s} in {row["log"]:s}, variables are {", ".join(row["variables"].keys()):s}')
+    folder = os.path.join(store, row['log'])
+    return numpy.load(os.path.join(folder, f'{name:s}.npy'), mmap_mode='r'), numpy.load(os.path.join(folder, f'{name:s}.lengths.npy'))
+
+
+def assignments(values: numpy.ndarray, lengths: numpy.ndarray) -> list[numpy.ndarray]:
+    # One array per assignment, in the order they were printed
+    return numpy.split(values, numpy.cumsum(lengths)[:-1])
+
+
+def last_assignment(row: dict[str, Any], name: str, store: str = store_folder) -> Any:
+    # What running the log as Python code would give: the last value assigned to the variable
+    values, lengths = load_variable(row, name, store)
+    value = assignments(values, lengths)[-1]
+    if row['variables'][name]['kind'] == 'scalar':
+        return int(value[0])
+    return value
+
+
+def select_logs(rows: dict[str, dict[str, Any]], **criteria: Any) -> list[dict[str, Any]]:
+    # Rows matching all criteria, e.g. select_logs(rows, config='bench_solo_legacy', run=1)
+    return [row for row in rows.values() if all(row[field] == value for field, value in criteria.items())]
+
+
+def source_paths_of(paths: list[str]) -> list[str]:
+    # Logs, compressed logs and archives of folders
+    source_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            source_paths += sorted(source_path for source_path in glob.glob(os.path.join(path, '*')) if source_path.endswith(source_extensions))
+        else:
+            source_paths.append(path)
+    return source_paths
+
+
+def describe_row(row: dict[str, Any]) -> str:
+    variables = ', '.join(f'{name:s} ({information["values"]:d} values)' if information['kind'] != 'scalar' else f'{name:s} ({information["assignments"]:d})' for name, information in row['variables'].items())
+    parts = f' ({row["parts"]:d} parts)' if row.get('parts', 1) > 1 else ''
+    return f'{row["config"]:s}/{row["main"] or "-":s} {row["date"]:s} n°{row["run"]:d}{parts:s}: {variables or "no variable":s}, {row["comments"]:d} comments, {row["ignored_lines"]:d} ignored lines'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse benchmark logs into memory-mappable arrays')
+    parser.add_argument('paths', nargs='*', help=f'log files, .tar.gz or .tar.zst archives of logs or folders (by default {log_folder:s})')
+    parser.add_argument('--store', default=store_folder, help=f'folder where arrays and metadata are written (by default {store_folder:s})')
+    parser.add_argument('--force', action='store_true', help='parse logs again even if they did not change')
+    parser.add_argument('--jobs', type=int, default=default_jobs, help=f'number of sources parsed at the same time (by default {default_jobs:d})')
+    arguments = parser.parse_args()
+    
+    start = time.perf_counter()
+    try:
+        results = store_logs(source_paths_of(arguments.paths or [log_folder]), arguments.store, arguments.force, arguments.jobs)
+    except (OSError, ValueError, tarfile.TarError) as error:
+        print(error)
+        exit(1)
+    
+    elapsed = time.perf_counter() - start
+    for row, parsed in results:
+        print(('' if parsed else '(unchanged) ') + describe_row(row))
+    print(f'{len(results):d} log files stored in {elapsed:.3f}s ({sum(not parsed for _, parsed in results):d} unchanged)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# Imports
+from dataclasses import dataclass
+from typing import Optional
+from config_model import max_colors
+
+# Constants
+# Last level cache of the platforms (rpi4 and zcu: 1 MiB), a color is one of its slices
+llc_size = 2**20
+color_size = llc_size // max_colors
+
+# Color layouts, named like the benchmark configurations
+legacy_layout_str = 'legacy'
+color_layout_str = 'color'
+color_mixed_layout_str = 'color_mixed'
+
+
+# What a VM needs, a criticality of 0 is an interference VM, higher is more critical
+@dataclass
+class VmRequirement:
+    working_set: Optional[int] = None
+    criticality: int = 0
+    cpu_number: int = 1
+    cores: Optional[list[int]] = None
+
+
+@dataclass
+class Plan:
+    colors: list[Optional[int]]
+    cpu_affinities: list[Optional[int]]
+    shared_colors: int
+
+
+def split_colors(color_numbers: list[int], layout: str) -> list[Optional[int]]:
+    if layout == legacy_layout_str:
+        return [None] * len(color_numbers)
+    
+    # Each color is given to a VM, one after the other when contiguous
+    owners = [vm_index for vm_index, color_number in enumerate(color_numbers) for _ in range(0, color_number)]
+    
+    # When mixed, colors of a VM are spread over all colors (equal splits alternate)
+    if layout == color_mixed_layout_str:
+        positions = [((color_index + 0.5) / color_numbers[vm_index], vm_index) for vm_index in range(0, len(color_numbers)) for color_index in range(0, color_numbers[vm_index])]
+        owners = [vm_index for _, vm_index in sorted(positions)]
+    
+    bitmaps = [0] * len(color_numbers)
+    for color, vm_index in enumerate(owners):
+        bitmaps[vm_index] |= 1 << color
+    return bitmaps
+
+
+def needed_colors(requirement: VmRequirement) -> int:
+    # Without working set, a VM would use the whole cache
+    if requirement.working_set is None:
+        return max_colors
+    return min(max(-(-requirement.working_set // color_size), 1), max_colors)
+
+
+def plan_color_numbers(requirements: list[VmRequirement]) -> tuple[list[int], bool]:
+    critical_indexes = sorted((vm_index for vm_index, requirement in enumerate(requirements) if requirement.criticality > 0), key=lambda vm_index: -requirements[vm_index].criticality)
+    interference_indexes = [vm_index for vm_index, requirement in enumerate(requirements) if requirement.criticality == 0]
+    
+    # Interference VMs need at least one color that no critical VM uses
+    available = max_colors - (1 if interference_indexes else 0)
+    if len(critical_indexes) > available:
+        raise ValueError(f'{len(critical_indexes):d} critical VMs cannot have their own colors out of {max_colors:d}')
+    
+    # Most critical VMs are served first, keeping one color for each of the next ones
+    color_numbers = [0] * len(requirements)
+    for rank, vm_index in enumerate(critical_indexes):
+        next_critical = len(critical_indexes) - rank - 1
+        color_numbers[vm_index] = max(min(needed_colors(requirements[vm_index]), available - next_critical), 1)
+        available -= color_numbers[vm_index]
+    
+    # Interference VMs get their own colors if they fit, else they share the remaining ones
+    remaining = max_colors - sum(color_numbers)
+    interference_needs = [needed_colors(requirements[vm_index]) for vm_index in interference_indexes]
+    shared_interference = sum(interference_needs) > remaining
+    if shared_interference:
+        for vm_index in interference_indexes:
+            color_numbers[vm_index] = remaining
+    else:
+        for vm_index, need in zip(interference_indexes, interference_needs):
+            color_numbers[vm_index] = need
+        
+        # Unused colors go to the most critical VM, it can only evict itself
+        if critical_indexes:
+            color_numbers[critical_indexes[0]] += remaining - sum(interference_needs)
+    
+    return color_numbers, shared_interference
+
+
+def plan_colors(requirements: list[VmRequirement], layout: str = color_layout_str) -> list[Optional[int]]:
+    if layout == legacy_layout_str:
+        return [None] * len(requirements)
+    
+    color_numbers, shared_interference = plan_color_numbers(requirements)
+    
+    # Shared interference colors are one group, split like the colors of a single VM
+    groups = [vm_index for vm_index, requirement in enumerate(requirements) if requirement.criticality > 0 or not shared_interference]
+    group_numbers = [color_numbers[vm_index] for vm_index in groups]
+    interference_indexes = [vm_index for vm_index, requirement in enumerate(requirements) if requirement.criticality == 0]
+    if shared_interference:
+        group_numbers.append(color_numbers[interference_indexes[0]])
+    
+    group_bitmaps = split_colors(group_numbers, layout)
+    colors = [None] * len(requirements)
+    for vm_index, bitmap in zip(groups, group_bitmaps):
+        colors[vm_index] = bitmap
+    if shared_interference:
+        for vm_index in interference_indexes:
+            colors[vm_index] = group_bitmaps[-1]
+    return colors
+
+
+def cores_bitmap(cores: Optional[list[int]]) -> Optional[int]:
+    if cores is None:
+        return None
+    
+    bitmap = 0
+    for core in cores:
+        bitmap |= 1 << core
+    return bitmap
+
+
+def plan_affinities(requirements: list[VmRequirement], cpu_number: int) -> list[Optional[int]]:
+    affinities = [None] * len(requirements)
+    used_cores = 0
+    
+    # Pinned cores are kept as they are
+    for vm_index, requirement in enumerate(requirements):
+        if requirement.cores is not None:
+            affinity = cores_bitmap(requirement.cores)
+            if affinity & used_cores:
+                raise ValueError(f'Pinned cores of VM n°{vm_index:d} are used by another VM')
+            affinities[vm_index] = affinity
+            used_cores |= affinity
+    
+    # Most critical VMs take the first free cores
+    free_cores = [core for core in range(0, cpu_number) if not used_cores & (1 << core)]
+    for vm_index in sorted(range(0, len(requirements)), key=lambda vm_index: -requirements[vm_index].criticality):
+        if affinities[vm_index] is not None:
+            continue
+        
+        cpu = requirements[vm_index].cpu_number
+        if cpu > len(free_cores):
+            raise ValueError(f'No core left for VM n°{vm_index:d} ({cpu:d} needed, {len(free_cores):d} free)')
+        affinities[vm_index] = 0
+        for core in free_cores[:cpu]:
+            affinities[vm_index] |= 1 << core
+        free_cores = free_cores[cpu:]
+    
+    return affinities
+
+
+def shared_critical_colors(requirements: list[VmRequirement], colors: list[Optional[int]]) -> int:
+    # Number of colors a critical VM shares with another VM, what the plan minimises
+    if None in colors:
+        return max_colors
+    
+    shared = 0
+    for vm_index, requirement in enumerate(requirements):
+        if requirement.criticality > 0:
+            others = 0
+            for other_index in range(0, len(requirements)):
+                if other_index != vm_index:
+                    others |= colors[other_index]
+            shared |= colors[vm_index] & others
+    return bin(shared).count('1')
+
+
+def plan_configuration(requirements: list[VmRequirement], cpu_number: int, layout: str = color_layout_str, affinity: bool = True) -> Plan:
+    colors = plan_colors(requirements, layout)
+    if affinity:
+        cpu_affinities = plan_affinities(requirements, cpu_number)
+    else:
+        cpu_affinities = [cores_bitmap(requirement.cores) for requirement in requirements]
+    return Plan(colors=colors, cpu_affinities=cpu_affinities, shared_colors=shared_critical_colors(requirements, colors))
@@ -0,0 +1,170 @@
+# Imports
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+from typing import Any, Optional
+from board_database import board_information
+from capture_logs import SerialCapture, default_idle_timeout, default_rotate_size, end_marker_str, interrupted_str
+from parse_logs import log_folder, store_folder, store_logs, describe_row
+from build_matrix import matrix_folder, matrix_index_name
+from run_manifest import run_manifest
+
+# Constants
+qemu_platform = 'qemu-aarch64-virt'
+default_qemu = 'qemu-system-aarch64'
+default_jobs = os.cpu_count() or 1
+
+# Firmware (ATF and U-Boot) built by launch-bao.sh for QEMU
+default_flash = os.path.join('wrkdir', 'imgs', qemu_platform, 'flash.bin')
+
+# Same machine as launch-bao.sh, without network and with the serial line on the standard output
+qemu_machine_arguments = ['-M', 'virt,secure=on,virtualization=on,gic-version=3', '-cpu', 'cortex-a53', '-m', '4G', '-display', 'none', '-monitor', 'none', '-serial', 'stdio']
+bao_load_address = '0x50000000'
+
+# Bao is started from the U-Boot prompt
+uboot_prompt = b'=> '
+default_boot_command = f'go {bao_load_address:s}'
+default_boot_timeout = 60
+no_prompt_str = 'no prompt'
+
+# A run is killed after this many seconds
+default_timeout = 1800
+
+
+def qemu_command(qemu: str, flash_path: str, bao_path: str) -> list[str]:
+    return [qemu] + qemu_machine_arguments + ['-smp', str(board_information(qemu_platform)['cpu_number']), '-bios', flash_path,
+                                              '-device', f'loader,file={bao_path:s},addr={bao_load_address:s},force-raw=on']
+
+
+def image_from_argument(argument: str) -> dict[str, Any]:
+    # BAO_IMAGE:CONFIG[:MAIN]
+    parts = argument.split(':')
+    if len(parts) not in (2, 3) or not parts[0] or not parts[1]:
+        raise ValueError(f'{argument:s} is not BAO_IMAGE:CONFIG[:MAIN]')
+    return {'path': parts[0], 'config': parts[1], 'main': parts[2] if len(parts) == 3 else '', 'build': None}
+
+
+def matrix_images(output_folder: str = matrix_folder, config_names: Optional[list[str]] = None) -> list[dict[str, Any]]:
+    # Images of the last build of the matrix (build_matrix.py) for QEMU
+    index_path = os.path.join(output_folder, matrix_index_name)
+    if not os.path.isfile(index_path):
+        raise ValueError(f'No build matrix in {output_folder:s}, build the images with build_matrix.py or give them as BAO_IMAGE:CONFIG[:MAIN]')
+    
+    file = open(index_path, 'r')
+    builds = json.load(file)['builds']
+    file.close()
+    return [{'path': os.path.join(output_folder, build['path']), 'config': build['config'], 'main': build['main'], 'build': build} for build in builds
+            if build['platform'] == qemu_platform and build['path'] is not None and (not config_names or build['config'] in config_names)]
+
+
+# One boot of an image in QEMU, its serial line is captured as the log of a board
+class QemuRun:
+    def __init__(self, image: dict[str, Any], run_number: int, qemu: str = default_qemu, flash_path: str = default_flash, output_folder: str = log_folder, boot_command: str = default_boot_command,
+                 boot_timeout: float = default_boot_timeout, timeout: float = default_timeout, idle_timeout: float = default_idle_timeout, end_markers: Optional[list[str]] = None, compress: bool = True):
+        self.image = image
+        self.name = f'{image["config"]:s}-{image["main"]:s} #{run_number:d}'
+        self.command = qemu_command(qemu, flash_path, image['path'])
+        self.boot_command = boot_command
+        self.boot_timeout = boot_timeout
+        self.timeout = timeout
+        self.capture = SerialCapture(self.name, image['config'], image['main'], output_folder, rotate_size=default_rotate_size, end_markers=end_markers, idle_timeout=idle_timeout, compress=compress,
+                                     manifest=run_manifest(image['config'], qemu_platform, image['build']))
+        self.status = None
+        self.log_paths = []
+    
+    async def boot(self, process: asyncio.subprocess.Process):
+        # Output before the prompt is U-Boot's, not part of the log
+        await asyncio.wait_for(process.stdout.readuntil(uboot_prompt), timeout=self.boot_timeout)
+        process.stdin.write(self.boot_command.encode('utf-8') + b'\r')
+        await process.stdin.drain()
+    
+    async def start(self):
+        # QEMU is in its own session, Ctrl+C is for the runner
+        process = await asyncio.create_subprocess_exec(*self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, start_new_session=True)
+        try:
+            if self.boot_command:
+                await self.boot(process)
+            self.log_paths = await self.capture.capture(process.stdout, self.timeout)
+            self.status = self.capture.stop_reason
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            self.status = no_prompt_str
+        finally:
+            # QEMU never stops by itself, the benchmark is over (or stuck)
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+    
+    async def run(self, semaphore: asyncio.Semaphore):
+        try:
+            async with semaphore:
+                await self.start()
+        except asyncio.CancelledError:
+            self.status = interrupted_str
+    
+    def succeeded(self) -> bool:
+        return self.status == end_marker_str
+
+
+async def run_all(runs: list[QemuRun], jobs: int = default_jobs):
+    # At most one QEMU per core, Ctrl+C stops all runs and keeps their logs
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max(jobs, 1))
+    tasks = [asyncio.ensure_future(run.run(semaphore)) for run in runs]
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, lambda: [task.cancel() for task in tasks if not task.done()])
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signal_number)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f'Run Bao images in QEMU ({qemu_platform:s}) without display and write their logs like a board')
+    parser.add_argument('images', nargs='*', metavar='BAO_IMAGE:CONFIG[:MAIN]', help='images to run with their configuration name and selected main (by default the QEMU builds of build_matrix.py)')
+    parser.add_argument('--config', nargs='+', help='only run the images of the build matrix with these configurations')
+    parser.add_argument('--runs', type=int, default=1, help='number of runs of each image (by default 1)')
+    parser.add_argument('--jobs', type=int, default=default_jobs, help=f'number of QEMU at the same time (by default {default_jobs:d})')
+    parser.add_argument('--qemu', default=default_qemu, help=f'QEMU binary (by default {default_qemu:s})')
+    parser.add_argument('--flash', default=default_flash, help=f'firmware given to QEMU (by default {default_flash:s}, built by launch-bao.sh)')
+    parser.add_argument('--boot-command', default=default_boot_command, help=f'command starting Bao at the U-Boot prompt, empty if Bao starts by itself (by default "{default_boot_command:s}")')
+    parser.add_argument('--timeout', type=float, default=default_timeout, help=f'seconds after which a run is killed (by default {default_timeout:d})')
+    parser.add_argument('--idle-timeout', type=float, default=default_idle_timeout, help=f'seconds without output after which a run is killed (by default {default_idle_timeout:d})')
+    parser.add_argument('--end-marker', action='append', help='regular expression of the line ending a benchmark (can be repeated, replaces the default ones)')
+    parser.add_argument('--output', default=log_folder, help=f'folder where logs are written (by default {log_folder:s})')
+    parser.add_argument('--no-compress', action='store_true', help='do not compress the logs')
+    parser.add_argument('--no-store', action='store_true', help=f'do not store the logs in {store_folder:s} once written')
+    arguments = parser.parse_args()
+    
+    try:
+        images = [image_from_argument(argument) for argument in arguments.images] if arguments.images else matrix_images(config_names=arguments.config)
+        if shutil.which(arguments.qemu) is None:
+            raise ValueError(f'{arguments.qemu:s} not found')
+        for path in [arguments.flash] + [image['path'] for image in images]:
+            if not os.path.isfile(path):
+                raise ValueError(f'{path:s} does not exist')
+    except (OSError, ValueError) as error:
+        print(error)
+        exit(1)
+    
+    runs = [QemuRun(image, run_number, arguments.qemu, arguments.flash, arguments.output, arguments.boot_command, default_boot_timeout, arguments.timeout, arguments.idle_timeout, arguments.end_marker, not arguments.no_compress)
+            for image in images for run_number in range(1, arguments.runs + 1)]
+    asyncio.run(run_all(runs, arguments.jobs))
+    
+    for run in runs:
+        print(f'{run.name:s}: {run.status:s}' + (f' ({", ".join(run.log_paths):s})' if run.log_paths else ''))
+    if not arguments.no_store:
+        for row, _ in store_logs([path for run in runs for path in run.log_paths]):
+            print(describe_row(row))
+    
+    # Usable in CI: fails if a benchmark did not end
+    failed_number = sum(not run.succeeded() for run in runs)
+    print(f'{len(runs) - failed_number:d}/{len(runs):d} runs ended')
+    if failed_number > 0:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
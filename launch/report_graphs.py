@@ -0,0 +1,291 @@
+# Imports
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+import numpy
+from generate_config import load_spec
+from output_file import open_output, write_if_changed
+from parse_logs import store_folder, load_metadata
+from log_statistics import Table, default_variable, statistics_table, select_table
+from analysis_cache import cache_folder
+
+# Constants
+# Not test-logs/graphs, the committed graphs are never overwritten
+graph_folder = os.path.join('..', 'test-logs', 'report')
+report_spec_path = 'report.json'
+report_index_name = '.report_index.json'
+default_jobs = os.cpu_count() or 1
+
+# Increased when figures are drawn differently, all figures are drawn again
+renderer_version = 1
+
+# Plot types
+line_plot_str = 'line'
+bar_plot_str = 'bar'
+heatmap_plot_str = 'heatmap'
+plot_types = [line_plot_str, bar_plot_str, heatmap_plot_str]
+
+# How runs of the same configuration are combined and how series are compared to their baseline
+aggregates = ['mean', 'max', 'min']
+comparisons = ['ratio', 'difference']
+
+# Same size as the figures drawn by hand (12x8 inches at 100 dpi)
+default_figure_size = [12, 8]
+figure_dpi = 100
+
+
+def aggregate_assignments(table: Table, statistic: str, aggregate: str) -> numpy.ndarray:
+    # One value per assignment (e.g. per data size), combining all runs
+    if len(table['assignment']) == 0:
+        return numpy.zeros(0)
+    
+    assignment_number = int(table['assignment'].max()) + 1
+    values = table[statistic].astype(numpy.float64)
+    if aggregate == 'mean':
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.bincount(table['assignment'], weights=values, minlength=assignment_number) / numpy.bincount(table['assignment'], minlength=assignment_number)
+    
+    result = numpy.full(assignment_number, -numpy.inf if aggregate == 'max' else numpy.inf)
+    (numpy.maximum if aggregate == 'max' else numpy.minimum).at(result, table['assignment'], values)
+    result[numpy.isinf(result)] = numpy.nan
+    return result
+
+
+def select_series(table: Table, selection: dict[str, Any]) -> Table:
+    criteria = {column: selection[column] for column in ('config', 'main', 'date', 'run') if column in selection}
+    return select_table(table, **criteria)
+
+
+def series_values(tables: dict[str, Table], series: dict[str, Any]) -> numpy.ndarray:
+    table = tables[series.get('variable', default_variable)]
+    statistic = series.get('statistic', 'max')
+    aggregate = series.get('aggregate', 'mean')
+    values = aggregate_assignments(select_series(table, series), statistic, aggregate)
+    if 'baseline' not in series:
+        return values
+    
+    # Baseline (e.g. the solo configuration, or the mean of the same configuration) of the same assignments
+    baseline = aggregate_assignments(select_series(table, series['baseline']), series['baseline'].get('statistic', statistic), series['baseline'].get('aggregate', aggregate))
+    length = min(len(values), len(baseline))
+    if series.get('compare', 'ratio') == 'ratio':
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return values[:length] / baseline[:length]
+    return values[:length] - baseline[:length]
+
+
+def axis_values(axis: dict[str, Any], length: int) -> list[float]:
+    # Explicit values, or start and step (assignment index by default)
+    if 'values' in axis:
+        return axis['values'][:length]
+    return [axis.get('start', 0) + axis.get('step', 1) * index for index in range(0, length)]
+
+
+def validate_figure(name: str, figure: dict[str, Any]) -> list[str]:
+    errors = []
+    if figure.get('type', line_plot_str) not in plot_types:
+        errors.append(f'{name:s}: unknown type {figure["type"]}, valid types are {", ".join(plot_types):s}')
+    if not figure.get('series'):
+        errors.append(f'{name:s}: no series')
+    for series in figure.get('series', []):
+        if 'config' not in series:
+            errors.append(f'{name:s}: a series has no config')
+        if series.get('aggregate', 'mean') not in aggregates:
+            errors.append(f'{name:s}: unknown aggregate {series["aggregate"]}, valid aggregates are {", ".join(aggregates):s}')
+        if series.get('compare', 'ratio') not in comparisons:
+            errors.append(f'{name:s}: unknown comparison {series["compare"]}, valid comparisons are {", ".join(comparisons):s}')
+    if figure.get('type') == heatmap_plot_str and len(figure.get('shape', [])) != 2:
+        errors.append(f'{name:s}: a heatmap needs a shape [rows, columns]')
+    elif figure.get('type') == heatmap_plot_str and len(figure['series']) > 1 and figure['shape'][1] != len(figure['series']):
+        errors.append(f'{name:s}: a heatmap of several series has one column per series')
+    return errors
+
+
+def missing_series(name: str, figure: dict[str, Any], tables: dict[str, Table]) -> list[str]:
+    # Series (or baselines) without any sample, the figure would be drawn empty
+    errors = []
+    for series in figure['series']:
+        table = tables[series.get('variable', default_variable)]
+        for selection in [series] + ([series['baseline']] if 'baseline' in series else []):
+            if select_series(table, selection)['count'].sum() == 0:
+                criteria = ', '.join(f'{column:s}={selection[column]}' for column in ('config', 'main', 'date', 'run') if column in selection)
+                errors.append(f'{name:s}: no samples for {criteria:s}')
+    return errors
+
+
+def figure_data(figure: dict[str, Any], tables: dict[str, Table]) -> dict[str, Any]:
+    # Everything the figure shows, aggregated here so that workers only draw
+    series = [(series.get('label', series['config']), series_values(tables, series).tolist()) for series in figure['series']]
+    length = max((len(values) for _, values in series), default=0)
+    return {'series': series, 'x': axis_values(figure.get('x', {}), length), 'y': axis_values(figure.get('y', {}), figure.get('shape', [0])[0])}
+
+
+def inputs_hash(figure: dict[str, Any], data: dict[str, Any]) -> str:
+    # NaN is written as NaN by json, the hash does not depend on dictionary order
+    content = json.dumps({'version': renderer_version, 'figure': figure, 'data': data}, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def render_figure(name: str, figure: dict[str, Any], data: dict[str, Any], output_path: str) -> str:
+    # Imported in the workers, the Agg backend never needs a display
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as pyplot
+    
+    plot_type = figure.get('type', line_plot_str)
+    x_axis = figure.get('x', {})
+    y_axis = figure.get('y', {})
+    pyplot_figure, axes = pyplot.subplots(figsize=figure.get('size', default_figure_size), dpi=figure_dpi)
+    if plot_type == line_plot_str:
+        for label, values in data['series']:
+            axes.plot(data['x'][:len(values)], values, label=label)
+        if 'tick_step' in x_axis:
+            axes.set_xticks(data['x'][::x_axis['tick_step']])
+    elif plot_type == bar_plot_str:
+        # Bars of all series side by side for each x value
+        width = 0.8 / len(data['series'])
+        for index, (label, values) in enumerate(data['series']):
+            axes.bar(numpy.arange(len(values)) + index * width, values, width=width, label=label)
+        axes.set_xticks(numpy.arange(len(data['x'])) + width * (len(data['series']) - 1) / 2, [str(value) for value in data['x']])
+    else:
+        # First series reshaped to rows (y values) and columns (x values), or one column per series
+        if not data['series'] or not data['series'][0][1]:
+            raise ValueError(f'{name:s}: no values to draw')
+        rows, columns = figure['shape']
+        values = numpy.full((rows, columns), numpy.nan)
+        if len(data['series']) > 1:
+            for column, (_, series) in enumerate(data['series']):
+                column_values = numpy.array(series[:rows], dtype=numpy.float64)
+                values[:len(column_values), column] = column_values
+        else:
+            first_series = numpy.array(data['series'][0][1][:rows * columns], dtype=numpy.float64)
+            values.reshape(-1)[:len(first_series)] = first_series
+        image = axes.imshow(values, origin='lower', aspect='auto', cmap=figure.get('colormap'))
+        pyplot_figure.colorbar(image, ax=axes)
+        axes.set_xticks(range(0, len(data['x'])), [str(value) for value in data['x']])
+        axes.set_yticks(range(0, len(data['y'])), [str(value) for value in data['y']])
+    
+    axes.set_title(figure.get('title', name))
+    axes.set_xlabel(x_axis.get('label', ''))
+    axes.set_ylabel(y_axis.get('label', ''))
+    if plot_type != heatmap_plot_str and len(data['series']) > 1:
+        axes.legend()
+    
+    # Written next to the graph and renamed, an interrupted report never leaves a broken PNG
+    file = open_output(output_path)
+    try:
+        pyplot_figure.savefig(file, format='png')
+    except BaseException:
+        file.discard()
+        raise
+    finally:
+        pyplot.close(pyplot_figure)
+    file.close()
+    return name
+
+
+def load_report_index(output_folder: str) -> dict[str, str]:
+    index_path = os.path.join(output_folder, report_index_name)
+    if not os.path.isfile(index_path):
+        return {}
+    
+    file = open(index_path, 'r')
+    index = json.load(file)
+    file.close()
+    return index
+
+
+def render_report(report_path: str = report_spec_path, store: str = store_folder, output_folder: str = graph_folder, jobs: int = default_jobs, force: bool = False, names: Optional[list[str]] = None, cache: Optional[str] = cache_folder) -> tuple[list[str], list[str], list[str]]:
+    # Returns the figures drawn, the figures that were up to date and why figures were skipped (or failed)
+    report = load_spec(report_path)
+    figures = report['figures']
+    if names:
+        unknown_names = [name for name in names if name not in figures]
+        if unknown_names:
+            raise ValueError(f'Unknown figures {", ".join(unknown_names):s}')
+        figures = {name: figures[name] for name in names}
+    
+    errors = [error for name, figure in figures.items() for error in validate_figure(name, figure)]
+    if errors:
+        raise ValueError('\n'.join(errors))
+    
+    # Statistics are computed once per variable for all figures (and come from the cache for known logs)
+    rows = list(load_metadata(store).values())
+    variables = {series.get('variable', default_variable) for figure in figures.values() for series in figure['series']}
+    tables = {variable: statistics_table(rows, variable, store, cache=cache) for variable in variables}
+    
+    # Figures whose inputs did not change are not drawn again
+    os.makedirs(output_folder, exist_ok=True)
+    index = load_report_index(output_folder)
+    to_draw = {}
+    up_to_date = []
+    skipped = []
+    for name, figure in figures.items():
+        errors = missing_series(name, figure, tables)
+        if errors:
+            skipped += errors
+            continue
+        
+        data = figure_data(figure, tables)
+        figure_hash = inputs_hash(figure, data)
+        output_path = os.path.join(output_folder, name + '.png')
+        if not force and index.get(name) == figure_hash and os.path.isfile(output_path):
+            up_to_date.append(name)
+        else:
+            to_draw[name] = (figure, data, output_path, figure_hash)
+    
+    # A figure that fails does not stop the others, the figures drawn are indexed and the failures are reported at the end
+    outcomes = {}
+    if jobs > 1 and len(to_draw) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {name: executor.submit(render_figure, name, figure, data, output_path) for name, (figure, data, output_path, _) in to_draw.items()}
+        outcomes = {name: future.exception() for name, future in futures.items()}
+    else:
+        for name, (figure, data, output_path, _) in to_draw.items():
+            try:
+                render_figure(name, figure, data, output_path)
+                outcomes[name] = None
+            except Exception as error:
+                outcomes[name] = error
+    drawn = [name for name, error in outcomes.items() if error is None]
+    skipped += [f'{name:s}: drawing failed ({error})' for name, error in outcomes.items() if error is not None]
+    
+    for name in drawn:
+        index[name] = to_draw[name][3]
+    write_if_changed(os.path.join(output_folder, report_index_name), json.dumps(index, indent=4, sort_keys=True) + '\n')
+    return drawn, up_to_date, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Draw the graphs of a report from the stored benchmark logs')
+    parser.add_argument('figures', nargs='*', help='figures to draw (by default all figures of the report)')
+    parser.add_argument('--report', default=report_spec_path, help=f'report specification (by default {report_spec_path:s})')
+    parser.add_argument('--store', default=store_folder, help=f'folder of the stored logs (by default {store_folder:s})')
+    parser.add_argument('--output', default=graph_folder, help=f'folder where graphs are written (by default {graph_folder:s})')
+    parser.add_argument('--jobs', type=int, default=default_jobs, help=f'number of processes (by default {default_jobs:d})')
+    parser.add_argument('--force', action='store_true', help='draw all figures even if their inputs did not change')
+    arguments = parser.parse_args()
+    
+    start = time.perf_counter()
+    try:
+        drawn, up_to_date, skipped = render_report(arguments.report, arguments.store, arguments.output, arguments.jobs, arguments.force, arguments.figures)
+    except (OSError, ValueError) as error:
+        print(error)
+        exit(1)
+    
+    elapsed = time.perf_counter() - start
+    for name in drawn:
+        print(f'{name:s}.png drawn')
+    for error in skipped:
+        print(error)
+    print(f'{len(drawn):d} figures drawn in {elapsed:.3f}s ({len(up_to_date):d} up to date)')
+    
+    # Figures without data or that failed are not drawn, the report is incomplete
+    if skipped:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+# Imports
+import argparse
+import dataclasses
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Optional
+import numpy
+from generate_config import config_folder
+from config_model import Configuration, max_colors
+from parse_config import parse_configuration, load_configuration
+from parse_logs import log_folder, log_extension, store_folder, load_metadata, load_variable, assignments
+from log_statistics import default_percentiles, percentile_name, statistics_table
+from run_manifest import load_run_manifest
+
+# Constants
+database_path = os.path.join(log_folder, 'results.sqlite')
+
+# Increased when the schema changes, the database is filled again from the store
+database_version = 1
+
+# Statistics of each sample array, columns are named without dots (p99.9 is p99_9)
+statistic_names = ['count', 'min', 'max', 'mean', 'stddev'] + [percentile_name(percentile) for percentile in default_percentiles]
+statistic_columns = {name: name.replace('.', '_') for name in statistic_names}
+
+# The critical VM is the first one (see sweep_config.py)
+critical_vm_index = 0
+
+schema = f"""
+CREATE TABLE runs (
+    id INTEGER PRIMARY KEY,
+    log TEXT NOT NULL UNIQUE,
+    config TEXT NOT NULL,
+    main TEXT NOT NULL,
+    date TEXT NOT NULL,
+    run INTEGER NOT NULL,
+    platform TEXT,
+    source TEXT,
+    source_hash TEXT,
+    cpu_number INTEGER,
+    vm_number INTEGER,
+    build_key TEXT,
+    default_ipi INTEGER,
+    memory_request_wait INTEGER,
+    appdata_seed INTEGER,
+    appdata_size INTEGER,
+    appdata_pattern TEXT,
+    configuration TEXT,
+    manifest TEXT
+);
+CREATE INDEX runs_platform ON runs (platform, config, main);
+CREATE INDEX runs_config ON runs (config, main, date);
+
+CREATE TABLE vms (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    vm_index INTEGER NOT NULL,
+    image_name TEXT NOT NULL,
+    os TEXT,
+    cpu_number INTEGER,
+    colors INTEGER,
+    color_count INTEGER NOT NULL,
+    cpu_affinity INTEGER,
+    region_number INTEGER NOT NULL,
+    region_size INTEGER NOT NULL,
+    PRIMARY KEY (run_id, vm_index)
+) WITHOUT ROWID;
+CREATE INDEX vms_colors ON vms (vm_index, color_count, run_id);
+
+CREATE TABLE arrays (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    variable TEXT NOT NULL,
+    assignment INTEGER NOT NULL,
+    {', '.join(f'{column:s} REAL' for column in statistic_columns.values())},
+    PRIMARY KEY (run_id, variable, assignment)
+) WITHOUT ROWID;
+CREATE INDEX arrays_variable ON arrays (variable, run_id);
+
+CREATE TABLE samples (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    variable TEXT NOT NULL,
+    assignment INTEGER NOT NULL,
+    dtype TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (run_id, variable, assignment)
+);
+"""
+
+
+def open_database(path: str = database_path) -> sqlite3.Connection:
+    # Everything in the database comes from the store, an older database is filled again
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.execute('PRAGMA journal_mode = WAL')
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    if version != database_version:
+        for table in ['samples', 'arrays', 'vms', 'runs']:
+            connection.execute(f'DROP TABLE IF EXISTS {table:s}')
+        connection.executescript(schema)
+        connection.execute(f'PRAGMA user_version = {database_version:d}')
+        connection.commit()
+    return connection
+
+
+def run_configuration(row: dict[str, Any], manifest: Optional[dict[str, Any]], platform: Optional[str], input_folder: str = config_folder) -> Optional[Configuration]:
+    # The configuration file of the manifest is the one that was used, else the current file
+    try:
+        if manifest is not None and manifest.get('config_file') is not None:
+            return parse_configuration(manifest['config_file'], row['config'], platform)
+        if platform is not None and os.path.isfile(os.path.join(input_folder, row['config'], f'{platform:s}.c')):
+            return load_configuration(os.path.join(input_folder, row['config'], f'{platform:s}.c'))
+    except ValueError:
+        return None
+    return None
+
+
+def run_platform(row: dict[str, Any], manifest: Optional[dict[str, Any]], default_platform: Optional[str], input_folder: str = config_folder) -> Optional[str]:
+    # Logs without manifest: the given platform, or the only platform of the configuration
+    if manifest is not None and manifest.get('platform') is not None:
+        return manifest['platform']
+    if default_platform is not None:
+        return default_platform
+    config_path = os.path.join(input_folder, row['config'])
+    platforms = [os.path.splitext(file_name)[0] for file_name in os.listdir(config_path) if file_name.endswith('.c')] if os.path.isdir(config_path) else []
+    return platforms[0] if len(platforms) == 1 else None
+
+
+def appdata_columns(manifest: Optional[dict[str, Any]], configuration: Optional[Configuration]) -> tuple[Optional[int], Optional[int], Optional[str]]:
+    # Data of the first guest of the run with known parameters
+    if manifest is None:
+        return None, None, None
+    guests = [vm.configuration for vm in configuration.vms] if configuration is not None else []
+    for guest in guests + sorted(manifest.get('appdata', {})):
+        parameters = manifest.get('appdata', {}).get(guest)
+        if parameters is not None:
+            return parameters.get('seed'), parameters.get('size'), parameters.get('pattern', {}).get('name')
+    return None, None, None
+
+
+def insert_run(connection: sqlite3.Connection, row: dict[str, Any], tables: dict[str, dict[str, numpy.ndarray]], store: str, logs: str, default_platform: Optional[str], with_samples: bool):
+    # The store only keeps the name of the source, the manifest is next to the log in the log folder
+    manifest = load_run_manifest(os.path.join(logs, row['log'] + log_extension))
+    platform = run_platform(row, manifest, default_platform)
+    configuration = run_configuration(row, manifest, platform)
+    build = (manifest or {}).get('build') or {}
+    appdata_seed, appdata_size, appdata_pattern = appdata_columns(manifest, configuration)
+    
+    connection.execute('DELETE FROM runs WHERE log = ?', (row['log'],))
+    cursor = connection.execute('INSERT INTO runs (log, config, main, date, run, platform, source, source_hash, cpu_number, vm_number, build_key, default_ipi, memory_request_wait, '
+                                'appdata_seed, appdata_size, appdata_pattern, configuration, manifest) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+        row['log'], row['config'], row['main'], row['date'], row['run'], platform, row.get('source'), row.get('source_hash'),
+        configuration.cpu_number if configuration is not None else None,
+        len(configuration.vms) if configuration is not None else None,
+        build.get('key'), build.get('default_ipi'), build.get('memory_request_wait'),
+        appdata_seed, appdata_size, appdata_pattern,
+        json.dumps(dataclasses.asdict(configuration)) if configuration is not None else None,
+        json.dumps(manifest) if manifest is not None else None
+    ))
+    run_id = cursor.lastrowid
+    
+    # A VM without colors uses all of them
+    if configuration is not None:
+        connection.executemany('INSERT INTO vms VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [(
+            run_id, vm_index, vm.image_name, vm.configuration, vm.cpu_number, vm.colors,
+            bin(vm.colors).count('1') if vm.colors is not None else max_colors,
+            vm.cpu_affinity, len(vm.regions), sum(region.size for region in vm.regions)
+        ) for vm_index, vm in enumerate(configuration.vms)])
+    
+    # Statistics of each printed array, and the samples themselves
+    for variable, table in tables.items():
+        mask = table['log'] == row['log']
+        columns = [table['assignment'][mask].tolist()] + [table[name][mask].tolist() for name in statistic_names]
+        connection.executemany(f'INSERT INTO arrays VALUES (?, ?, ?, {", ".join("?" * len(statistic_names)):s})', [(run_id, variable, *values) for values in zip(*columns)])
+        if with_samples:
+            values, lengths = load_variable(row, variable, store)
+            connection.executemany('INSERT INTO samples VALUES (?, ?, ?, ?, ?)', [(run_id, variable, assignment, samples.dtype.str, samples.tobytes())
+                                                                                 for assignment, samples in enumerate(assignments(values, lengths))])
+
+
+def update_database(connection: sqlite3.Connection, store: str = store_folder, logs: str = log_folder, default_platform: Optional[str] = None, with_samples: bool = True) -> int:
+    # Logs of the store that are new or changed are added, returns the number of runs added
+    known_hashes = dict(connection.execute('SELECT log, source_hash FROM runs'))
+    rows = [row for row in load_metadata(store).values() if known_hashes.get(row['log'], '') != row.get('source_hash')]
+    if not rows:
+        return 0
+    
+    # Statistics of all new logs at once, for every printed array (from the analysis cache for known logs)
+    variables = sorted({variable for row in rows for variable, information in row['variables'].items() if information['kind'] != 'scalar'})
+    tables = {variable: statistics_table(rows, variable, store) for variable in variables}
+    with connection:
+        for row in rows:
+            insert_run(connection, row, {variable: table for variable, table in tables.items() if variable in row['variables']}, store, logs, default_platform, with_samples)
+    return len(rows)
+
+
+def query_runs(connection: sqlite3.Connection, variable: str, statistic: str = 'p99', platform: Optional[str] = None, config: Optional[str] = None, main: Optional[str] = None,
+               min_critical_colors: Optional[int] = None) -> list[tuple]:
+    # One result per sample array: run, assignment and statistic (e.g. the p99 WCET of runs on rpi4 with at least 8 colors for the critical VM)
+    if statistic not in statistic_columns:
+        raise ValueError(f'Unknown statistic {statistic:s}, valid statistics are {", ".join(statistic_names):s}')
+    
+    conditions = ['arrays.variable = ?']
+    parameters = [variable]
+    for column, value in [('runs.platform', platform), ('runs.config', config), ('runs.main', main)]:
+        if value is not None:
+            conditions.append(f'{column:s} = ?')
+            parameters.append(value)
+    joins = ''
+    if min_critical_colors is not None:
+        joins = 'JOIN vms ON vms.run_id = runs.id AND vms.vm_index = ? '
+        parameters.insert(0, critical_vm_index)
+        conditions.append('vms.color_count >= ?')
+        parameters.append(min_critical_colors)
+    
+    return connection.execute(f'SELECT runs.log, runs.platform, arrays.assignment, arrays.{statistic_columns[statistic]:s} FROM runs {joins:s}JOIN arrays ON arrays.run_id = runs.id '
+                              f'WHERE {" AND ".join(conditions):s} ORDER BY runs.config, runs.main, runs.date, runs.run, arrays.assignment', parameters).fetchall()
+
+
+def run_samples(connection: sqlite3.Connection, log: str, variable: str) -> list[numpy.ndarray]:
+    return [numpy.frombuffer(data, dtype=numpy.dtype(dtype)) for dtype, data in connection.execute(
+        'SELECT samples.dtype, samples.data FROM samples JOIN runs ON runs.id = samples.run_id WHERE runs.log = ? AND samples.variable = ? ORDER BY samples.assignment', (log, variable))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Database of all runs: configuration, build, data and statistics of every stored log')
+    parser.add_argument('--database', default=database_path, help=f'SQLite database (by default {database_path:s})')
+    parser.add_argument('--store', default=store_folder, help=f'folder of the stored logs (by default {store_folder:s})')
+    parser.add_argument('--logs', default=log_folder, help=f'folder of the logs and their manifests (by default {log_folder:s})')
+    parser.add_argument('--update', action='store_true', help='add the new and changed logs of the store')
+    parser.add_argument('--default-platform', help='platform of the logs without manifest whose configuration has several platforms')
+    parser.add_argument('--no-samples', action='store_true', help='only keep the statistics of the arrays, not their samples')
+    parser.add_argument('--variable', default='elapsed_time_array', help='sample arrays to query (by default elapsed_time_array)')
+    parser.add_argument('--statistic', default='p99', help=f'statistic to query, one of {", ".join(statistic_names):s} (by default p99)')
+    parser.add_argument('--platform', help='only query runs on this platform')
+    parser.add_argument('--config', help='only query runs of this configuration')
+    parser.add_argument('--main', help='only query runs of this selected main')
+    parser.add_argument('--min-critical-colors', type=int, help='only query runs where the critical VM has at least this many colors')
+    parser.add_argument('--sql', help='run this SQL query instead')
+    arguments = parser.parse_args()
+    
+    try:
+        connection = open_database(arguments.database)
+        if arguments.update:
+            start = time.perf_counter()
+            added = update_database(connection, arguments.store, arguments.logs, arguments.default_platform, not arguments.no_samples)
+            print(f'{added:d} runs added in {time.perf_counter() - start:.3f}s')
+        
+        start = time.perf_counter()
+        if arguments.sql is not None:
+            results = connection.execute(arguments.sql).fetchall()
+        else:
+            results = query_runs(connection, arguments.variable, arguments.statistic, arguments.platform, arguments.config, arguments.main, arguments.min_critical_colors)
+        elapsed = time.perf_counter() - start
+        connection.close()
+    except (OSError, ValueError, sqlite3.Error) as error:
+        print(error)
+        exit(1)
+    
+    for result in results:
+        print(' '.join(str(value) for value in result))
+    print(f'{len(results):d} results in {elapsed * 1000:.3f}ms')
+
+if __name__ == '__main__':
+    main()
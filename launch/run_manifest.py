@@ -0,0 +1,75 @@
+# Imports
+import json
+import os
+import socket
+import time
+from typing import Any, Optional
+from generate_config import config_folder
+from generate_random_data import freertos_path, baremetal_path, manifest_extension as appdata_manifest_extension
+from parse_logs import compressed_log_extensions, log_extension
+from output_file import write_if_changed
+
+# Constants
+manifest_extension = '.manifest.json'
+
+# Increased when the manifest changes
+run_manifest_version = 1
+
+# Parameters of the data of each guest, written by generate_random_data.py next to appdata.h
+appdata_paths = {'freertos': freertos_path, 'baremetal': baremetal_path}
+
+
+def manifest_path(log_path: str) -> str:
+    # Next to the log, the same for the log and its compressed version: [log name].log.manifest.json
+    for extension in compressed_log_extensions:
+        if log_path.endswith(extension):
+            log_path = log_path[:-len(extension)] + log_extension
+    return log_path + manifest_extension
+
+
+def appdata_parameters() -> dict[str, Optional[dict[str, Any]]]:
+    parameters = {}
+    for guest, path in appdata_paths.items():
+        try:
+            file = open(os.path.splitext(path)[0] + appdata_manifest_extension, 'r')
+            parameters[guest] = json.load(file)['parameters']
+            file.close()
+        except (OSError, ValueError, KeyError):
+            parameters[guest] = None
+    return parameters
+
+
+def run_manifest(config_name: str, platform: Optional[str] = None, build: Optional[dict[str, Any]] = None, input_folder: str = config_folder) -> dict[str, Any]:
+    # What a run was made with: the configuration file as it was, the build options and the data of the guests
+    config_text = None
+    if platform is not None:
+        config_file_path = os.path.join(input_folder, config_name, f'{platform:s}.c')
+        if os.path.isfile(config_file_path):
+            file = open(config_file_path, 'r')
+            config_text = file.read()
+            file.close()
+    
+    return {
+        'version': run_manifest_version,
+        'time': time.time(),
+        'host': socket.gethostname(),
+        'config': config_name,
+        'platform': platform,
+        'config_file': config_text,
+        'build': build,
+        'appdata': appdata_parameters()
+    }
+
+
+def write_run_manifest(log_path: str, manifest: dict[str, Any]):
+    write_if_changed(manifest_path(log_path), json.dumps(manifest, indent=4) + '\n')
+
+
+def load_run_manifest(log_path: str) -> Optional[dict[str, Any]]:
+    try:
+        file = open(manifest_path(log_path), 'r')
+        manifest = json.load(file)
+        file.close()
+    except (OSError, ValueError):
+        return None
+    return manifest
@@ -0,0 +1,209 @@
+# Imports
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+from generate_config import load_spec, configuration_from_spec, write_configuration, config_folder, max_colors
+from config_model import Configuration
+from validate_config import check_configuration
+from plan_config import split_colors, legacy_layout_str
+from output_file import write_if_changed
+from board_database import board_information
+
+# Constants
+index_file_name = 'index.json'
+
+# CPU affinities: none, only the critical VM on core 0 or each VM on its own core
+no_affinity_str = 'none'
+critical_affinity_str = 'critical'
+all_affinity_str = 'all'
+
+# Axes of the sweep and their default values
+default_axes = {
+    'platform': ['rpi4'],
+    'interference_number': [1],
+    'color_layout': [legacy_layout_str],
+    'critical_colors': [None],
+    'cpu_affinity': [no_affinity_str],
+    'critical_region_size': ['0x8000000'],
+    'interference_region_size': ['0x4000000']
+}
+
+# Axes in the configuration name when swept, interference number and layout always are (the platform is the file name)
+axis_tokens = {
+    'critical_colors': 'c',
+    'cpu_affinity': 'affinity_',
+    'critical_region_size': 'cr',
+    'interference_region_size': 'ir'
+}
+
+default_jobs = os.cpu_count() or 1
+combinations_per_task = 64
+
+
+def color_numbers(vm_number: int, critical_colors: Optional[int]) -> list[int]:
+    # Without critical colors, all VMs have the same number of colors
+    if critical_colors is None:
+        return [max_colors // vm_number] * vm_number
+    
+    interference_colors = (max_colors - critical_colors) // (vm_number - 1) if vm_number > 1 else 0
+    return [critical_colors] + [interference_colors] * (vm_number - 1)
+
+
+def cpu_affinities(vm_number: int, affinity: str) -> list[Optional[int]]:
+    if affinity == critical_affinity_str:
+        return [0b1] + [None] * (vm_number - 1)
+    elif affinity == all_affinity_str:
+        return [1 << vm_index for vm_index in range(0, vm_number)]
+    return [None] * vm_number
+
+
+def combination_name(prefix: str, combination: dict[str, Any], swept_axes: list[str]) -> str:
+    tokens = [prefix, f'interference{combination["interference_number"]:d}', combination['color_layout']]
+    for axis, token in axis_tokens.items():
+        if axis in swept_axes and combination[axis] is not None:
+            value = combination[axis]
+            tokens.append(f'{token:s}{value:d}' if isinstance(value, int) else f'{token:s}{value:s}')
+    return '_'.join(tokens)
+
+
+def combination_spec(sweep: dict[str, Any], combination: dict[str, Any], name: str) -> dict[str, Any]:
+    vm_number = combination['interference_number'] + 1
+    colors = split_colors(color_numbers(vm_number, combination['critical_colors']), combination['color_layout'])
+    affinities = cpu_affinities(vm_number, combination['cpu_affinity'])
+    
+    # The critical VM comes first, then all interference VMs
+    vm_specs = []
+    for vm_index in range(0, vm_number):
+        if vm_index == 0:
+            vm_spec = dict(sweep['critical'])
+            vm_spec['regions'] = [{'size': combination['critical_region_size']}]
+        else:
+            vm_spec = dict(sweep['interference'])
+            vm_spec['regions'] = [{'size': combination['interference_region_size']}]
+        
+        if colors[vm_index] is not None:
+            vm_spec['colors'] = colors[vm_index]
+        if affinities[vm_index] is not None:
+            vm_spec['cpu_affinity'] = affinities[vm_index]
+        vm_specs.append(vm_spec)
+    
+    return {
+        'name': name,
+        'platform': combination['platform'],
+        'cpu_number': sweep.get('cpu_number', board_information(combination['platform'])['cpu_number']),
+        'vms': vm_specs
+    }
+
+
+def sweep_combinations(sweep: dict[str, Any]) -> list[dict[str, Any]]:
+    axes = dict(default_axes)
+    axes.update(sweep.get('axes', {}))
+    swept_axes = [axis for axis, values in axes.items() if len(values) > 1]
+    
+    combinations = []
+    names = set()
+    for values in itertools.product(*axes.values()):
+        combination = dict(zip(axes.keys(), values))
+        
+        # Critical colors are meaningless without colors, interference sizes without interference and VMs cannot share cores
+        if combination['color_layout'] == legacy_layout_str:
+            combination['critical_colors'] = None
+        if combination['interference_number'] == 0:
+            combination['interference_region_size'] = None
+        cpu_number = sweep.get('cpu_number', board_information(combination['platform'])['cpu_number'])
+        if combination['cpu_affinity'] == all_affinity_str and combination['interference_number'] + 1 > cpu_number:
+            continue
+        # Every VM needs at least one color (e.g. 15 critical colors leave nothing for 2 interference VMs)
+        if combination['color_layout'] != legacy_layout_str and min(color_numbers(combination['interference_number'] + 1, combination['critical_colors'])) < 1:
+            continue
+        
+        # Combinations where an unused axis changes are the same configuration
+        name = combination_name(sweep.get('prefix', 'sweep'), combination, swept_axes)
+        if (name, combination['platform']) in names:
+            continue
+        names.add((name, combination['platform']))
+        
+        combination['name'] = name
+        combinations.append(combination)
+    
+    return combinations
+
+
+def build_combinations(sweep: dict[str, Any], combinations: list[dict[str, Any]]) -> list[Configuration]:
+    # Configurations are all built and validated before anything is written
+    configurations = []
+    for combination in combinations:
+        configuration = configuration_from_spec(combination_spec(sweep, combination, combination['name']))
+        check_configuration(configuration)
+        configurations.append(configuration)
+    return configurations
+
+
+def generate_combinations(combinations: list[dict[str, Any]], configurations: list[Configuration], output_folder: str) -> list[dict[str, Any]]:
+    index_entries = []
+    for combination, configuration in zip(combinations, configurations):
+        config_file_path, _ = write_configuration(configuration, output_folder, check=False)
+        
+        # Describe what has been written
+        index_entries.append({
+            'name': configuration.name,
+            'platform': configuration.platform,
+            'path': os.path.relpath(config_file_path, output_folder),
+            'axes': {axis: combination[axis] for axis in default_axes},
+            'vms': [{
+                'image_name': vm.image_name,
+                'colors': vm.colors,
+                'cpu_affinity': vm.cpu_affinity,
+                'regions': [[region.base, region.size] for region in vm.regions]
+            } for vm in configuration.vms]
+        })
+    
+    return index_entries
+
+
+def run_sweep(sweep_path: str, output_folder: str = config_folder, jobs: int = default_jobs) -> list[dict[str, Any]]:
+    sweep = load_spec(sweep_path)
+    combinations = sweep_combinations(sweep)
+    
+    # Combinations are given by groups to the workers, rendering one is too fast to be worth a task
+    tasks = [combinations[task_begin:task_begin + combinations_per_task] for task_begin in range(0, len(combinations), combinations_per_task)]
+    index_entries = []
+    if jobs <= 1 or len(tasks) <= 1:
+        task_configurations = [build_combinations(sweep, task) for task in tasks]
+        for task, configurations in zip(tasks, task_configurations):
+            index_entries += generate_combinations(task, configurations, output_folder)
+    else:
+        # A combination that is not valid stops the sweep before the first file is written
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            task_configurations = list(executor.map(build_combinations, itertools.repeat(sweep), tasks))
+            for task_entries in executor.map(generate_combinations, tasks, task_configurations, itertools.repeat(output_folder)):
+                index_entries += task_entries
+    
+    # Index of the sweep next to the configurations
+    write_if_changed(os.path.join(output_folder, index_file_name), json.dumps({'sweep': os.path.abspath(sweep_path), 'configurations': index_entries}, indent=4))
+    return index_entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the configurations of all combinations of a sweep')
+    parser.add_argument('sweep', help='sweep specification file (JSON, TOML or YAML)')
+    parser.add_argument('--output', default=config_folder, help=f'folder where configurations and the index are written (by default {config_folder:s})')
+    parser.add_argument('--jobs', type=int, default=default_jobs, help=f'number of processes (by default {default_jobs:d})')
+    arguments = parser.parse_args()
+    
+    start = time.perf_counter()
+    try:
+        index_entries = run_sweep(arguments.sweep, arguments.output, arguments.jobs)
+    except (OSError, ValueError) as error:
+        print(error)
+        exit(1)
+    
+    elapsed = time.perf_counter() - start
+    print(f'{len(index_entries):d} configuration files generated in {elapsed:.3f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# Imports
+import asyncio
+import gzip
+import os
+import pty
+import pytest
+from capture_logs import SerialCapture, capture_boards, end_marker_str, idle_str, timestamp_extension
+from parse_logs import load_metadata, load_variable, store_logs
+
+# Constants
+config_name = 'bench_test'
+selected_main = 'execution'
+write_delay = 0.05
+
+
+@pytest.fixture
+def serial_line():
+    # The capture opens the slave end like a serial device, the board writes on the master end
+    master, slave = pty.openpty()
+    yield master, os.ttyname(slave)
+    os.close(master)
+    os.close(slave)
+
+
+async def wait_open(capture: SerialCapture):
+    while not capture.log_paths:
+        await asyncio.sleep(0.01)
+
+
+async def drive(capture: SerialCapture, master: int, pieces: list[bytes], duration: float = 10) -> list[str]:
+    # Pieces are written one by one so that each of them is received on its own
+    task = asyncio.ensure_future(capture_boards([capture], duration))
+    await asyncio.wait_for(wait_open(capture), timeout=duration)
+    for piece in pieces:
+        os.write(master, piece)
+        await asyncio.sleep(write_delay)
+    return (await task)[0]
+
+
+def read_log(path: str) -> bytes:
+    file = gzip.open(path, 'rb')
+    content = file.read()
+    file.close()
+    return content
+
+
+def test_end_marker(serial_line, tmp_path):
+    master, device = serial_line
+    capture = SerialCapture(device, config_name, selected_main, str(tmp_path))
+    pieces = [b'# Start\n', b'values = [1, 2, 3]\n', b'# End of benchmark\n', b'ignored = 1\n']
+    log_paths = asyncio.run(drive(capture, master, pieces))
+    
+    assert capture.stop_reason == end_marker_str
+    assert len(log_paths) == 1 and log_paths[0].endswith('-1.log.gz')
+    assert read_log(log_paths[0]) == b''.join(pieces[:3])
+    assert not os.path.exists(log_paths[0].removesuffix('.gz'))
+    assert len(read_log(log_paths[0].removesuffix('.gz') + timestamp_extension + '.gz').splitlines()) == 3
+
+
+def test_idle_timeout(serial_line, tmp_path):
+    master, device = serial_line
+    capture = SerialCapture(device, config_name, selected_main, str(tmp_path), idle_timeout=0.3, compress=False)
+    log_paths = asyncio.run(drive(capture, master, [b'value = 5\n']))
+    
+    assert capture.stop_reason == idle_str
+    assert len(log_paths) == 1 and log_paths[0].endswith('-1.log')
+    file = open(log_paths[0], 'rb')
+    assert file.read() == b'value = 5\n'
+    file.close()
+
+
+def test_rotation(serial_line, tmp_path):
+    master, device = serial_line
+    capture = SerialCapture(device, config_name, selected_main, str(tmp_path), rotate_size=16)
+    
+    # The array is printed in two pieces and is never split between two parts
+    pieces = [b'# First part of the log\n', b'values = [1, 2, 3,', b' 4, 5]\n', b'# Second part of the log\n', b'values = [6, 7]\n', b'total = 7\n', b'# End of benchmark\n']
+    log_paths = asyncio.run(drive(capture, master, pieces))
+    
+    assert capture.stop_reason == end_marker_str
+    assert [os.path.basename(path).split('-')[-1] for path in log_paths] == ['1.log.gz', '1.part2.log.gz', '1.part3.log.gz', '1.part4.log.gz', '1.part5.log.gz']
+    assert [read_log(path) for path in log_paths] == [pieces[0], b''.join(pieces[1:3]), pieces[3], pieces[4], b''.join(pieces[5:])]
+    assert all(os.path.isfile(path.removesuffix('.gz') + timestamp_extension + '.gz') for path in log_paths)
+    assert not any(path.endswith('.log') for path in os.listdir(tmp_path))
+    
+    # All parts are stored as one run
+    store = os.path.join(tmp_path, 'store')
+    results = store_logs(log_paths, store)
+    rows = load_metadata(store)
+    assert len(results) == 1 and list(rows) == [os.path.basename(log_paths[0]).removesuffix('.log.gz')]
+    row = next(iter(rows.values()))
+    assert row['run'] == 1 and row['parts'] == 5 and row['comments'] == 3
+    values, lengths = load_variable(row, 'values', store)
+    assert values.tolist() == [1, 2, 3, 4, 5, 6, 7] and lengths.tolist() == [5, 2]
+    
+    # The next capture is the next run
+    capture = SerialCapture(device, config_name, selected_main, str(tmp_path))
+    log_paths = asyncio.run(drive(capture, master, [b'# End of benchmark\n']))
+    assert log_paths[0].endswith('-2.log.gz')
@@ -0,0 +1,118 @@
+# Imports
+from typing import Any
+from config_model import Configuration, max_colors
+from layout_config import physical_footprint, platform_memory_size
+
+
+def find_overlaps(intervals: list[tuple[int, int, Any]]) -> list[tuple[Any, Any]]:
+    # Sorted by base, an interval overlaps a previous one iff it begins before the furthest end seen so far
+    overlaps = []
+    furthest_end = None
+    furthest_label = None
+    for begin, end, label in sorted((interval for interval in intervals if interval[1] > interval[0]), key=lambda interval: (interval[0], interval[1])):
+        if furthest_end is not None and begin < furthest_end:
+            overlaps.append((furthest_label, label))
+        
+        if furthest_end is None or end > furthest_end:
+            furthest_end = end
+            furthest_label = label
+    
+    return overlaps
+
+
+def validate_configuration(configuration: Configuration) -> tuple[list[str], list[str]]:
+    errors = []
+    warnings = []
+    
+    # CPUs of all VMs must be on the platform
+    used_cpu = sum(vm.cpu_number for vm in configuration.vms)
+    if used_cpu > configuration.cpu_number:
+        errors.append(f'VMs use {used_cpu:d} CPUs but the platform only has {configuration.cpu_number:d}')
+    
+    # Colored regions take more physical memory than their size
+    footprint = physical_footprint(configuration)
+    memory_size = platform_memory_size(configuration.platform)
+    if memory_size is not None and footprint > memory_size:
+        errors.append(f'VMs and shared memories need 0x{footprint:x} bytes of physical memory but the platform only has 0x{memory_size:x}')
+    
+    for shmem_index, shmem_size in enumerate(configuration.shmem_sizes):
+        if shmem_size == 0:
+            errors.append(f'Shared memory n°{shmem_index:d} has a size of 0')
+    
+    used_shmems = set()
+    used_affinity = 0
+    used_colors = 0
+    physical_devices = []
+    for vm in configuration.vms:
+        name = vm.image_name
+        
+        # Regions, devices and IPC windows share the address space of the VM
+        # Regions are only checked within a VM: their bases are intermediate physical addresses, Bao allocates their physical
+        # memory (colored or not) itself and nothing places them physically, so VMs can use the same bases (only devices have fixed ones)
+        intervals = []
+        for region_index, region in enumerate(vm.regions):
+            intervals.append((region.base, region.base + region.size, f'region n°{region_index:d}'))
+            if region.size == 0:
+                errors.append(f'{name:s}: region n°{region_index:d} has a size of 0')
+        for device_index, device in enumerate(vm.devices):
+            intervals.append((device.va, device.va + device.size, f'device n°{device_index:d}'))
+        for ipc_index, ipc in enumerate(vm.ipcs):
+            intervals.append((ipc.base, ipc.base + ipc.size, f'IPC n°{ipc_index:d}'))
+        
+        for first, second in find_overlaps(intervals):
+            errors.append(f'{name:s}: {first:s} overlaps {second:s}')
+        
+        # Devices of a VM cannot share physical addresses
+        device_intervals = [(device.pa, device.pa + device.size, f'device n°{device_index:d}') for device_index, device in enumerate(vm.devices)]
+        for first, second in find_overlaps(device_intervals):
+            errors.append(f'{name:s}: physical addresses of {first:s} and {second:s} overlap')
+        physical_devices += [(device.pa, device.pa + device.size, (name, device_index, device.pa, device.size)) for device_index, device in enumerate(vm.devices)]
+        
+        # IPCs must use an existing shared memory and fit in it
+        for ipc_index, ipc in enumerate(vm.ipcs):
+            if not 0 <= ipc.shmem_id < len(configuration.shmem_sizes):
+                errors.append(f'{name:s}: IPC n°{ipc_index:d} uses shared memory n°{ipc.shmem_id:d} but there are {len(configuration.shmem_sizes):d} shared memories')
+            elif ipc.size > configuration.shmem_sizes[ipc.shmem_id]:
+                errors.append(f'{name:s}: IPC n°{ipc_index:d} is bigger than shared memory n°{ipc.shmem_id:d}')
+            used_shmems.add(ipc.shmem_id)
+        
+        # Cores must exist and cannot be shared between VMs
+        if vm.cpu_affinity is not None:
+            if vm.cpu_affinity >= 2**configuration.cpu_number:
+                errors.append(f'{name:s}: CPU affinity 0b{vm.cpu_affinity:b} uses a core that is not on the platform')
+            if vm.cpu_affinity & used_affinity:
+                errors.append(f'{name:s}: CPU affinity 0b{vm.cpu_affinity:b} uses cores of another VM')
+            if bin(vm.cpu_affinity).count('1') < vm.cpu_number:
+                warnings.append(f'{name:s}: CPU affinity has less cores than the {vm.cpu_number:d} CPUs of the VM')
+            used_affinity |= vm.cpu_affinity
+        
+        # Colors must exist, sharing them is allowed but makes VMs interfere
+        if vm.colors is not None:
+            if vm.colors == 0:
+                errors.append(f'{name:s}: no color is used')
+            elif vm.colors >= 2**max_colors:
+                errors.append(f'{name:s}: colors 0b{vm.colors:b} are not all on the platform ({max_colors:d} colors)')
+            if vm.colors & used_colors:
+                warnings.append(f'{name:s}: colors 0b{vm.colors & used_colors:0{max_colors:d}b} are shared with another VM')
+            used_colors |= vm.colors
+    
+    # The same device can be given to many VMs (e.g. the UART), but different devices cannot collide
+    for (first_name, first_index, *first_range), (second_name, second_index, *second_range) in find_overlaps(physical_devices):
+        if first_name != second_name and first_range != second_range:
+            errors.append(f'{first_name:s} device n°{first_index:d} and {second_name:s} device n°{second_index:d} have overlapping physical addresses')
+    
+    for shmem_index in range(0, len(configuration.shmem_sizes)):
+        if shmem_index not in used_shmems:
+            warnings.append(f'Shared memory n°{shmem_index:d} is not used by any IPC')
+    
+    return errors, warnings
+
+
+def check_configuration(configuration: Configuration):
+    errors, warnings = validate_configuration(configuration)
+    
+    for warning in warnings:
+        print(f'Warning in {configuration.name:s} ({configuration.platform:s}): {warning:s}')
+    
+    if errors:
+        raise ValueError('\n'.join(f'Error in {configuration.name:s} ({configuration.platform:s}): {error:s}' for error in errors))